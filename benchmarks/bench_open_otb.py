@@ -0,0 +1,92 @@
+"""
+Benchmarks loading an .otb+ file: the previous extract-to-disk path against open_otb
+(memory-mapped, float64 and float32). Every variant runs in a fresh process so the
+reported peak RSS is its own.
+
+Usage:
+    python benchmarks/bench_open_otb.py --seconds 300 --channels 128
+    python benchmarks/bench_open_otb.py --file recording.otb+
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tarfile
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from core.utils.config_and_input.write_otb import write_otb
+
+
+class Recording:
+    ref_exist = 1
+
+
+def load_legacy(filename):
+    """The reading steps of the previous open_otb: extract everything, read as int, cast, scale per channel."""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with tarfile.open(filename, "r") as emg_tar:
+            emg_tar.extractall(temp_dir)
+        nchans = int(open(os.path.join(temp_dir, "trial.xml")).read().split('DeviceTotalChannels="')[1].split('"')[0])
+        emg_data = np.fromfile(open(os.path.join(temp_dir, "trial.sig")), dtype="int16")
+        emg_data = np.transpose(emg_data.reshape(int(len(emg_data) / nchans), nchans))
+        emg_data = emg_data.astype(float)
+        for i in range(nchans):
+            emg_data[i, :] = (np.dot(emg_data[i, :], 5000)) / (2 ** float(16))
+        target = np.fromfile(open(os.path.join(temp_dir, "trial3.sip")), dtype="float64")
+    return emg_data, target
+
+
+def load_current(filename, dtype):
+    from core.utils.config_and_input.open_otb import open_otb
+
+    recording = Recording()
+    open_otb(recording, filename, dtype)
+    return recording.signal_dict["data"], recording.signal_dict["target"]
+
+
+def run_variant(variant, filename, results):
+    sys.stdout = open(os.devnull, "w")  # open_otb reports every step
+    start = time.perf_counter()
+    if variant == "legacy":
+        data, _ = load_legacy(filename)
+    else:
+        data, _ = load_current(filename, np.float32 if variant == "float32" else np.float64)
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put((variant, elapsed, peak_mb, data.nbytes / 2**20))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="existing .otb+ file (default: a synthetic recording)")
+    parser.add_argument("--seconds", type=float, default=120)
+    parser.add_argument("--channels", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filename = args.file
+        if filename is None:
+            filename = os.path.join(temp_dir, "synthetic.otb+")
+            write_otb(filename, nchans=args.channels, seconds=args.seconds)
+        print(f"{filename}: {os.path.getsize(filename) / 2**20:.1f} MB")
+
+        context = mp.get_context("spawn")
+        results = context.Queue()
+        print(f"{'variant':<10}{'load time (s)':>15}{'peak RSS (MB)':>15}{'data (MB)':>12}")
+        for variant in ("legacy", "float64", "float32"):
+            process = context.Process(target=run_variant, args=(variant, filename, results))
+            process.start()
+            name, elapsed, peak_mb, data_mb = results.get()
+            process.join()
+            print(f"{name:<10}{elapsed:>15.2f}{peak_mb:>15.1f}{data_mb:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Validates the float32 decomposition mode against float64: decomposes every recording with both
+precisions (each in a fresh process, so the reported peak RSS is its own) and pairs the motor units
+of the two runs by the rate of agreement of their discharge times.
+
+Usage:
+    python benchmarks/validate_precision.py "data/*.otb+" --params params.json
+    python benchmarks/validate_precision.py --seconds 20 --motor-units 10
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from core.utils.config_and_input.write_otb import write_otb
+
+
+def run_precision(filename, parameters, precision, results):
+    """Runs in a fresh process: decomposes filename with the given precision."""
+    from core.EmgDecomposition import offline_EMG
+
+    sys.stdout = open(os.devnull, "w")  # the pipeline reports every step
+    parameters = dict(parameters, precision=precision)
+    start = time.perf_counter()
+
+    emg_obj = offline_EMG(save_dir=tempfile.gettempdir(), to_filter=True)
+    emg_obj.apply_parameters(parameters)
+    emg_obj.open_otb(filename)
+    emg_obj.run_decomposition(parameters)
+
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    discharge_times = [
+        [np.asarray(discharges) for discharges in electrode] for electrode in emg_obj.mu_dict["discharge_times"]
+    ]
+    results.put((precision, discharge_times, emg_obj.signal_dict["fsamp"], elapsed, peak_mb))
+
+
+def main():
+    from batch_decompose import load_parameters, find_inputs
+    from core.utils.decomposition.mu_agreement import match_motor_units
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="*", help=".otb+ files, directories or glob patterns (default: synthetic)")
+    parser.add_argument("--params", help="JSON file with prepare_parameters keys")
+    parser.add_argument("--tolerance", type=float, default=0.0005, help="discharge matching tolerance in seconds")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="rate of agreement of matching MUs")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--motor-units", type=int, default=8)
+    args = parser.parse_args()
+
+    parameters = load_parameters(args.params)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        files = find_inputs(args.inputs) if args.inputs else []
+        if not args.inputs:
+            filename = os.path.join(temp_dir, "synthetic.otb+")
+            # the target ramps up and down over 2 s, so a plateau is found as in a real trial
+            ramp, nsamples = 2 * 2048, int(args.seconds * 2048)
+            target = np.ones(nsamples)
+            target[:ramp], target[-ramp:] = np.linspace(0, 1, ramp), np.linspace(1, 0, ramp)
+            write_otb(filename, seconds=args.seconds, nmus=args.motor_units, path=target, target=target)
+            files = [filename]
+
+        context = mp.get_context("spawn")
+        results = context.Queue()
+        unmatched = 0
+
+        for filename in files:
+            runs = {}
+            for precision in ("float64", "float32"):
+                process = context.Process(target=run_precision, args=(filename, parameters, precision, results))
+                process.start()
+                name, discharge_times, fsamp, elapsed, peak_mb = results.get()
+                process.join()
+                runs[name] = (discharge_times, elapsed, peak_mb)
+
+            print(f"\n{filename}")
+            print(f"{'precision':<10}{'MUs':>6}{'time (s)':>10}{'peak RSS (MB)':>15}")
+            for name, (discharge_times, elapsed, peak_mb) in runs.items():
+                print(f"{name:<10}{sum(map(len, discharge_times)):>6}{elapsed:>10.2f}{peak_mb:>15.1f}")
+
+            reference, test = runs["float64"][0], runs["float32"][0]
+            for electrode in range(max(len(reference), len(test))):
+                electrode_ref = reference[electrode] if electrode < len(reference) else []
+                electrode_test = test[electrode] if electrode < len(test) else []
+                pairs, _ = match_motor_units(electrode_ref, electrode_test, fsamp, args.tolerance, args.min_agreement)
+                agreement = ", ".join(f"{roa:.3f}" for _, _, roa in sorted(pairs))
+                unmatched += len(electrode_ref) + len(electrode_test) - 2 * len(pairs)
+                print(
+                    f"electrode {electrode + 1}: {len(pairs)} of {len(electrode_ref)} float64 MUs matched "
+                    f"by {len(electrode_test)} float32 MUs (rate of agreement {agreement or '-'})"
+                )
+
+    print(f"\n{'All motor units agree' if unmatched == 0 else f'{unmatched} motor units without a match'}")
+    return 1 if unmatched else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,20 +16,28 @@ from PyQt5.QtWidgets import (
     QApplication,
     QMainWindow,
     QFileDialog,
+    QProgressDialog,
+    QMessageBox,
 )
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 
 from ui.MUeditManualUI import setup_ui
-from core.utils.manual_editing.getsil import getsil
-from core.utils.manual_editing.refinesil import refinesil
-from core.utils.manual_editing.extendfilter import extendfilter
 from core.utils.manual_editing.selection_tools import SelectionTool, process_selection
+from core.utils.manual_editing.edit_jobs import (
+    EditJob,
+    unit_sil,
+    unit_sil_after_edit,
+    silhouette_job,
+    update_filter_job,
+    extend_filter_job,
+    remove_outliers_job,
+    update_all_filters_job,
+    remove_duplicates_within_arrays_job,
+    remove_duplicates_between_arrays_job,
+)
 from core.utils.decomposition.remove_outliers import remove_outliers
-from core.utils.decomposition.remove_duplicates import remove_duplicates
-from core.utils.decomposition.remove_duplicates_between_arrays import remove_duplicates_between_arrays
-from core.utils.decomposition.extend_emg import extend_emg
-from core.utils.decomposition.whiten_emg import whiten_emg
+from workers.EditJobWorker import EditJobWorker
 
 
 class MUeditManual(QMainWindow):
@@ -54,6 +62,20 @@ class MUeditManual(QMainWindow):
         self.roi = None
         self.current_selection = None
         self.mu_checkboxes = []  # Initialize the mu_checkboxes list
+        self.mu_checkbox_index = {}  # (array_idx, mu_idx) -> checkbox
+
+        # Edits run as jobs on a worker thread, one at a time
+        self.edit_worker = None
+        self.edit_job = None
+        self.edit_handlers = None
+        self.edit_progress = None
+
+        # SIL values are computed when a unit is first displayed, and in the background for the others.
+        # A unit's SIL is cached in silval/silvalcon until its discharge times are edited, which bumps
+        # its version so that background results for older versions are dropped.
+        self.unit_versions = {}  # (array_idx, mu_idx) -> number of edits since the units were numbered
+        self.sil_worker = None
+        self.sil_job = None
 
         # Set up the UI
         setup_ui(self)
@@ -68,8 +90,7 @@ class MUeditManual(QMainWindow):
         back_button = QPushButton("← Back to Dashboard")
         back_button.clicked.connect(self.request_return_to_dashboard)
         back_button.setFixedWidth(200)
-        back_button.setStyleSheet(
-            """
+        back_button.setStyleSheet("""
             QPushButton {
                 background-color: #333333;
                 color: white;
@@ -81,8 +102,7 @@ class MUeditManual(QMainWindow):
             QPushButton:hover {
                 background-color: #555555;
             }
-        """
-        )
+        """)
 
         # Find a suitable place to add the button
         # Option 1: Add to the main layout if it exists
@@ -186,6 +206,7 @@ class MUeditManual(QMainWindow):
                             self.reference_dropdown.addItem(str(name))
 
             # Update MU checkboxes
+            self.reset_unit_versions()
             self.update_mu_checkboxes()
 
             # Set initial view limits
@@ -213,6 +234,7 @@ class MUeditManual(QMainWindow):
         for checkbox in self.mu_checkboxes:
             checkbox.deleteLater()
         self.mu_checkboxes = []
+        self.mu_checkbox_index = {}
 
         for checkbox in self.array_checkboxes:
             checkbox.deleteLater()
@@ -274,18 +296,15 @@ class MUeditManual(QMainWindow):
                 has_checkboxes = True
                 mu_identifier = f"Array_{array_idx+1}_MU_{mu_idx+1}"
 
-                # Get SIL value if available
-                sil_value = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
                 # Simplified display text without array_number
-                checkbox_text = f"MU_{mu_idx+1} (SIL: {sil_value:.4f})"
-
-                checkbox = QCheckBox(checkbox_text)
+                checkbox = QCheckBox(self.mu_checkbox_text(array_idx, mu_idx))
                 checkbox.setStyleSheet("color: #333333; font-family: 'Poppins'; font-size: 14pt;")
                 checkbox.setObjectName(mu_identifier)  # Keep the full identifier in objectName
                 checkbox.setProperty("array_idx", array_idx)  # Store array index for check all functionality
                 checkbox.stateChanged.connect(self.mu_checkbox_state_changed)
 
                 self.mu_checkboxes.append(checkbox)
+                self.mu_checkbox_index[array_idx, mu_idx] = checkbox
                 checkbox_layout.addWidget(checkbox)
 
             # Only add panel if it has checkboxes
@@ -302,6 +321,9 @@ class MUeditManual(QMainWindow):
         if self.mu_checkboxes:
             self.mu_checkboxes[0].setChecked(True)
 
+        # Compute the SIL values of the other units in the background
+        self.fill_sil_values()
+
     def mu_checkbox_state_changed(self):
         """Handle changes in MU checkbox selection."""
         # Get all checked MUs
@@ -421,13 +443,7 @@ class MUeditManual(QMainWindow):
                     # Flatten and store as tuple key (array_idx, mu_idx)
                     self.MUedition["edition"]["Dischargetimes"][(i, j)] = dt.flatten()
 
-        # Calculate SIL values for each motor unit
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            pulse_train = self.MUedition["edition"]["Pulsetrain"][array_idx]
-
-            for mu_idx in range(pulse_train.shape[0]):
-                if (array_idx, mu_idx) in self.MUedition["edition"]["Dischargetimes"]:
-                    self.calculate_silval(array_idx, mu_idx)
+        # SIL values are computed once the units are displayed (see ensure_silval)
 
     def calculate_silval(self, array_idx, mu_idx):
         """Calculate silhouette value for a motor unit."""
@@ -446,37 +462,103 @@ class MUeditManual(QMainWindow):
         # Store it back
         self.MUedition["edition"]["Dischargetimes"][(array_idx, mu_idx)] = discharge_times
 
-        if len(discharge_times) > 2:
-            try:
-                if self.MUedition["signal"]["fsamp"].ndim > 1:
-                    fsamp = float(self.MUedition["signal"]["fsamp"][0][0])
-                else:
-                    fsamp = float(self.MUedition["signal"]["fsamp"][0])
+        # Calculate silhouette and continuous silhouette values
+        sil, silcon = unit_sil(
+            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :], discharge_times, self.sampling_frequency()
+        )
+        self.store_silval(array_idx, mu_idx, sil, silcon)
 
-                # Calculate silhouette value
-                self.MUedition["edition"]["silval"][(array_idx, mu_idx)] = getsil(
-                    self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :], fsamp
-                )
+    def store_silval(self, array_idx, mu_idx, sil, silcon):
+        """Cache the SIL and continuous SIL values of a motor unit and show them in its checkbox."""
+        self.MUedition["edition"]["silval"][(array_idx, mu_idx)] = sil
+        self.MUedition["edition"]["silvalcon"][(array_idx, mu_idx)] = silcon
+        self.update_sil_label(array_idx, mu_idx)
 
-                # Calculate continuous silhouette values
-                self.MUedition["edition"]["silvalcon"][(array_idx, mu_idx)] = refinesil(
-                    self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :], discharge_times, fsamp
-                )
+    def ensure_silval(self, array_idx, mu_idx):
+        """Calculate the SIL value of a motor unit with discharge times now, unless it is cached."""
+        edition = self.MUedition["edition"]
+        if (array_idx, mu_idx) in edition["Dischargetimes"] and (array_idx, mu_idx) not in edition["silval"]:
+            self.calculate_silval(array_idx, mu_idx)
+
+    def unit_edited(self, array_idx, mu_idx):
+        """Drop the cached SIL values of a motor unit whose discharge times (or pulse train) were edited."""
+        self.unit_versions[array_idx, mu_idx] = self.unit_versions.get((array_idx, mu_idx), 0) + 1
+        self.MUedition["edition"]["silval"].pop((array_idx, mu_idx), None)
+        self.MUedition["edition"]["silvalcon"].pop((array_idx, mu_idx), None)
+        self.update_sil_label(array_idx, mu_idx)
+
+    def reset_unit_versions(self):
+        """Start counting edits anew once the units are loaded or renumbered, dropping background SIL values."""
+        self.unit_versions = {}
+        if self.sil_job is not None:
+            self.sil_job.cancel()
+            self.sil_job = None
+
+    def fill_sil_values(self):
+        """Calculate the SIL values missing from the edition on the SIL worker thread, one unit at a time."""
+        if self.sil_job is not None:
+            self.sil_job.cancel()
+            self.sil_job = None
 
-            except Exception as e:
-                print(f"Error calculating SIL for array {array_idx}, MU {mu_idx}: {e}")
-                self.MUedition["edition"]["silval"][(array_idx, mu_idx)] = 0
-                self.MUedition["edition"]["silvalcon"][(array_idx, mu_idx)] = np.zeros((1, 2))
-        else:
-            self.MUedition["edition"]["silval"][(array_idx, mu_idx)] = 0
-            self.MUedition["edition"]["silvalcon"][(array_idx, mu_idx)] = np.zeros((1, 2))
+        edition = self.MUedition["edition"]
+        units = [
+            (key, self.unit_versions.get(key, 0), edition["Pulsetrain"][key[0]][key[1], :], discharge_times)
+            for key, discharge_times in edition["Dischargetimes"].items()
+            if key not in edition["silval"] and key[1] < edition["Pulsetrain"][key[0]].shape[0]
+        ]
+        if not units:
+            return
 
-        # Update the checkbox text if it exists
-        for checkbox in self.mu_checkboxes:
-            if checkbox.objectName() == f"Array_{array_idx+1}_MU_{mu_idx+1}":
-                sil_value = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
-                checkbox.setText(f"MU_{mu_idx+1} (SIL: {sil_value:.4f})")
-                break
+        if self.sil_worker is None:
+            self.sil_worker = EditJobWorker(self)
+            self.sil_worker.job_progress.connect(self.sil_job_progress)
+            self.sil_worker.job_finished.connect(self.sil_job_done)
+            self.sil_worker.job_cancelled.connect(self.sil_job_done)
+            self.sil_worker.job_failed.connect(self.sil_job_done)
+            QApplication.instance().aboutToQuit.connect(self.sil_worker.stop)
+
+        self.sil_job = EditJob(
+            "Computing SIL values",
+            silhouette_job,
+            units,
+            self.sampling_frequency(),
+            is_current=edition["silval"].__contains__,
+        )
+        self.sil_worker.submit(self.sil_job)
+
+    def sil_job_progress(self, job, message, fraction, partial):
+        """Cache a SIL value computed in the background, unless the unit was edited since."""
+        if job is not self.sil_job or partial is None:
+            return
+
+        (array_idx, mu_idx), version, sil, silcon = partial
+        if self.unit_versions.get((array_idx, mu_idx), 0) == version:
+            self.store_silval(array_idx, mu_idx, sil, silcon)
+
+    def sil_job_done(self, job, *args):
+        """Forget the background SIL job once it is over."""
+        if job is self.sil_job:
+            self.sil_job = None
+
+    def sil_text(self, array_idx, mu_idx):
+        """The SIL value of a motor unit for its checkbox, or a placeholder while it is being calculated."""
+        edition = self.MUedition["edition"]
+        if (array_idx, mu_idx) not in edition["silval"] and (array_idx, mu_idx) in edition["Dischargetimes"]:
+            return "SIL: ..."
+        return f"SIL: {edition['silval'].get((array_idx, mu_idx), 0):.4f}"
+
+    def mu_checkbox_text(self, array_idx, mu_idx):
+        """Checkbox text of a motor unit: its number and SIL value, marked when it is flagged for deletion."""
+        text = f"MU_{mu_idx+1} ({self.sil_text(array_idx, mu_idx)})"
+        if not np.any(self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :]):
+            text += " - FLAGGED"
+        return text
+
+    def update_sil_label(self, array_idx, mu_idx):
+        """Update the checkbox text of a motor unit with its SIL value, if the checkbox exists."""
+        checkbox = self.mu_checkbox_index.get((array_idx, mu_idx))
+        if checkbox is not None:
+            checkbox.setText(self.mu_checkbox_text(array_idx, mu_idx))
 
     def display_selected_mus(self, checked_mus):
         """Display the currently selected motor units."""
@@ -513,7 +595,8 @@ class MUeditManual(QMainWindow):
                 self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([])).copy()
             )
 
-            # Update SIL info
+            # Update SIL info, calculating it the first time the MU is displayed
+            self.ensure_silval(array_idx, mu_idx)
             sil_value = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
             self.sil_info.setText(f"Array_{array_idx+1}_MU_{mu_idx+1} - SIL = {sil_value:.4f}")
 
@@ -889,6 +972,138 @@ class MUeditManual(QMainWindow):
         self.update_mu_filter_btn.setEnabled(True)
         self.extend_mu_filter_btn.setEnabled(True)
 
+    # Background edit jobs
+    def first_checked_unit(self):
+        """(array_idx, mu_idx) of the first checked MU, or None."""
+        for checkbox in self.mu_checkboxes:
+            if checkbox.isChecked():
+                parts = checkbox.objectName().split("_")
+                if len(parts) < 4:
+                    return None
+                return int(parts[1]) - 1, int(parts[3]) - 1
+        return None
+
+    def backup_unit(self, array_idx, mu_idx):
+        """Store the current state of a motor unit for undo."""
+        self.Backup["Pulsetrain"] = self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :].copy()
+        self.Backup["Dischargetimes"] = (
+            self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([])).copy()
+        )
+
+    def sampling_frequency(self):
+        """The sampling frequency of the loaded signal, as a scalar."""
+        return float(np.ravel(self.MUedition["signal"]["fsamp"])[0])
+
+    def array_signal(self, array_idx):
+        """The channels of one array (channels x samples), their mask (1 = rejected) and the EMG type."""
+        data = self.MUedition["signal"]["data"][self.MUedition["edition"]["arraynb"] == array_idx, :]
+        masks = self.MUedition["signal"]["EMGmask"]
+        emg_mask = np.ravel(masks[0, array_idx] if np.ndim(masks) == 2 else masks[array_idx])
+        emg_types = self.MUedition["signal"].get("emgtype")
+        emg_type = "surface" if emg_types is None else str(np.squeeze(np.ravel(emg_types)[array_idx]))
+        return data, emg_mask, emg_type
+
+    def run_edit_job(self, job, apply, preview=None, restore=None):
+        """
+        Run an edit job (core.utils.manual_editing.edit_jobs.EditJob) on the edit worker thread.
+
+        A progress dialog shows its progress and can cancel it. Once the job is done, apply is called
+        with its result on the GUI thread; preview is called with its partial results, and restore
+        if it is cancelled or fails.
+        """
+        if self.edit_worker is None:
+            self.edit_worker = EditJobWorker(self)
+            self.edit_worker.job_progress.connect(self.edit_job_progress)
+            self.edit_worker.job_finished.connect(self.edit_job_finished)
+            self.edit_worker.job_cancelled.connect(self.edit_job_cancelled)
+            self.edit_worker.job_failed.connect(self.edit_job_failed)
+            QApplication.instance().aboutToQuit.connect(self.edit_worker.stop)
+
+        self.edit_job = job
+        self.edit_handlers = {"apply": apply, "preview": preview, "restore": restore}
+
+        self.edit_progress = QProgressDialog(job.name, "Cancel", 0, 100, self)
+        self.edit_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.edit_progress.setMinimumDuration(0)
+        self.edit_progress.setAutoClose(False)
+        self.edit_progress.setAutoReset(False)
+        self.edit_progress.setValue(0)
+        self.edit_progress.canceled.connect(job.cancel)
+
+        self.disable_action_buttons()
+        self.edit_worker.submit(job)
+
+    def edit_job_progress(self, job, message, fraction, partial):
+        """Show the progress of the running edit job."""
+        if job is not self.edit_job:
+            return
+
+        self.edit_progress.setLabelText(message)
+        self.edit_progress.setValue(int(round(fraction * 100)))
+        if partial is not None and self.edit_handlers["preview"] is not None:
+            self.edit_handlers["preview"](partial)
+
+    def edit_job_finished(self, job, result):
+        """Apply the result of an edit job."""
+        handlers = self.end_edit_job(job)
+        if handlers is not None:
+            handlers["apply"](result)
+
+    def edit_job_cancelled(self, job):
+        """Leave the edition as it was before a cancelled edit job."""
+        handlers = self.end_edit_job(job)
+        if handlers is not None and handlers["restore"] is not None:
+            handlers["restore"]()
+
+    def edit_job_failed(self, job, message):
+        """Report a failed edit job."""
+        self.edit_job_cancelled(job)
+        QMessageBox.warning(self, "Edit failed", f"{job.name}\n{message}", QMessageBox.Ok)
+
+    def end_edit_job(self, job):
+        """Close the progress dialog of an edit job, returning its handlers (None if it is not the current job)."""
+        if job is not self.edit_job:
+            return None
+
+        self.edit_job = None
+        self.edit_progress.canceled.disconnect()
+        self.edit_progress.close()
+        self.edit_progress = None
+        self.enable_action_buttons()
+        return self.edit_handlers
+
+    def apply_unit_edits(self, edits):
+        """Apply the edits of motor units (see edit_jobs.unit_edit), {(array_idx, mu_idx): edit}, at once."""
+        edition = self.MUedition["edition"]
+        for (array_idx, mu_idx), unit in edits.items():
+            self.unit_edited(array_idx, mu_idx)
+            if unit["pulse_train"] is not None:
+                edition["Pulsetrain"][array_idx][mu_idx, :] = unit["pulse_train"]
+            edition["Dischargetimes"][array_idx, mu_idx] = unit["discharge_times"]
+            self.store_silval(array_idx, mu_idx, unit["sil"], unit["silcon"])
+
+        # Update the display
+        self.mu_checkbox_state_changed()
+
+    def apply_edition(self, edition):
+        """
+        Replace the motor units of the edition (Pulsetrain and Dischargetimes). Their SIL values are
+        computed again, lazily, as the units were renumbered.
+        """
+        self.MUedition["edition"].update(edition, silval={}, silvalcon={})
+
+        # Update the MU checkboxes
+        self.reset_unit_versions()
+        self.update_mu_checkboxes()
+
+    def closeEvent(self, event):
+        """Stop the worker threads with the window."""
+        if self.edit_worker is not None:
+            self.edit_worker.stop()
+        if self.sil_worker is not None:
+            self.sil_worker.stop()
+        super().closeEvent(event)
+
     def add_spikes_button_pushed(self):
         """Add spikes by drawing a selection rectangle."""
         if not self.MUedition:
@@ -1008,16 +1223,31 @@ class MUeditManual(QMainWindow):
 
     def handle_selection_complete(self, action_type, array_idx, mu_idx, x_min, x_max, y_min, y_max):
         """Handle the completion of a selection and process it."""
+        edition = self.MUedition["edition"]
+        before = edition["Dischargetimes"].get((array_idx, mu_idx), np.array([]))
+        sil, silcon = edition["silval"].get((array_idx, mu_idx)), edition["silvalcon"].get((array_idx, mu_idx))
+
         # Process the selection
         process_selection(self.MUedition, action_type, array_idx, mu_idx, x_min, x_max, y_min, y_max)
 
+        # Recompute the continuous SIL only around the added or deleted spikes
+        after = edition["Dischargetimes"].get((array_idx, mu_idx), np.array([]))
+        changed = np.setxor1d(before, after)
+        if len(changed) > 0:
+            self.unit_edited(array_idx, mu_idx)
+            if sil is not None and silcon is not None:
+                pulse_train = edition["Pulsetrain"][array_idx][mu_idx, :]
+                sil, silcon = unit_sil_after_edit(
+                    pulse_train, after, self.sampling_frequency(), sil, silcon, changed[0], changed[-1] + 1
+                )
+                self.store_silval(array_idx, mu_idx, sil, silcon)
+
         # Update the display
-        for checkbox in self.mu_checkboxes:
-            if checkbox.objectName() == f"Array_{array_idx+1}_MU_{mu_idx+1}":
-                if checkbox.isChecked():
-                    # If the MU is currently checked, update the display
-                    self.mu_checkbox_state_changed()
-                break
+        checkbox = self.mu_checkbox_index.get((array_idx, mu_idx))
+        if checkbox is not None and checkbox.isChecked():
+            # If the MU is currently checked, update the display
+            self.mu_checkbox_state_changed()
+        self.fill_sil_values()
 
     def lock_spikes_button_pushed(self):
         """Lock the current spikes to keep them during filter updates."""
@@ -1070,45 +1300,27 @@ class MUeditManual(QMainWindow):
 
         # Apply remoutliers
         filtered_distime = remove_outliers(
-            pulse_trains, distime_list, 0.3, self.MUedition["signal"]["fsamp"]  # Threshold for CoV of Discharge rate
+            pulse_trains, distime_list, self.sampling_frequency(), threshold=0.3  # Threshold for CoV of Discharge rate
         )
 
         # Update discharge times
         if filtered_distime and len(filtered_distime) > 0:
             self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = filtered_distime[0]
+            self.unit_edited(array_idx, mu_idx)
 
             # Update the display
             self.mu_checkbox_state_changed()
+            self.fill_sil_values()
 
     def update_mu_filter_button_pushed(self):
         """Update the motor unit filter using the current discharge times."""
-        if not self.MUedition:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        # Get the first checked MU
-        checked_mus = []
-        for checkbox in self.mu_checkboxes:
-            if checkbox.isChecked():
-                checked_mus.append(checkbox.objectName())
-                break
-
-        if not checked_mus:
+        unit = self.first_checked_unit()
+        if unit is None:
             return
-
-        mu_text = checked_mus[0]
-        parts = mu_text.split("_")
-
-        if len(parts) < 4:
-            return
-
-        array_idx = int(parts[1]) - 1
-        mu_idx = int(parts[3]) - 1
-
-        # Store current state for undo
-        self.Backup["Pulsetrain"] = self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :].copy()
-        self.Backup["Dischargetimes"] = (
-            self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([])).copy()
-        )
+        array_idx, mu_idx = unit
 
         # Get the indices for the current view
         idx = np.where(
@@ -1118,79 +1330,44 @@ class MUeditManual(QMainWindow):
         if len(idx) == 0:
             return
 
-        # Get EMG data for the current array and view
-        emg_data = self.MUedition["signal"]["data"][self.MUedition["edition"]["arraynb"] == array_idx, :]
-        emg_mask = self.MUedition["signal"]["EMGmask"][array_idx]
-        emg_data = emg_data[emg_mask == 0, :]  # Use only non-rejected channels
+        # Store current state for undo
+        self.backup_unit(array_idx, mu_idx)
 
-        # Get the MUAP templates using extendfilter
-        old_sil = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
+        emg_data, emg_mask, emg_type = self.array_signal(array_idx)
+        lock = self.Backup["lock"] == 1
+
+        def apply_update(result):
+            # With locked spikes, only the pulse train is updated, and the lock is reset
+            if lock:
+                self.Backup["lock"] = 0
+                self.lock_spikes_btn.setStyleSheet(
+                    "color: #f0f0f0; background-color: #262626; font-family: 'Poppins'; font-size: 18pt;"
+                )
+            self.apply_unit_edits({(array_idx, mu_idx): result})
 
-        # Apply filter update
-        updated_pulse_train, updated_discharge_times = extendfilter(
+        job = EditJob(
+            "Updating the MU filter...",
+            update_filter_job,
             emg_data,
             emg_mask,
-            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :],
+            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :].copy(),
             self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx],
             idx,
-            self.MUedition["signal"]["fsamp"],
-            self.MUedition["signal"]["emgtype"][array_idx],
+            self.sampling_frequency(),
+            emg_type,
+            lock=lock,
         )
-
-        # Handle spike locking
-        if self.Backup["lock"] == 1:
-            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = updated_pulse_train
-
-            # Reset the lock
-            self.Backup["lock"] = 0
-            self.lock_spikes_btn.setStyleSheet(
-                "color: #f0f0f0; background-color: #262626; font-family: 'Poppins'; font-size: 18pt;"
-            )
-        else:
-            # Update both pulse train and discharge times
-            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = updated_pulse_train
-            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = updated_discharge_times
-
-        # Recalculate SIL values
-        self.calculate_silval(array_idx, mu_idx)
-
-        # Update the display
-        self.mu_checkbox_state_changed()
+        self.run_edit_job(job, apply_update)
 
     def extend_mu_filter_button_pushed(self):
         """Extend the motor unit filter to the entire signal."""
-        if not self.MUedition:
-            return
-
-        # Get the first checked MU
-        checked_mus = []
-        for checkbox in self.mu_checkboxes:
-            if checkbox.isChecked():
-                checked_mus.append(checkbox.objectName())
-                break
-
-        if not checked_mus:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        mu_text = checked_mus[0]
-        parts = mu_text.split("_")
-
-        if len(parts) < 4:
+        unit = self.first_checked_unit()
+        if unit is None:
             return
-
-        array_idx = int(parts[1]) - 1
-        mu_idx = int(parts[3]) - 1
-
-        # Store current state for undo
-        self.Backup["Pulsetrain"] = self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :].copy()
-        self.Backup["Dischargetimes"] = (
-            self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([])).copy()
-        )
-
-        # Get EMG data for the current array
-        emg_data = self.MUedition["signal"]["data"][self.MUedition["edition"]["arraynb"] == array_idx, :]
-        emg_mask = self.MUedition["signal"]["EMGmask"][array_idx]
-        emg_data = emg_data[emg_mask == 0, :]  # Use only non-rejected channels
+        array_idx, mu_idx = unit
 
         # Get the current view indices
         current_idx = np.where(
@@ -1200,81 +1377,41 @@ class MUeditManual(QMainWindow):
         if len(current_idx) == 0:
             return
 
-        # Save old SIL for later comparison
-        old_sil = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
+        # Store current state for undo
+        self.backup_unit(array_idx, mu_idx)
+
+        emg_data, emg_mask, emg_type = self.array_signal(array_idx)
 
         # Zoom out to full signal
         self.graphstart = self.MUedition["edition"]["time"][0]
         self.graphend = self.MUedition["edition"]["time"][-1]
         self.update_plot_limits()
 
-        # Process the signal in windows to extend the filter
-        signal_length = self.MUedition["edition"]["time"].shape[0]
-        step = current_idx.shape[0] // 2
-
-        # First extend forward
-        idx = current_idx.copy()
-        for j in range(int((signal_length - idx[-1]) / step)):
-            # Move idx forward
-            idx = idx + step
-            idx = idx[idx < signal_length]
-
-            if len(idx) == 0:
-                break
-
-            # Apply extendfilter
-            updated_pulse_train, updated_discharge_times = extendfilter(
-                emg_data,
-                emg_mask,
-                self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :],
-                self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx],
-                idx,
-                self.MUedition["signal"]["fsamp"],
-                self.MUedition["signal"]["emgtype"][array_idx],
-            )
-
-            # Update the data
-            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = updated_pulse_train
-            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = updated_discharge_times
-
-            # Update the display to show progress
+        def preview(partial):
+            # Show the filter extended so far (the edit is only final once the job is done)
+            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = partial[0]
+            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = partial[1]
             self.mu_checkbox_state_changed()
-            QApplication.processEvents()
 
-        # Then extend backward
-        idx = current_idx.copy()
-        for j in range(int(idx[0] / step)):
-            # Move idx backward
-            idx = idx - step
-            idx = idx[idx >= 0]
-
-            if len(idx) == 0:
-                break
-
-            # Apply extendfilter
-            updated_pulse_train, updated_discharge_times = extendfilter(
-                emg_data,
-                emg_mask,
-                self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :],
-                self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx],
-                idx,
-                self.MUedition["signal"]["fsamp"],
-                self.MUedition["signal"]["emgtype"][array_idx],
-            )
-
-            # Update the data
-            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = updated_pulse_train
-            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = updated_discharge_times
-
-            # Update the display to show progress
+        def restore():
+            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = self.Backup["Pulsetrain"]
+            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = self.Backup["Dischargetimes"].copy()
             self.mu_checkbox_state_changed()
-            QApplication.processEvents()
 
-        # Recalculate SIL values
-        self.calculate_silval(array_idx, mu_idx)
-
-        # Final display update
-        self.mu_checkbox_state_changed()
+        job = EditJob(
+            "Extending the MU filter...",
+            extend_filter_job,
+            emg_data,
+            emg_mask,
+            self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :].copy(),
+            self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx],
+            current_idx,
+            self.sampling_frequency(),
+            emg_type,
+        )
+        self.run_edit_job(
+            job, lambda result: self.apply_unit_edits({(array_idx, mu_idx): result}), preview=preview, restore=restore
+        )
 
     def undo_button_pushed(self):
         """Undo the last edit."""
@@ -1305,6 +1442,7 @@ class MUeditManual(QMainWindow):
         self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = self.Backup["Dischargetimes"].copy()
 
         # Recalculate SIL
+        self.unit_edited(array_idx, mu_idx)
         self.calculate_silval(array_idx, mu_idx)
 
         # Update the display
@@ -1343,9 +1481,9 @@ class MUeditManual(QMainWindow):
                 self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = 0
                 self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = np.array([1, fsamp])
 
-                # Update SIL in checkbox text
-                sil_value = self.MUedition["edition"]["silval"].get((array_idx, mu_idx), 0)
-                checkbox.setText(f"{mu_text} (SIL: {sil_value:.4f}) - FLAGGED")
+                # Update SIL in checkbox text, which marks the zeroed MU as flagged (its SIL is quick to calculate)
+                self.unit_edited(array_idx, mu_idx)
+                self.calculate_silval(array_idx, mu_idx)
 
         # Update the display
         self.mu_checkbox_state_changed()
@@ -1353,180 +1491,40 @@ class MUeditManual(QMainWindow):
     # Batch processing
     def remove_all_outliers_button_pushed(self):
         """Remove outliers from all motor units."""
-        if not self.MUedition:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        # Create a progress dialog
-        from PyQt5.QtWidgets import QProgressDialog
-        from PyQt5.QtCore import QTimer
-
-        progress = QProgressDialog("Removing outliers...", "Cancel", 0, 100, self)
-        progress.setWindowModality(Qt.WindowModality.WindowModal)
-        progress.setMinimumDuration(0)
-        progress.setValue(0)
-
-        # Count total MUs
-        total_mus = 0
-        for i in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            total_mus += self.MUedition["edition"]["Pulsetrain"][i].shape[0]
-
-        # Process each MU
-        processed_mus = 0
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            num_mus = self.MUedition["edition"]["Pulsetrain"][array_idx].shape[0]
-
-            for mu_idx in range(num_mus):
-                progress.setValue(int(processed_mus / total_mus * 100))
-                progress.setLabelText(f"Removing outliers for Array #{array_idx+1} MU #{mu_idx+1}")
-                QApplication.processEvents()
-
-                if progress.wasCanceled():
-                    break
-
-                # Create dummy arrays for remoutliers function
-                pulse_trains = np.zeros((1, self.MUedition["edition"]["Pulsetrain"][array_idx].shape[1]))
-                pulse_trains[0, :] = self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :]
-
-                distime_list = [self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([]))]
-
-                # Apply remoutliers if there are discharge times
-                if len(distime_list[0]) > 1:
-                    filtered_distime = remove_outliers(
-                        pulse_trains,
-                        distime_list,
-                        0.3,  # Threshold for CoV of Discharge rate
-                        self.MUedition["signal"]["fsamp"],
-                    )
-
-                    # Update discharge times
-                    if filtered_distime and len(filtered_distime) > 0:
-                        self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = filtered_distime[0]
-
-                    # Update SIL values
-                    self.calculate_silval(array_idx, mu_idx)
-
-                processed_mus += 1
-
-            if progress.wasCanceled():
-                break
-
-        progress.setValue(100)
-
-        # Update the current MU display
-        self.mu_checkbox_state_changed()
+        job = EditJob(
+            "Removing outliers...",
+            remove_outliers_job,
+            list(self.MUedition["edition"]["Pulsetrain"]),
+            dict(self.MUedition["edition"]["Dischargetimes"]),
+            self.sampling_frequency(),
+            n_workers=os.cpu_count() or 1,
+        )
+        self.run_edit_job(job, self.apply_unit_edits)
 
     def update_all_mu_filters_button_pushed(self):
         """Update filters for all motor units."""
-        if not self.MUedition:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        # Create a progress dialog
-        from PyQt5.QtWidgets import QProgressDialog
-
-        progress = QProgressDialog("Updating MU filters...", "Cancel", 0, 100, self)
-        progress.setWindowModality(Qt.WindowModality.WindowModal)
-        progress.setMinimumDuration(0)
-        progress.setValue(0)
-
-        # Count total MUs
-        total_mus = 0
-        for i in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            total_mus += self.MUedition["edition"]["Pulsetrain"][i].shape[0]
-
-        # Process each MU
-        processed_mus = 0
+        # Accepted channels of each array
+        emg_data = []
         for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            # Get EMG data for this array
-            emg_data = self.MUedition["signal"]["data"][self.MUedition["edition"]["arraynb"] == array_idx, :]
-            emg_mask = self.MUedition["signal"]["EMGmask"][array_idx]
-            emg_data = emg_data[emg_mask == 0, :]  # Use only non-rejected channels
-
-            num_mus = self.MUedition["edition"]["Pulsetrain"][array_idx].shape[0]
-
-            for mu_idx in range(num_mus):
-                progress.setValue(int(processed_mus / total_mus * 100))
-                progress.setLabelText(f"Updating filter for Array #{array_idx+1} MU #{mu_idx+1}")
-                QApplication.processEvents()
-
-                if progress.wasCanceled():
-                    break
-
-                # Get discharge times
-                discharge_times = self.MUedition["edition"]["Dischargetimes"].get((array_idx, mu_idx), np.array([]))
-
-                if len(discharge_times) > 1:
-                    # Create extension factor
-                    extension_factor = min(1000 // emg_data.shape[0], 25)
-
-                    # Extend the EMG signal
-                    extended_emg = np.zeros(
-                        [emg_data.shape[0] * extension_factor, emg_data.shape[1] + extension_factor - 1]
-                    )
-                    extended_emg = extend_emg(extended_emg, emg_data, extension_factor)
-
-                    # Calculate covariance and pseudo-inverse
-                    covariance = extended_emg @ extended_emg.T / extended_emg.shape[1]
-                    inverse_cov = np.linalg.pinv(covariance)
-
-                    # Get whitened signal
-                    _, _, dewhitening_matrix = whiten_emg(extended_emg)
-
-                    # Calculate motor unit filter
-                    mu_filter = np.sum(extended_emg[:, discharge_times], axis=1, keepdims=True)
-
-                    # Calculate pulse train
-                    pulse_train = ((dewhitening_matrix @ mu_filter).T @ inverse_cov) @ extended_emg
-                    pulse_train = pulse_train[0, : emg_data.shape[1]]
-
-                    # Square and rectify
-                    pulse_train = pulse_train * np.abs(pulse_train)
-
-                    # Find peaks
-                    from scipy.signal import find_peaks
-
-                    peaks, _ = find_peaks(pulse_train, distance=round(0.005 * self.MUedition["signal"]["fsamp"]))
-
-                    # Normalize using top peaks
-                    if len(peaks) >= 10:
-                        top_values = np.sort(pulse_train[peaks])[-10:]
-                        pulse_train = pulse_train / np.mean(top_values)
-                    elif len(peaks) > 0:
-                        pulse_train = pulse_train / np.mean(pulse_train[peaks])
-
-                    # Cluster peaks to find spikes
-                    if len(peaks) >= 2:
-                        from sklearn.cluster import KMeans
+            data, emg_mask, _ = self.array_signal(array_idx)
+            emg_data.append(data[emg_mask == 0, :])
 
-                        kmeans = KMeans(n_clusters=2, random_state=0).fit(pulse_train[peaks].reshape(-1, 1))
-                        labels = kmeans.labels_
-                        centroids = kmeans.cluster_centers_
-
-                        # Find class with highest centroid
-                        high_centroid_idx = np.argmax(centroids)
-                        spikes = peaks[labels == high_centroid_idx]
-
-                        # Remove outliers
-                        threshold = np.mean(pulse_train[spikes]) + 3 * np.std(pulse_train[spikes])
-                        spikes = spikes[pulse_train[spikes] <= threshold]
-                    else:
-                        spikes = peaks
-
-                    # Update the pulse train and discharge times
-                    self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx, :] = pulse_train
-                    self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = spikes
-
-                    # Recalculate SIL
-                    self.calculate_silval(array_idx, mu_idx)
-
-                processed_mus += 1
-
-            if progress.wasCanceled():
-                break
-
-        progress.setValue(100)
-
-        # Update the current MU display
-        self.mu_checkbox_state_changed()
+        job = EditJob(
+            "Updating MU filters...",
+            update_all_filters_job,
+            emg_data,
+            list(self.MUedition["edition"]["Pulsetrain"]),
+            dict(self.MUedition["edition"]["Dischargetimes"]),
+            self.sampling_frequency(),
+            n_workers=os.cpu_count() or 1,
+        )
+        self.run_edit_job(job, self.apply_unit_edits)
 
     def remove_flagged_mu_button_pushed(self):
         """Remove motor units that have been flagged for deletion."""
@@ -1608,141 +1606,36 @@ class MUeditManual(QMainWindow):
         self.MUedition["edition"]["silvalcon"] = clean_silvalcon
 
         # Update the MU checkboxes
+        self.reset_unit_versions()
         self.update_mu_checkboxes()
 
     def remove_duplicates_within_grids_button_pushed(self):
         """Remove duplicate motor units within each grid."""
-        if not self.MUedition:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        # Extract the sampling frequency as a scalar
-        if self.MUedition["signal"]["fsamp"].ndim > 1:
-            fsamp = float(self.MUedition["signal"]["fsamp"][0, 0])
-        else:
-            fsamp = float(self.MUedition["signal"]["fsamp"][0])
-
-        # Process each array
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            # Skip if there are no MUs
-            if self.MUedition["edition"]["Pulsetrain"][array_idx].shape[0] == 0:
-                continue
-
-            # Create arrays for remduplicates
-            pulse_train = self.MUedition["edition"]["Pulsetrain"][array_idx]
-
-            discharge_times = []
-            for mu_idx in range(pulse_train.shape[0]):
-                if (array_idx, mu_idx) in self.MUedition["edition"]["Dischargetimes"]:
-                    discharge_times.append(self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx])
-                else:
-                    discharge_times.append(np.array([]))
-
-            # Remove duplicates
-            unique_discharge_times, unique_pulse_train, _ = remove_duplicates(
-                pulse_train,
-                discharge_times,
-                discharge_times,
-                np.zeros((1, 1)),  # Placeholder for mu_filters (not used)
-                round(fsamp / 40),
-                0.00025,
-                0.3,  # Duplicate threshold
-                fsamp,
-            )
-
-            # Replace with unique MUs
-            self.MUedition["edition"]["Pulsetrain"][array_idx] = unique_pulse_train
-
-            # Update discharge times and SIL values
-            for mu_idx in range(unique_pulse_train.shape[0]):  # type:ignore
-                self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx] = unique_discharge_times[mu_idx]
-                self.calculate_silval(array_idx, mu_idx)
-
-        # Update the MU checkboxes
-        self.update_mu_checkboxes()
+        job = EditJob(
+            "Removing duplicates within grids...",
+            remove_duplicates_within_arrays_job,
+            list(self.MUedition["edition"]["Pulsetrain"]),
+            dict(self.MUedition["edition"]["Dischargetimes"]),
+            self.sampling_frequency(),
+        )
+        self.run_edit_job(job, self.apply_edition)
 
     def remove_duplicates_between_grids_button_pushed(self):
         """Remove duplicate motor units between grids."""
-        if not self.MUedition:
+        if not self.MUedition or self.edit_job is not None:
             return
 
-        # Extract the sampling frequency as a scalar
-        if self.MUedition["signal"]["fsamp"].ndim > 1:
-            fsamp = float(self.MUedition["signal"]["fsamp"][0, 0])
-        else:
-            fsamp = float(self.MUedition["signal"]["fsamp"][0])
-
-        # Count total MUs
-        mu_count = 0
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            mu_count += self.MUedition["edition"]["Pulsetrain"][array_idx].shape[0]
-
-        # Create arrays for remduplicatesbgrids
-        all_pulse_trains = np.zeros((mu_count, self.MUedition["edition"]["time"].shape[0]))
-        all_discharge_times = []
-        muscle = np.zeros(mu_count, dtype=int)
-
-        # Collect all MUs
-        mu_idx_global = 0
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            for mu_idx in range(self.MUedition["edition"]["Pulsetrain"][array_idx].shape[0]):
-                all_pulse_trains[mu_idx_global] = self.MUedition["edition"]["Pulsetrain"][array_idx][mu_idx]
-
-                if (array_idx, mu_idx) in self.MUedition["edition"]["Dischargetimes"]:
-                    all_discharge_times.append(self.MUedition["edition"]["Dischargetimes"][array_idx, mu_idx])
-                else:
-                    all_discharge_times.append(np.array([]))
-
-                muscle[mu_idx_global] = array_idx
-                mu_idx_global += 1
-
-        # Remove duplicates between arrays
-        unique_discharge_times, unique_pulse_train, unique_muscle = remove_duplicates_between_arrays(
-            all_pulse_trains, all_discharge_times, muscle, round(fsamp / 40), 0.00025, 0.3, fsamp  # Duplicate threshold
+        job = EditJob(
+            "Removing duplicates between grids...",
+            remove_duplicates_between_arrays_job,
+            list(self.MUedition["edition"]["Pulsetrain"]),
+            dict(self.MUedition["edition"]["Dischargetimes"]),
+            self.sampling_frequency(),
         )
-
-        # Recreate data structures
-        new_pulsetrain = []
-        new_dischargetimes = {}
-        new_silval = {}
-        new_silvalcon = {}
-
-        # Initialize arrays for each grid
-        for array_idx in range(len(self.MUedition["edition"]["Pulsetrain"])):
-            array_indices = np.where(unique_muscle == array_idx)[0]
-
-            if len(array_indices) > 0:
-                # Get pulse trains for this array
-                array_pulse_train = unique_pulse_train[array_indices]
-                new_pulsetrain.append(array_pulse_train)
-
-                # Get discharge times for this array
-                for mu_idx, global_idx in enumerate(array_indices):
-                    if global_idx < len(unique_discharge_times):
-                        new_dischargetimes[array_idx, mu_idx] = unique_discharge_times[global_idx]
-
-                    # Calculate SIL values
-                    self.calculate_silval(array_idx, mu_idx)
-            else:
-                # Add empty array
-                new_pulsetrain.append(
-                    np.zeros(
-                        (
-                            0,
-                            (
-                                unique_pulse_train.shape[1]
-                                if unique_pulse_train.shape[0] > 0
-                                else self.MUedition["edition"]["time"].shape[0]
-                            ),
-                        )
-                    )
-                )
-
-        # Update the data
-        self.MUedition["edition"]["Pulsetrain"] = new_pulsetrain
-        self.MUedition["edition"]["Dischargetimes"] = new_dischargetimes
-
-        # Update the MU checkboxes
-        self.update_mu_checkboxes()
+        self.run_edit_job(job, self.apply_edition)
 
     # Visualization methods
     def plot_mu_spiketrains_button_pushed(self):
@@ -1935,6 +1828,10 @@ class MUeditManual(QMainWindow):
         if not self.MUedition:
             return
 
+        # Calculate the SIL values not calculated yet, to save them all
+        for array_idx, mu_idx in list(self.MUedition["edition"]["Dischargetimes"]):
+            self.ensure_silval(array_idx, mu_idx)
+
         # Remove flagged MUs before saving
         from PyQt5.QtWidgets import QProgressDialog
 
@@ -2007,6 +1904,7 @@ class MUeditManual(QMainWindow):
                             del self.MUedition["edition"]["silvalcon"][array_idx, shift_mu]
 
         progress.setValue(100)
+        self.reset_unit_versions()
 
         # Determine the save filename
         if self.filename is None:
@@ -0,0 +1,193 @@
+"""
+Headless batch decomposition of .otb+ recordings.
+
+Runs the same pipeline as the DecompositionApp (open_otb, electrode formatting, batching,
+sphering, FastICA/CKC and post-processing) without the GUI, several files at a time, and writes
+the same <file>_output_decomp.mat the app saves.
+
+Example:
+    python batch_decompose.py "data/*.otb+" --params params.json --jobs 4
+
+The parameter file is a JSON object with the keys read by prepare_parameters (the UI keys such as
+"iterations", "sil_threshold" or "contrast_function"); algorithm keys such as "NITER" or "silthr"
+are also accepted and take precedence. Files whose output already exists with the same parameters
+are skipped, so an interrupted run can simply be restarted.
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing as mp
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+import numpy as np
+import scipy.io as sio
+from threadpoolctl import threadpool_limits
+
+from core.EmgDecomposition import offline_EMG
+from core.utils.config_and_input.prepare_parameters import prepare_parameters
+from core.utils.decomposition_output import format_results, format_for_matlab
+
+# Parameters that only change how the decomposition is executed, not its result
+EXECUTION_PARAMETERS = (
+    "nworkers",
+    "blasthreads",
+    "drawingmode",
+    "enable_plots",
+    "cachedir",
+    "cachesize",
+    "outofcore",
+    "storedir",
+)
+
+
+def load_parameters(param_file):
+    """Builds the algorithm parameters from a JSON file of prepare_parameters keys."""
+    user_params = {}
+    if param_file:
+        with open(param_file, encoding="utf-8") as file:
+            user_params = json.load(file)
+
+    parameters = prepare_parameters(user_params)
+    for key, value in user_params.items():
+        if key in parameters:
+            parameters[key] = value
+
+    return parameters
+
+
+def find_inputs(inputs):
+    """Expands directories and glob patterns into a sorted list of .otb+ files."""
+    files = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            files.update(glob.glob(os.path.join(item, "*.otb+")))
+        else:
+            files.update(f for f in glob.glob(item) if f.endswith(".otb+"))
+
+    return sorted(os.path.abspath(f) for f in files)
+
+
+def output_path(inputfile, output_dir=None):
+    """Same naming as DecompositionApp: <file>_output_decomp.mat, next to the input by default."""
+    directory = output_dir if output_dir else os.path.dirname(inputfile)
+    return os.path.join(directory, os.path.basename(inputfile) + "_output_decomp.mat")
+
+
+def parameters_match(savename, parameters):
+    """Checks whether an existing output was produced with the same (result-affecting) parameters."""
+    try:
+        saved = sio.loadmat(savename, variable_names=["parameters"], simplify_cells=True).get("parameters")
+    except Exception:
+        return False
+
+    if not isinstance(saved, dict):
+        return False
+
+    for key, value in parameters.items():
+        if key in EXECUTION_PARAMETERS:
+            continue
+        if key not in saved:
+            return False
+        if isinstance(value, str):
+            # savemat stores empty strings as empty arrays
+            saved_value = "" if np.size(saved[key]) == 0 else str(saved[key])
+            if saved_value != value:
+                return False
+        elif not np.array_equal(np.ravel(saved[key]).astype(float), np.ravel(value).astype(float)):
+            return False
+
+    return True
+
+
+def job_thread_budget(parameters, jobs):
+    """
+    Shares the cores between the jobs, then between the electrode workers of each job.
+
+    Returns the parameters for each job, whose blasthreads bounds every electrode worker, and the
+    BLAS threads of the job itself. A non-zero blasthreads is kept as the count per process.
+    """
+    if parameters["blasthreads"]:
+        return parameters, parameters["blasthreads"]
+
+    blas_threads = max(1, (os.cpu_count() or 1) // jobs)
+    nworkers = max(1, int(parameters["nworkers"]))
+    return dict(parameters, blasthreads=max(1, blas_threads // nworkers)), blas_threads
+
+
+def decompose_file(inputfile, savename, parameters, blas_threads):
+    """Decomposes a single .otb+ file and saves the result. Runs in a worker process."""
+    emg_obj = offline_EMG(save_dir=os.path.dirname(savename), to_filter=True)
+    emg_obj.apply_parameters(parameters)
+    try:
+        emg_obj.open_otb(inputfile)
+
+        with threadpool_limits(limits=blas_threads):
+            emg_obj.run_decomposition(parameters)
+
+        result = format_results(emg_obj)
+        sio.savemat(savename, {"signal": format_for_matlab(result), "parameters": parameters}, do_compression=True)
+    finally:
+        emg_obj.close_store()
+
+    return sum(pulse_trains.shape[0] for pulse_trains in result["Pulsetrain"].values())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decompose .otb+ files without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="directories or glob patterns of .otb+ files")
+    parser.add_argument("--params", help="JSON file with prepare_parameters keys")
+    parser.add_argument("--jobs", type=int, default=1, help="number of files decomposed at the same time")
+    parser.add_argument("--output-dir", help="directory for the outputs (default: next to each input file)")
+    parser.add_argument("--force", action="store_true", help="decompose again even if a matching output exists")
+    args = parser.parse_args(argv)
+
+    parameters = load_parameters(args.params)
+    files = find_inputs(args.inputs)
+    if not files:
+        print("No .otb+ files found")
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    todo = []
+    for inputfile in files:
+        savename = output_path(inputfile, args.output_dir)
+        if not args.force and os.path.exists(savename) and parameters_match(savename, parameters):
+            print(f"Skipping {inputfile}: {savename} already exists with the same parameters")
+        else:
+            todo.append((inputfile, savename))
+
+    jobs = max(1, min(args.jobs, len(todo)))
+    job_parameters, blas_threads = job_thread_budget(parameters, jobs)
+    print(f"Decomposing {len(todo)} of {len(files)} files with {jobs} jobs")
+
+    failed = 0
+    # spawn rather than fork, as in decompose_electrodes
+    with ProcessPoolExecutor(jobs, mp_context=mp.get_context("spawn")) as pool:
+        futures = {
+            pool.submit(decompose_file, inputfile, savename, job_parameters, blas_threads): inputfile
+            for inputfile, savename in todo
+        }
+        for future in as_completed(futures):
+            inputfile = futures[future]
+            try:
+                nmus = future.result()
+                print(f"Finished {inputfile}: {nmus} motor units")
+            except Exception:
+                failed += 1
+                print(f"Failed {inputfile}:\n{traceback.format_exc()}")
+
+    print(f"Done: {len(todo) - failed} decomposed, {len(files) - len(todo)} skipped, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
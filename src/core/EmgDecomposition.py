@@ -1,17 +1,16 @@
-import scipy
 import numpy as np
 from typing import Dict, List, Tuple, Any, Optional, Union
 
 from .utils.config_and_input.open_otb import open_otb
 from .utils.config_and_input.electrode_formatter import electrode_formatter
-from .utils.decomposition.notch_filter import notch_filter
-from .utils.decomposition.bandpass_filter import bandpass_filter
-from .utils.decomposition.extend_emg import extend_emg
-from .utils.decomposition.whiten_emg import whiten_emg
-from .utils.decomposition.get_spikes import get_spikes
-from .utils.decomposition.min_cov_isi import min_cov_isi
-from .utils.decomposition.get_silhouette import get_silhouette
-from .utils.decomposition.peel_off import peel_off
+from .utils.decomposition.decomposition_engine import (
+    DecompositionEngine,
+    DecompositionParameters,
+    SpheredBatch,
+    get_engine,
+    inverse_extended_covariance,
+    precision_dtype,
+)
 from .utils.decomposition.batch_process_filters import batch_process_filters
 from .utils.decomposition.remove_duplicates import remove_duplicates
 from .utils.decomposition.remove_duplicates_between_arrays import remove_duplicates_between_arrays
@@ -20,17 +19,11 @@ from .utils.decomposition.refine_mus import refine_mus
 from .utils.decomposition.get_pulse_trains import get_pulse_trains
 from .utils.decomposition.get_mu_filters import get_mu_filters
 from .utils.decomposition.get_online_parameters import get_online_parameters
-from .utils.decomposition.fixed_point_alg import fixed_point_alg
-from .utils.decomposition.mathematical_functions import (
-    square,
-    skew,
-    exp,
-    logcosh,
-    dot_square,
-    dot_skew,
-    dot_exp,
-    dot_logcosh,
-)
+from .utils.decomposition.decompose_electrodes import decompose_electrodes
+from .utils.decomposition.extended_signal import ExtendedSignal
+from .utils.decomposition.workspace import Workspace, peak_working_set, reset_peak_working_set
+from .utils.decomposition.signal_store import SignalStore, chunk_samples, copy_rows
+from .utils.decomposition.stage_cache import CachedEngine, StageCache
 
 np.random.seed(1337)  # Fixes random generation to get same results each time the script is run
 
@@ -56,6 +49,10 @@ class EMG:
         self.dup_thr = 0.3  # Correlation threshold for defining a pair of spike trains as derived from the same MU
         self.refine_mu = 1
         self.dup_bgrids = 0
+        self.ica_block_size = 1  # separation vectors moved together by the fixed point algorithm (1 = one at a time)
+        self.peak_reuse_tol = 0  # cosine distance below which min_cov_isi keeps the previous peaks (0 = always search)
+        self.dtype = np.float64  # precision of the signals and of the decomposition (np.float32 halves the memory)
+        self.out_of_core = 0  # 1 = keep the signals, whitened observations and pulse trains on disk (SignalStore)
         print(f"EMG initialization parameters: its={self.its}, sil_thr={self.sil_thr}, cov_thr={self.cov_thr}")
 
 
@@ -83,6 +80,10 @@ class offline_EMG(EMG):
         self.ied: List[int] = []
         self.emgopt: List[str] = []
         self.ext_number: int = 0
+        self.engine: DecompositionEngine = get_engine("numpy")  # sphering and separation backend
+        self.workspace = Workspace()  # per-interval buffers reused by every electrode
+        self.peak_working_sets: Dict[int, int] = {}  # peak resident set size (bytes) while decomposing each electrode
+        self.store: Optional[SignalStore] = None  # on-disk arrays of the out-of-core mode
         self.plateau_coords: Union[List[int], np.ndarray] = []
         self.mus_in_array: np.ndarray = np.array([])
 
@@ -98,13 +99,107 @@ class offline_EMG(EMG):
             "cov": 0,  # Coefficient of variation
         }
 
-    def open_otb(self, inputfile: str) -> None:
+    def apply_parameters(self, parameters: Dict[str, Any]) -> None:
+        """Map parameters produced by prepare_parameters onto the decomposition settings."""
+        # Map iteration parameters
+        self.its = parameters.get("NITER", 75)
+        self.windows = parameters.get("nwindows", 1)
+
+        # Map mode flags
+        self.ref_exist = 1  # We'll check for target in the signal
+        self.check_emg = parameters.get("checkEMG", 0)
+        self.differential_mode = parameters.get("differentialmode", 0)
+        self.peel_off = parameters.get("peeloff", 0)
+        self.initialisation = parameters.get("initialization", 0)
+        self.cov_filter = parameters.get("covfilter", 1)
+        self.refine_mu = parameters.get("refineMU", 1)
+        self.dup_bgrids = parameters.get("duplicatesbgrids", 0)
+        self.ica_block_size = parameters.get("icablocksize", 1)
+        self.peak_reuse_tol = parameters.get("peakreusetol", 0)
+        self.engine = get_engine(parameters.get("engine", "numpy"))
+        if parameters.get("cachedir"):
+            # sphered batches and separations are reused when only later settings change
+            cache = StageCache(parameters["cachedir"], int(float(parameters.get("cachesize", 2048)) * 2**20))
+            self.engine = CachedEngine(self.engine, cache)
+        self.dtype = precision_dtype(parameters.get("precision", "float64"))
+        self.out_of_core = parameters.get("outofcore", 0)
+        if self.out_of_core and self.store is None:
+            self.store = SignalStore(parameters.get("storedir") or None)
+            self.workspace = Workspace(self.store)
+
+        # Map thresholds
+        self.sil_thr = parameters.get("silthr", 0.9)
+        self.cov_thr = parameters.get("covthr", 0.5)
+        self.dup_thr = parameters.get("duplicatesthresh", 0.3)
+        self.target_thres = parameters.get("thresholdtarget", 0.8)
+        self.ext_factor = parameters.get("nbextchan", 1000)
+        self.edges2remove = parameters.get("edges", 0.5)
+
+    def run_decomposition(self, parameters: Dict[str, Any], progress=None, plot_callback=None) -> None:
+        """
+        Runs the full offline pipeline on an opened file: electrode formatting, channel rejection,
+        batching, per-electrode decomposition and the cross-array duplicate removal.
+
+        Args:
+            parameters: Parameters produced by prepare_parameters (already applied with apply_parameters)
+            progress: Optional callable taking (message, progress fraction or None)
+            plot_callback: Optional plot callback passed to fast_ICA_and_CKC
+        """
+        if progress is None:
+            progress = lambda message, value: None
+
+        # the file may have been opened before the precision was chosen
+        self.signal_dict["data"] = self.signal_dict["data"].astype(self.dtype, copy=False)
+
+        # Send initial progress
+        progress("Formatting electrode configuration...", 0.1)
+
+        # =================== ELECTRODE FORMATTING ===================
+        self.electrode_formatter()  # adds spatial context, and additional filtering
+
+        # Manual rejection (only if enabled)
+        if self.check_emg:
+            progress("Checking EMG quality...", 0.15)
+            self.manual_rejection()
+
+        # =================== BATCHING SIGNAL =======================
+        progress("Batching signal...", 0.2)
+
+        if "target" in self.signal_dict and self.signal_dict["target"] is not None:
+            progress("Target used for batching", 0.2)
+            self.batch_w_target()
+        else:
+            self.batch_wo_target()
+
+        # =================== CONVOLUTIVE SPHERING ==================
+        progress("Beginning decomposition...", 0.25)
+
+        self.signal_dict["diff_data"] = []
+        nwins = int(len(self.plateau_coords) / 2)
+
+        # Electrodes are independent until the cross-array step, so they can be spread over processes
+        decompose_electrodes(
+            self,
+            nwins,
+            cf_type=parameters.get("contrastfunc", "skew"),
+            n_workers=parameters.get("nworkers", 1),
+            blas_threads=parameters.get("blasthreads", 0),
+            progress=progress,
+            plot_callback=plot_callback,
+        )
+
+        # Process across arrays if enabled
+        if self.dup_bgrids and sum(self.mus_in_array) > 0:
+            progress("Processing across arrays...", 0.85)
+            self.post_process_across_arrays()
+
+    def open_otb(self, inputfile: str, dtype=None) -> None:
         """
         Opens OTB file and extracts data.
         This is now a wrapper around the standalone open_otb function.
         """
         print(f"Opening OTB file: {inputfile}")
-        return open_otb(self, inputfile)
+        return open_otb(self, inputfile, self.dtype if dtype is None else dtype, self.store)
 
     def electrode_formatter(self) -> None:
         """
@@ -193,15 +288,8 @@ class offline_EMG(EMG):
                 start_idx = int(self.plateau_coords[interval * 2])
                 end_idx = int(self.plateau_coords[(interval + 1) * 2 - 1]) + 1
 
-                data_slice = self.signal_dict["data"][
-                    self.chans_per_electrode[i] * (electrode - 1) : electrode * self.chans_per_electrode[i],
-                    start_idx:end_idx,
-                ]
-
-                rejected_channels_slice = self.rejected_channels[i] == 1
-
                 # Remove rejected channels
-                batched_data[tracker] = np.delete(data_slice, rejected_channels_slice, 0)
+                batched_data[tracker] = self.batch_slice(i, start_idx, end_idx, tracker)
                 tracker += 1
 
         self.signal_dict["batched_data"] = batched_data
@@ -229,237 +317,224 @@ class offline_EMG(EMG):
                 start_idx = int(self.plateau_coords[interval * 2])
                 end_idx = int(self.plateau_coords[(interval + 1) * 2 - 1]) + 1
 
-                data_slice = self.signal_dict["data"][
-                    self.chans_per_electrode[i] * (electrode - 1) : electrode * self.chans_per_electrode[i],
-                    start_idx:end_idx,
-                ]
-
-                rejected_channels_slice = self.rejected_channels[i] == 1
-                batched_data[tracker] = np.delete(data_slice, rejected_channels_slice, 0)
+                batched_data[tracker] = self.batch_slice(i, start_idx, end_idx, tracker)
                 tracker += 1
 
         self.signal_dict["batched_data"] = batched_data
         print(f"Created {len(batched_data)} batched data segments")
 
-    ################################ CONVOLUTIVE SPHERING ########################################
-    def convul_sphering(self, g, interval, tracker):
-        print(f"Starting convolutive sphering for electrode {g+1}, interval {interval+1}")
-
+    def batch_slice(self, i, start_idx, end_idx, tracker):
         """
-        1) Filter the batched EMG data 
-        2) Extend to improve speed of convergence/reduce numerical instability 
-        3) Remove any DC component  
-        4) Whiten
+        The samples start_idx:end_idx of electrode i without its rejected channels. Out of core, only
+        this window is read from the recording, in chunks, into an array of the store.
         """
+        electrode = i + 1
+        rows = np.arange(self.chans_per_electrode[i] * (electrode - 1), electrode * self.chans_per_electrode[i])
+        rejected_channels_slice = self.rejected_channels[i] == 1
 
-        if self.to_filter:
-            # Apply notch and bandpass filters
-            self.signal_dict["batched_data"][tracker] = notch_filter(
-                self.signal_dict["batched_data"][tracker], self.signal_dict["fsamp"]
-            )
-            self.signal_dict["batched_data"][tracker] = bandpass_filter(
-                self.signal_dict["batched_data"][tracker], self.signal_dict["fsamp"], emg_type=self.emgopt[g]
-            )
-
-        # differentiation - typical EMG generation model treats low amplitude spikes/MUs as noise
-        if self.differential_mode:  # just a basic 1st order differential (bipolar processing)
-            self.signal_dict["batched_data"][tracker] = np.diff(self.signal_dict["batched_data"][tracker], n=1, axis=-1)
+        if self.store is None:
+            data_slice = self.signal_dict["data"][rows[0] : rows[-1] + 1, start_idx:end_idx]
+            return np.delete(data_slice, rejected_channels_slice, 0)
 
-        # signal extension - increasing the number of channels to 1000
-        # Holobar 2007 -  Multichannel Blind Source Separation using Convolutive Kernel Compensation
-        extension_factor = int(np.round(self.ext_factor / len(self.signal_dict["batched_data"][tracker])))
-        self.ext_number = extension_factor
+        rows = rows[~rejected_channels_slice]
+        batch = self.store.create(f"batch_{tracker}", (len(rows), end_idx - start_idx), self.signal_dict["data"].dtype)
+        return copy_rows(self.signal_dict["data"], rows, start_idx, end_idx, batch)
 
-        # Extend EMG observations
-        self.signal_dict["extend_obvs_old"][interval] = extend_emg(
-            self.signal_dict["extend_obvs_old"][interval], self.signal_dict["batched_data"][tracker], extension_factor
+    ################################ CONVOLUTIVE SPHERING ########################################
+    def engine_parameters(self, g, cf_type="skew") -> DecompositionParameters:
+        """Settings of electrode g for the decomposition engine."""
+        return DecompositionParameters(
+            fsamp=self.signal_dict["fsamp"],
+            extended_channels=self.ext_factor,
+            edges2remove=self.edges2remove,
+            to_filter=bool(self.to_filter),
+            emg_type=self.emgopt[g] if g < len(self.emgopt) else "surface",
+            differential_mode=self.differential_mode,
+            its=self.its,
+            cf_type=cf_type,
+            initialisation=self.initialisation,
+            peel_off=self.peel_off,
+            sil_thr=self.sil_thr,
+            cov_thr=self.cov_thr,
+            cov_filter=self.cov_filter,
+            ica_block_size=self.ica_block_size,
+            peak_reuse_tol=self.peak_reuse_tol,
+            dtype=self.dtype,
+            chunk_samples=self.chunk_samples(),
         )
 
-        # Compute signal covariance matrix
-        self.signal_dict["sq_extend_obvs"][interval] = (
-            self.signal_dict["extend_obvs_old"][interval] @ self.signal_dict["extend_obvs_old"][interval].T
-        ) / np.shape(self.signal_dict["extend_obvs_old"][interval])[1]
-
-        # Compute pseudoinverse
-        self.signal_dict["inv_extend_obvs"][interval] = np.linalg.pinv(self.signal_dict["sq_extend_obvs"][interval])
+    def chunk_samples(self) -> int:
+        """Columns of a (extended) signal processed at a time: all of them unless out of core."""
+        if self.store is None:
+            return 0
+        return chunk_samples(max(self.ext_factor, 1), np.dtype(self.dtype).itemsize)
 
-        # de-mean the extended emg observation matrix
-        self.signal_dict["extend_obvs_old"][interval] = scipy.signal.detrend(
-            self.signal_dict["extend_obvs_old"][interval], axis=-1, type="constant", bp=0
-        )
-
-        # whiten the signal
-        (
-            self.decomp_dict["whitened_obvs_old"][interval],
-            self.decomp_dict["whiten_mat"][interval],
-            self.decomp_dict["dewhiten_mat"][interval],
-        ) = whiten_emg(self.signal_dict["extend_obvs_old"][interval])
+    def convul_sphering(self, g, interval, tracker):
+        """
+        Filters, extends and whitens batch tracker with the engine (engine.prepare) and stores the
+        result for the interval in signal_dict / decomp_dict.
+        """
+        print(f"Starting convolutive sphering for electrode {g+1}, interval {interval+1}")
 
-        # remove the edges
-        edge_samples = int(np.round(self.signal_dict["fsamp"] * self.edges2remove))
+        params = self.engine_parameters(g)
+        batch = self.signal_dict["batched_data"][tracker]
+        whitened = self.workspace.array(f"whitened_{interval}", params.whitened_shape(*np.shape(batch)), params.dtype)
 
-        self.signal_dict["extend_obvs"][interval] = self.signal_dict["extend_obvs_old"][interval][
-            :,
-            edge_samples - 1 : -edge_samples,
-        ]
+        sphered = self.engine.prepare(batch, params, out=whitened)
+        self.ext_number = sphered.ext_factor
 
-        self.decomp_dict["whitened_obvs"][interval] = self.decomp_dict["whitened_obvs_old"][interval][
-            :,
-            edge_samples - 1 : -edge_samples,
-        ]
+        self.signal_dict["sq_extend_obvs"][interval] = sphered.covariance
+        self.signal_dict["sphering_eig"][interval] = (*sphered.eig, sphered.extend_mean)
+        self.signal_dict["inv_extend_obvs"][interval] = None
+        self.decomp_dict["whiten_mat"][interval] = sphered.whiten_mat
+        self.decomp_dict["dewhiten_mat"][interval] = sphered.dewhiten_mat
+        self.decomp_dict["whitened_obvs"][interval] = sphered.whitened
 
         # Update plateau coordinates for first electrode only
         if g == 0:
-            old_start = self.plateau_coords[interval * 2]
-            old_end = self.plateau_coords[(interval + 1) * 2 - 1]
-
-            self.plateau_coords[interval * 2] = old_start + edge_samples - 1
-            self.plateau_coords[(interval + 1) * 2 - 1] = old_end - edge_samples
+            self.trim_plateau_edges(interval)
 
         print(f"Completed convolutive sphering for electrode {g+1}, interval {interval+1}")
 
-    ######################### FAST ICA AND CONVOLUTIVE KERNEL COMPENSATION  ############################################
-
-    def fast_ICA_and_CKC(self, g, interval, tracker, cf_type="square", plot_callback=None):
-        print(f"Starting FastICA for electrode {g+1}, interval {interval+1}, contrast={cf_type}, iterations={self.its}")
-
-        init_its = np.zeros([self.its], dtype=int)  # tracker of initialisaitons of separation vectors across iterations
-        fpa_its = 500  # maximum number of iterations for the fixed point algorithm
-
-        Z = np.array(self.decomp_dict["whitened_obvs"][interval]).copy()
-        time_axis = np.linspace(0, np.shape(Z)[1], np.shape(Z)[1]) / self.signal_dict["fsamp"]
-
-        # Choose contrast function
-        if cf_type == "square":
-            cf, dot_cf = square, dot_square
-        elif cf_type == "skew":
-            cf, dot_cf = skew, dot_skew
-        elif cf_type == "exp":
-            cf, dot_cf = exp, dot_exp
-        elif cf_type == "logcosh":
-            cf, dot_cf = logcosh, dot_logcosh
-
-        for i in range(self.its):
-
-            #################### FIXED POINT ALGORITHM #################################
-            if self.initialisation:
-                # generate a random vector
-                random_init = np.random.randn(
-                    self.decomp_dict["whitened_obvs"][interval].shape[0],
-                    self.decomp_dict["whitened_obvs"][interval].shape[0],
-                )
-                self.decomp_dict["w_sep_vect"] = random_init[:, 0]
-            else:
-                if i == 0:
-                    # identify the time instant at which the maximum of the squared summation of all whitened extended observation vectors
-                    sort_sq_sum_Z = np.argsort(np.square(np.sum(Z, axis=0)))
-
-                init_its[i] = sort_sq_sum_Z[-(i + 1)]
-                self.decomp_dict["w_sep_vect"] = Z[:, int(init_its[i])].copy()
-
-            # orthogonalise and normalize separation vector
-            self.decomp_dict["w_sep_vect"] -= np.dot(
-                self.decomp_dict["B_sep_mat"] @ self.decomp_dict["B_sep_mat"].T, self.decomp_dict["w_sep_vect"]
-            )
-            self.decomp_dict["w_sep_vect"] /= np.linalg.norm(self.decomp_dict["w_sep_vect"])
-
-            # use the fixed point algorithm to identify consecutive separation vectors
-            self.decomp_dict["w_sep_vect"] = fixed_point_alg(
-                self.decomp_dict["w_sep_vect"], self.decomp_dict["B_sep_mat"], Z, cf, dot_cf, fpa_its
+    def inverse_covariance(self, interval):
+        """
+        Pseudoinverse of the extended covariance of an interval (signal_dict["sq_extend_obvs"]),
+        computed on first use from the sphering eigendecomposition.
+        """
+        if self.signal_dict["inv_extend_obvs"][interval] is None:
+            evalues, evectors, extend_mean = self.signal_dict["sphering_eig"][interval]
+            self.signal_dict["inv_extend_obvs"][interval] = inverse_extended_covariance(
+                self.signal_dict["sq_extend_obvs"][interval], (evalues, evectors), extend_mean
             )
 
-            # get the first iteration of spikes using k means ++
-            fICA_source, spikes = get_spikes(self.decomp_dict["w_sep_vect"], Z, self.signal_dict["fsamp"])
+        return self.signal_dict["inv_extend_obvs"][interval]
 
-            ################# MINIMISATION OF COV OF DISCHARGES ############################
-            if len(spikes) > 1:
-                # determine the interspike interval
-                ISI = np.diff(spikes / self.signal_dict["fsamp"])
-                # determine the coefficient of variation
-                CoV = np.std(ISI) / np.mean(ISI)
+    def trim_plateau_edges(self, interval):
+        """Moves the plateau coordinates of an interval inwards by the edges removed after whitening."""
+        edge_samples = int(np.round(self.signal_dict["fsamp"] * self.edges2remove))
 
-                # update the sepearation vector by summing all the spikes
-                w_n_p1 = np.sum(Z[:, spikes], axis=1)
+        old_start = self.plateau_coords[interval * 2]
+        old_end = self.plateau_coords[(interval + 1) * 2 - 1]
 
-                # minimisation of covariance of interspike intervals
-                self.decomp_dict["MU_filters"][interval][:, i], spikes, self.decomp_dict["CoVs"][interval, i] = (
-                    min_cov_isi(w_n_p1, self.decomp_dict["B_sep_mat"], Z, self.signal_dict["fsamp"], CoV, spikes)
-                )
+        self.plateau_coords[interval * 2] = old_start + edge_samples - 1
+        self.plateau_coords[(interval + 1) * 2 - 1] = old_end - edge_samples
 
-                self.decomp_dict["B_sep_mat"][:, i] = self.decomp_dict["w_sep_vect"].real
+    def decompose_electrode(self, g, tracker, nwins, cf_type="skew", progress=None, plot_callback=None):
+        """
+        Runs sphering, FastICA and post-processing over all intervals of one electrode.
+
+        Args:
+            g: Electrode index
+            tracker: Index of the electrode's first interval in signal_dict["batched_data"]
+            nwins: Number of intervals per electrode
+            cf_type: Contrast function passed to fast_ICA_and_CKC
+            progress: Optional callable taking (message, progress fraction or None)
+            plot_callback: Optional plot callback passed to fast_ICA_and_CKC
+        """
+        nelectrodes = self.signal_dict["nelectrodes"]
+        electrode_progress = 0.25 + (0.6 * g / nelectrodes)
+        if progress is not None:
+            progress(f"Processing electrode {g+1}/{nelectrodes}", electrode_progress)
+        reset_peak_working_set()
+
+        # Per-interval results of the engine, the pseudoinverse of the covariance is computed on request
+        self.signal_dict["sq_extend_obvs"] = [None] * nwins
+        self.signal_dict["inv_extend_obvs"] = [None] * nwins
+        self.signal_dict["sphering_eig"] = [None] * nwins
+        self.decomp_dict["whiten_mat"] = [None] * nwins
+        self.decomp_dict["dewhiten_mat"] = [None] * nwins
+        self.decomp_dict["whitened_obvs"] = [None] * nwins
+        self.decomp_dict["MU_filters"] = [None] * nwins
+        self.decomp_dict["SILs"] = np.zeros([nwins, self.its])
+        self.decomp_dict["CoVs"] = np.zeros([nwins, self.its])
+        self.decomp_dict["masked_mu_filters"] = []
+
+        # For each window interval
+        for interval in range(nwins):
+            interval_progress = electrode_progress + (0.6 / nelectrodes) * (interval / nwins)
+            if progress is not None:
+                progress(f"Electrode {g+1}, interval {interval+1}/{nwins}", interval_progress)
+
+            # Run convolutive sphering
+            self.convul_sphering(g, interval, tracker)
+
+            # Run FastICA with plot callback
+            self.fast_ICA_and_CKC(g, interval, tracker, cf_type=cf_type, plot_callback=plot_callback)
+
+            # Send current progress with SIL/CoV information
+            if progress is not None:
+                sil = np.max(self.decomp_dict["SILs"][interval, :])
+                cov = np.min(self.decomp_dict["CoVs"][interval, :])
+                progress(f"Electrode {g+1}, interval {interval+1}: SIL={sil:.4f}, CoV={cov:.4f}", None)
+
+            tracker += 1
+
+        # Post-process this electrode
+        if progress is not None:
+            progress(f"Post-processing electrode {g+1}...", electrode_progress + 0.1)
+        self.post_process_EMG(g)
+
+        self.peak_working_sets[g] = peak_working_set()
+        message = (
+            f"Electrode {g+1}: peak working set {self.peak_working_sets[g] / 2**20:.0f} MB "
+            f"(workspace {self.workspace.nbytes / 2**20:.0f} MB)"
+        )
+        print(message)
+        if progress is not None:
+            progress(message, None)
 
-                # calculate SIL
-                fICA_source, spikes, self.decomp_dict["SILs"][interval, i] = get_silhouette(
-                    self.decomp_dict["MU_filters"][interval][:, i], Z, self.signal_dict["fsamp"]
-                )
+    ######################### FAST ICA AND CONVOLUTIVE KERNEL COMPENSATION  ############################################
 
-                # peel off
-                if self.peel_off == 1 and self.decomp_dict["SILs"][interval, i] > self.sil_thr:
-                    Z = peel_off(Z, spikes, self.signal_dict["fsamp"])
+    def fast_ICA_and_CKC(self, g, interval, tracker, cf_type="square", plot_callback=None):
+        """
+        Runs the engine's source separation (engine.separate) on the whitened observations of the interval
+        and stores the MU filters, SILs, CoVs and the filters meeting the thresholds in decomp_dict.
+        """
+        print(f"Starting FastICA for electrode {g+1}, interval {interval+1}, contrast={cf_type}, iterations={self.its}")
 
-                print(
-                    f"Iteration {i+1}/{self.its} - SIL: {self.decomp_dict['SILs'][interval, i]:.4f}, "
-                    f"CoV: {self.decomp_dict['CoVs'][interval, i]:.4f}, Spikes: {len(spikes)}"
+        whitened = self.decomp_dict["whitened_obvs"][interval]
+        sphered = SpheredBatch(
+            whitened,
+            self.decomp_dict["whiten_mat"][interval],
+            self.decomp_dict["dewhiten_mat"][interval],
+            self.signal_dict["sq_extend_obvs"][interval],
+            self.signal_dict["sphering_eig"][interval][2],
+            self.signal_dict["sphering_eig"][interval][:2],
+            self.ext_number,
+        )
+        time_axis = np.linspace(0, np.shape(whitened)[1], np.shape(whitened)[1]) / self.signal_dict["fsamp"]
+
+        def on_iteration(i, fICA_source, spikes, sil, cov):
+            # Store data for plotting
+            self.current_plot_data = {
+                "g": g,
+                "interval": interval,
+                "iteration": i,
+                "time_axis": time_axis,
+                "fICA_source": fICA_source,
+                "spikes": spikes,
+                "sil": sil,
+                "cov": cov,
+            }
+
+            # Call the plot callback if provided
+            if plot_callback is not None and self.drawing_mode:
+                plot_callback(
+                    time_axis, self.signal_dict["target"], self.plateau_coords, fICA_source, spikes, time_axis, sil, cov
                 )
 
-                # Store data for plotting
-                self.current_plot_data = {
-                    "g": g,
-                    "interval": interval,
-                    "iteration": i,
-                    "time_axis": time_axis,
-                    "fICA_source": fICA_source,
-                    "spikes": spikes,
-                    "sil": self.decomp_dict["SILs"][interval, i],
-                    "cov": self.decomp_dict["CoVs"][interval, i],
-                }
-
-                # Call the plot callback if provided
-                if plot_callback is not None and self.drawing_mode:
-                    plot_callback(
-                        time_axis,
-                        self.signal_dict["target"],
-                        self.plateau_coords,
-                        fICA_source,
-                        spikes,
-                        time_axis,
-                        self.decomp_dict["SILs"][interval, i],
-                        self.decomp_dict["CoVs"][interval, i],
-                    )
-
-            else:
-                print(f"Electrode #{g+1} - Iteration #{i+1} - less than 10 spikes")
-                # without enough spikes, we skip minimising the covariation of discharges
-                self.decomp_dict["B_sep_mat"][:, i] = self.decomp_dict["w_sep_vect"].real
-
-        ####################################### MU FILTER THRESHOLDING ###############################################
+        result = self.engine.separate(sphered, self.engine_parameters(g, cf_type), on_iteration)
 
-        # Apply thresholds
-        print("\nApplying thresholds to MU filters...")
-        SIL_condition = self.decomp_dict["SILs"][interval, :] >= self.sil_thr
-        final_condition = SIL_condition.copy()
+        self.decomp_dict["MU_filters"][interval] = result.mu_filters
+        self.decomp_dict["SILs"][interval, :] = result.sils
+        self.decomp_dict["CoVs"][interval, :] = result.covs
+        self.decomp_dict["masked_mu_filters"].append(result.accepted_filters)
 
         if self.cov_filter:
-            CoV_condition = self.decomp_dict["CoVs"][interval, :] <= self.cov_thr
-            final_condition = SIL_condition & CoV_condition
-            print(f"Units meeting both criteria: {np.sum(final_condition)}/{self.its}")
-
-        mask = np.broadcast_to(
-            final_condition.reshape(1, -1), (np.shape(self.decomp_dict["whitened_obvs"][interval])[0], self.its)
-        )
-
-        if np.sum(final_condition) > 0:
-            self.decomp_dict["masked_mu_filters"].append(
-                self.decomp_dict["MU_filters"][interval][mask].reshape(
-                    np.shape(self.decomp_dict["whitened_obvs"][interval])[0], np.sum(mask, axis=1)[0]
-                )
-            )
-            print(f"Extracted {np.sum(final_condition)} motor units that meet thresholds")
+            print(f"Units meeting both criteria: {np.sum(result.accepted)}/{self.its}")
+        if np.any(result.accepted):
+            print(f"Extracted {np.sum(result.accepted)} motor units that meet thresholds")
         else:
-            # Create an empty array with proper dimensions to avoid errors later
-            self.decomp_dict["masked_mu_filters"].append(
-                np.zeros((np.shape(self.decomp_dict["whitened_obvs"][interval])[0], 0))
-            )
             print("WARNING: No motor units met the threshold criteria")
 
         print(f"FastICA and CKC completed for electrode {g+1}, interval {interval+1}")
@@ -472,7 +547,7 @@ class offline_EMG(EMG):
         self.mus_in_array = np.zeros(self.signal_dict["nelectrodes"])
         electrode += 1
 
-        # batch processing over each window
+        # batch processing over each window, out of core the pulse trains are written to the store
         pulse_trains, discharge_times = batch_process_filters(
             self.decomp_dict["whitened_obvs"],
             self.decomp_dict["masked_mu_filters"],
@@ -481,6 +556,9 @@ class offline_EMG(EMG):
             self.differential_mode,
             np.shape(self.signal_dict["data"])[1],
             self.signal_dict["fsamp"],
+            out=self.pulse_train_array(
+                f"pulse_trains_{electrode}", sum(np.shape(f)[1] for f in self.decomp_dict["masked_mu_filters"])
+            ),
         )
 
         if pulse_trains.size > 0:  # if there are existing MUs
@@ -521,6 +599,8 @@ class offline_EMG(EMG):
                     pulse_trains_new,
                     discharge_times_new,
                     self.signal_dict["fsamp"],
+                    out=self.pulse_train_array(f"refined_pulse_trains_{electrode}", len(pulse_trains_new)),
+                    chunk_samples=self.chunk_samples(),
                 )
 
                 # removing outliers second pass
@@ -528,7 +608,7 @@ class offline_EMG(EMG):
                     pulse_trains_new, discharge_times_new, self.signal_dict["fsamp"], self.cov_thr
                 )
 
-            print(f"Adding {np.shape(pulse_trains_new)[0]} pulse trains to results")
+            print(f"Adding {len(pulse_trains_new)} pulse trains to results")
             self.mu_dict["pulse_trains"].append(pulse_trains_new)
         else:
             print(f"No motor units found for electrode {electrode}")
@@ -544,6 +624,19 @@ class offline_EMG(EMG):
 
         print(f"Post-processing completed for electrode {electrode}")
 
+    def pulse_train_array(self, name, nmus):
+        """Zeroed array of the store for nmus full-length pulse trains, or None to keep them in memory."""
+        if self.store is None:
+            return None
+        return self.store.create(name, (nmus, np.shape(self.signal_dict["data"])[1]), self.dtype)
+
+    def close_store(self):
+        """Removes the on-disk arrays of the out-of-core mode (once the results have been saved)."""
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+            self.workspace = Workspace()
+
     def post_process_EMG_for_biofeedback(self, electrode, interval):
         print(f"Starting biofeedback post-processing for electrode {electrode+1}")
 
@@ -555,6 +648,17 @@ class offline_EMG(EMG):
             self.decomp_dict["dewhiten_mat"][interval] @ self.decomp_dict["masked_mu_filters"]
         )
 
+        # the extended signal of the electrode and its covariance pseudoinverse, shared by every step below
+        # (extended as in the decomposition, so that the dewhitened MU filters apply to it)
+        extended = ExtendedSignal.for_electrode(
+            self.signal_dict["data"],
+            self.rejected_channels,
+            self.chans_per_electrode,
+            electrode - 1,
+            nbextchan=self.ext_factor,
+            chunk_samples=self.chunk_samples(),
+        )
+
         # get the pulse train for the entire signal
         pulse_trains, discharge_times, ext_factor = get_pulse_trains(
             self.signal_dict["data"],
@@ -563,6 +667,7 @@ class offline_EMG(EMG):
             self.chans_per_electrode,
             self.signal_dict["fsamp"],
             electrode - 1,
+            extended=extended,
         )
 
         if np.shape(pulse_trains)[0] > 0:  # if there are existing MUs
@@ -591,16 +696,18 @@ class offline_EMG(EMG):
                 discharge_times_new,
                 self.chans_per_electrode,
                 electrode - 1,
+                extended=extended,
             )
 
-            # find the pulse trains again
+            # find the pulse trains again, with the filters of the remaining MUs
             pulse_trains, discharge_times, _ = get_pulse_trains(
                 self.signal_dict["data"],
                 self.rejected_channels,
-                self.decomp_dict["masked_mu_filters"],
+                new_mu_filters,
                 self.chans_per_electrode,
                 self.signal_dict["fsamp"],
                 electrode - 1,
+                extended=extended,
             )
 
             # get online parameters
@@ -611,6 +718,7 @@ class offline_EMG(EMG):
                 self.chans_per_electrode,
                 self.signal_dict["fsamp"],
                 electrode - 1,
+                extended=extended,
             )
 
             # Save parameters to MU dictionary
@@ -655,7 +763,12 @@ class offline_EMG(EMG):
             print("No motor units found, skipping cross-array processing")
             return
 
-        all_pulse_trains = np.zeros([mu_count, np.shape(self.signal_dict["target"])[0]])
+        if self.store is None:
+            all_pulse_trains = np.zeros([mu_count, np.shape(self.signal_dict["target"])[0]])
+        else:
+            all_pulse_trains = self.store.create(
+                "all_pulse_trains", (mu_count, np.shape(self.signal_dict["target"])[0])
+            )
         all_discharge_times = []  # different mus will have discharge time arrays of different lengths
         muscle = np.zeros(mu_count, dtype=int)
 
@@ -676,7 +789,7 @@ class offline_EMG(EMG):
                     mu += 1
 
         print("Removing duplicates across arrays...")
-        discharge_times_new, pulse_trains_new, muscle_new = remove_duplicates_between_arrays(
+        discharge_times_new, pulse_trains_new, muscle_new, similarity = remove_duplicates_between_arrays(
             all_pulse_trains,
             all_discharge_times,
             muscle,
@@ -686,6 +799,7 @@ class offline_EMG(EMG):
             self.signal_dict["fsamp"],
         )
         print(f"After duplicate removal: {len(discharge_times_new)} motor units")
+        self.mu_dict["duplicate_similarity"] = similarity  # common discharges of all pairs of MUs, across arrays
 
         # Regroup motor units by electrode
         print("Regrouping motor units by electrode...")
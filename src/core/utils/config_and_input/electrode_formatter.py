@@ -1,6 +1,5 @@
 import numpy as np
-from core.utils.decomposition.notch_filter import notch_filter
-from core.utils.decomposition.bandpass_filter import bandpass_filter
+from core.utils.decomposition.signal_store import filter_rows
 from typing import TYPE_CHECKING, Any, Dict, List, Union, Tuple
 
 if TYPE_CHECKING:
@@ -25,9 +24,14 @@ def electrode_formatter(emg_obj: "offline_EMG") -> None:
     r_map = []
     rejected_channels = []
     chans_per_electrode = []
-    emg_obj.signal_dict["filtered_data"] = np.zeros(
-        [np.shape(emg_obj.signal_dict["data"])[0], np.shape(emg_obj.signal_dict["data"])[1]]
-    )
+    store = getattr(emg_obj, "store", None)
+    data_shape = np.shape(emg_obj.signal_dict["data"])
+    if store is None:
+        emg_obj.signal_dict["filtered_data"] = np.zeros(data_shape, dtype=emg_obj.signal_dict["data"].dtype)
+    else:
+        emg_obj.signal_dict["filtered_data"] = store.create(
+            "filtered_data", data_shape, emg_obj.signal_dict["data"].dtype
+        )
     print(f"Initialized filtered_data with shape {emg_obj.signal_dict['filtered_data'].shape}")
 
     for i in range(emg_obj.signal_dict["nelectrodes"]):
@@ -238,27 +242,16 @@ def electrode_formatter(emg_obj: "offline_EMG") -> None:
         electrode = i + 1
         print(f"Filtering data for electrode {electrode}...")
 
-        # notch filtering
+        # notch and bandpass filtering (out of core a few channels at a time)
         print(f"Applying notch filter to electrode {electrode}...")
-        emg_obj.signal_dict["filtered_data"][
-            chans_per_electrode[i] * (electrode - 1) : electrode * chans_per_electrode[i], :
-        ] = notch_filter(
-            emg_obj.signal_dict["data"][
-                chans_per_electrode[i] * (electrode - 1) : electrode * chans_per_electrode[i], :
-            ],
-            emg_obj.signal_dict["fsamp"],
-        )
-
-        # bandpass filtering
         print(f"Applying bandpass filter to electrode {electrode} with type {emg_obj.emgopt[i]}...")
-        emg_obj.signal_dict["filtered_data"][
-            chans_per_electrode[i] * (electrode - 1) : electrode * chans_per_electrode[i], :
-        ] = bandpass_filter(
-            emg_obj.signal_dict["filtered_data"][
-                chans_per_electrode[i] * (electrode - 1) : electrode * chans_per_electrode[i], :
-            ],
+        rows = slice(chans_per_electrode[i] * (electrode - 1), electrode * chans_per_electrode[i])
+        filter_rows(
+            emg_obj.signal_dict["data"][rows, :],
             emg_obj.signal_dict["fsamp"],
             emg_type=emg_obj.emgopt[i],
+            out=emg_obj.signal_dict["filtered_data"][rows, :],
+            chunked=store is not None,
         )
 
     emg_obj.c_maps = c_map
@@ -1,4 +1,4 @@
-import glob, os
+import os
 import xml.etree.ElementTree as ET
 import tarfile as tf
 import numpy as np
@@ -7,155 +7,128 @@ from typing import TYPE_CHECKING, Any, Dict, List, Union, Tuple
 if TYPE_CHECKING:
     from EmgDecomposition import offline_EMG
 
+# number of samples converted to microvolts at a time, bounds the temporary memory of the conversion
+CHUNK_SAMPLES = 1 << 16
 
-def open_otb(emg_obj: "offline_EMG", inputfile: str) -> None:
+
+def open_otb(emg_obj: "offline_EMG", inputfile: str, dtype=np.float64, store=None) -> None:
     """
     Opens OTB file and extracts data.
     Moved from offline_EMG class to a standalone function.
 
+    The archive members are read straight from the tar: nothing is extracted to disk, and for
+    uncompressed archives the .sig samples are memory-mapped and converted to microvolts in
+    blocks, so only the output array is held in memory. With a SignalStore the output array is
+    an array of the store, so the recording is never held in memory at once.
+
     Args:
         emg_obj: Instance of offline_EMG class
         inputfile: Path to the input OTB file
+        dtype: Floating point type of the EMG data (float64, or float32 to halve the memory)
+        store: Optional SignalStore to write the EMG data into (out-of-core mode)
     """
     print(inputfile)
-    file_name = inputfile.split("/")[1]
-    temp_dir = os.path.join(emg_obj.save_dir, "temp_tarholder")
-    print(f"Using temporary directory: {temp_dir}")
 
-    # make a temporary directory to store the data of the otb file if it doesn't exist yet
-    if not os.path.isdir(temp_dir):
-        print(f"Creating temp directory {temp_dir}")
-        os.mkdir(temp_dir)
-
-    # Open the .tar file and extract all data
-    print("Extracting OTB archive...")
     with tf.open(inputfile, "r") as emg_tar:
-        emg_tar.extractall(temp_dir)
-    print("Extraction complete")
-
-    # os.chdir(temp_dir)
-    sig_files = [f for f in os.listdir(temp_dir) if f.endswith(".sig")]
-    print(f"Found {len(sig_files)} signal files: {sig_files}")
-    trial_label_sig = sig_files[0]  # only one .sig so can be used to get the trial name (0 index list->string)
-    trial_label_xml = trial_label_sig.split(".")[0] + ".xml"
-    trial_label_sig = os.path.join(temp_dir, trial_label_sig)
-    trial_label_xml = os.path.join(temp_dir, trial_label_xml)
-    print(f"Using signal file: {trial_label_sig}")
-    print(f"Using XML file: {trial_label_xml}")
-
-    # read the contents of the trial xml file
-    print("Parsing XML configuration...")
-    with open(trial_label_xml, encoding="utf-8") as file:
-        xml = ET.fromstring(file.read())
-
-    # get sampling frequency, no. bits of AD converter, no. channels, electrode names and muscle names
-    root_element = xml.find(".")
-    if root_element is None:
-        raise ValueError("Could not find root element in XML file")
-
-    fsamp = int(root_element.attrib["SampleFrequency"])
-    nADbit = int(root_element.attrib["ad_bits"])
-    nchans = int(root_element.attrib["DeviceTotalChannels"])
-
-    channels_element = xml.find("./Channels")
-    if channels_element is None:
-        raise ValueError("Could not find Channels element in XML file")
-
-    electrode_names = []
-    muscle_names = []
-
-    for child in channels_element:
-        if len(child) > 0 and child[0] is not None:
-            if "ID" in child[0].attrib:
-                electrode_names.append(child[0].attrib["ID"])
-            else:
-                electrode_names.append("Unknown")
-
-            if "Muscle" in child[0].attrib:
-                muscle_names.append(child[0].attrib["Muscle"])
-            else:
-                muscle_names.append("Unknown")
-
-    print(f"Parsed XML: fsamp={fsamp}Hz, nADbit={nADbit}, nchans={nchans}")
-    print(f"Found {len(electrode_names)} electrodes: {electrode_names[:5]}...")
-    print(f"Found {len(muscle_names)} muscles: {muscle_names[:5]}...")
-    print(f"Keeping all electrode names as is.")
-
-    # count the number of electrodes
-    ngrids = sum(1 for name in electrode_names if name.startswith("GR"))
-    nneedles = len(electrode_names) - (
-        sum(
-            1
-            for name in electrode_names
-            if any(substring.lower() in name.lower() for substring in ["aux", "ramp", "buffer"])
+        members = {os.path.basename(member.name): member for member in emg_tar.getmembers() if member.isfile()}
+
+        sig_files = [name for name in members if name.endswith(".sig")]
+        print(f"Found {len(sig_files)} signal files: {sig_files}")
+        trial_label_sig = sig_files[0]  # only one .sig so can be used to get the trial name (0 index list->string)
+        trial_label_xml = trial_label_sig.split(".")[0] + ".xml"
+        print(f"Using signal file: {trial_label_sig}")
+        print(f"Using XML file: {trial_label_xml}")
+
+        # read the contents of the trial xml file
+        print("Parsing XML configuration...")
+        xml = ET.fromstring(emg_tar.extractfile(members[trial_label_xml]).read().decode("utf-8"))
+
+        # get sampling frequency, no. bits of AD converter, no. channels, electrode names and muscle names
+        root_element = xml.find(".")
+        if root_element is None:
+            raise ValueError("Could not find root element in XML file")
+
+        fsamp = int(root_element.attrib["SampleFrequency"])
+        nADbit = int(root_element.attrib["ad_bits"])
+        nchans = int(root_element.attrib["DeviceTotalChannels"])
+
+        channels_element = xml.find("./Channels")
+        if channels_element is None:
+            raise ValueError("Could not find Channels element in XML file")
+
+        electrode_names = []
+        muscle_names = []
+
+        for child in channels_element:
+            if len(child) > 0 and child[0] is not None:
+                if "ID" in child[0].attrib:
+                    electrode_names.append(child[0].attrib["ID"])
+                else:
+                    electrode_names.append("Unknown")
+
+                if "Muscle" in child[0].attrib:
+                    muscle_names.append(child[0].attrib["Muscle"])
+                else:
+                    muscle_names.append("Unknown")
+
+        print(f"Parsed XML: fsamp={fsamp}Hz, nADbit={nADbit}, nchans={nchans}")
+        print(f"Found {len(electrode_names)} electrodes: {electrode_names[:5]}...")
+        print(f"Found {len(muscle_names)} muscles: {muscle_names[:5]}...")
+        print(f"Keeping all electrode names as is.")
+
+        # count the number of electrodes
+        ngrids = sum(1 for name in electrode_names if name.startswith("GR"))
+        nneedles = len(electrode_names) - (
+            sum(
+                1
+                for name in electrode_names
+                if any(substring.lower() in name.lower() for substring in ["aux", "ramp", "buffer"])
+            )
+            + ngrids
         )
-        + ngrids
-    )
-    nelectrodes = nneedles + ngrids
-    print(f"Electrode counts: grids={ngrids}, needles={nneedles}, total={nelectrodes}")
-
-    # read in the EMG trial data
-    print("Reading EMG data...")
-    emg_data = np.fromfile(open(trial_label_sig), dtype="int" + str(nADbit))
-
-    # need to reshape because it is read as a stream
-    emg_data = np.transpose(emg_data.reshape(int(len(emg_data) / nchans), nchans))
-    emg_data = emg_data.astype(float)  # needed otherwise you just get an integer from the bits to microvolt division
-    print(f"EMG data shape: {emg_data.shape}")
-
-    # convert the data from bits to microvolts
-    print("Converting data from bits to microvolts...")
-    for i in range(nchans):
-        emg_data[i, :] = (np.dot(emg_data[i, :], 5000)) / (2 ** float(nADbit))  # np.dot is faster than *
-    print("Conversion complete")
-
-    # create a dictionary containing all relevant signal parameters and data
-    signal = dict(
-        data=emg_data,
-        fsamp=fsamp,
-        nchans=nchans,
-        ngrids=ngrids,
-        nneedles=nneedles,
-        nelectrodes=nelectrodes,
-        electrodes=electrode_names[: nneedles + ngrids],
-        muscles=muscle_names[: nneedles + ngrids],
-    )  # discard the other muscle and grid entries, not relevant
-    print(f"Signal dictionary created with {len(signal)} keys")
-
-    # if the signals were recorded with a feedback generated by OTBiolab+, get the target and the path performed by the participant
-    if emg_obj.ref_exist:
-        print("Reference signals exist, loading target and path data...")
-        # only opening the last two .sip files because the first is not needed for analysis
-        # would only need MSE between the participant path (file 2) and the target path (file 3)
-        ######## path #########
-        sip_files = glob.glob(f"{temp_dir}/*.sip")
-        print(f"Found {len(sip_files)} SIP files: {sip_files}")
-        _, path_label, target_label = sorted(sip_files)
-
-        with open(path_label) as file:
-            path = np.fromfile(file, dtype="float64")
-            path = path[: np.shape(emg_data)[1]]
-        print(f"Path data loaded, shape: {path.shape}")
-
-        ######## target ########
-        with open(target_label) as file:
-            target = np.fromfile(file, dtype="float64")
-            target = target[: np.shape(emg_data)[1]]
-        print(f"Target data loaded, shape: {target.shape}")
-
-        signal["path"] = path
-        signal["target"] = target
-        print("Added path and target to signal dictionary")
-
-    # delete the temp_tarholder directory since everything we need has been taken out of it
-    print(f"Cleaning up temporary directory {temp_dir}...")
-    for file_name in os.listdir(temp_dir):
-        file = os.path.join(temp_dir, file_name)
-        if os.path.isfile(file):
-            os.remove(file)
-
-    os.rmdir(temp_dir)
-    print("Temporary directory removed")
+        nelectrodes = nneedles + ngrids
+        print(f"Electrode counts: grids={ngrids}, needles={nneedles}, total={nelectrodes}")
+
+        # read in the EMG trial data and convert it from bits to microvolts
+        print("Reading EMG data...")
+        emg_data = read_sig(emg_tar, members[trial_label_sig], inputfile, nchans, nADbit, dtype, store)
+        print(f"EMG data shape: {emg_data.shape}")
+
+        # create a dictionary containing all relevant signal parameters and data
+        signal = dict(
+            data=emg_data,
+            fsamp=fsamp,
+            nchans=nchans,
+            ngrids=ngrids,
+            nneedles=nneedles,
+            nelectrodes=nelectrodes,
+            electrodes=electrode_names[: nneedles + ngrids],
+            muscles=muscle_names[: nneedles + ngrids],
+        )  # discard the other muscle and grid entries, not relevant
+        print(f"Signal dictionary created with {len(signal)} keys")
+
+        # if the signals were recorded with a feedback generated by OTBiolab+, get the target and the path performed by the participant
+        if emg_obj.ref_exist:
+            print("Reference signals exist, loading target and path data...")
+            # only opening the last two .sip files because the first is not needed for analysis
+            # would only need MSE between the participant path (file 2) and the target path (file 3)
+            sip_files = sorted(name for name in members if name.endswith(".sip"))
+            print(f"Found {len(sip_files)} SIP files: {sip_files}")
+            _, path_label, target_label = sip_files
+
+            ######## path #########
+            path = np.frombuffer(emg_tar.extractfile(members[path_label]).read(), dtype="float64")
+            path = path[: np.shape(emg_data)[1]].copy()
+            print(f"Path data loaded, shape: {path.shape}")
+
+            ######## target ########
+            target = np.frombuffer(emg_tar.extractfile(members[target_label]).read(), dtype="float64")
+            target = target[: np.shape(emg_data)[1]].copy()
+            print(f"Target data loaded, shape: {target.shape}")
+
+            signal["path"] = path
+            signal["target"] = target
+            print("Added path and target to signal dictionary")
 
     emg_obj.signal_dict = signal
     emg_obj.decomp_dict = {}  # initialising this dictionary here for later use
@@ -164,3 +137,52 @@ def open_otb(emg_obj: "offline_EMG", inputfile: str) -> None:
     emg_obj.mu_dict = dict(pulse_trains=[], discharge_times=[[] for item in range(1)])
 
     return
+
+
+def read_sig(emg_tar, member, inputfile, nchans, nADbit, dtype=np.float64, store=None):
+    """
+    Reads the interleaved samples of a .sig member into a (channels x samples) array in microvolts.
+
+    Uncompressed archives are memory-mapped at the member's offset, compressed ones are streamed;
+    either way the samples are converted block by block without an intermediate integer copy,
+    into memory or into the "data" array of store.
+    """
+    raw_dtype = np.dtype("int" + str(nADbit))
+    nsamples = member.size // (raw_dtype.itemsize * nchans)
+    scale = np.asarray(5000 / 2 ** float(nADbit), dtype=dtype)  # keeps float32 output in float32 arithmetic
+
+    if store is None:
+        emg_data = np.empty([nchans, nsamples], dtype=dtype)
+    else:
+        emg_data = store.create("data", (nchans, nsamples), dtype)
+
+    if not _is_compressed(inputfile):
+        # one mapping per block, so the pages of the file are released as soon as they are converted
+        for start in range(0, nsamples, CHUNK_SAMPLES):
+            stop = min(start + CHUNK_SAMPLES, nsamples)
+            offset = member.offset_data + start * nchans * raw_dtype.itemsize
+            raw = np.memmap(inputfile, dtype=raw_dtype, mode="r", offset=offset, shape=(stop - start, nchans))
+            np.multiply(raw.T, scale, out=emg_data[:, start:stop])
+            del raw
+    else:
+        stream = emg_tar.extractfile(member)
+        chunk_bytes = CHUNK_SAMPLES * nchans * raw_dtype.itemsize
+        start = 0
+        while start < nsamples:
+            block = np.frombuffer(stream.read(chunk_bytes), dtype=raw_dtype)
+            stop = start + len(block) // nchans
+            if stop == start:
+                raise ValueError(f"{member.name} ended after {start} of {nsamples} samples")
+            block = block[: (stop - start) * nchans].reshape(stop - start, nchans)
+            np.multiply(block.T, scale, out=emg_data[:, start:stop])
+            start = stop
+
+    print("Conversion to microvolts complete")
+    return emg_data
+
+
+def _is_compressed(inputfile):
+    """True if the archive is gzip/bz2/xz compressed, in which case it cannot be memory-mapped."""
+    with open(inputfile, "rb") as file:
+        magic = file.read(6)
+    return magic[:2] == b"\x1f\x8b" or magic[:3] == b"BZh" or magic == b"\xfd7zXZ\x00"
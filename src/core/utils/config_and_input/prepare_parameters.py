@@ -18,6 +18,16 @@ def prepare_parameters(ui_params):
     parameters["duplicatesthresh"] = ui_params.get("duplicates_threshold", 0.3)
     parameters["silthr"] = ui_params.get("sil_threshold", 0.9)
     parameters["covthr"] = ui_params.get("cov_threshold", 0.5)
+    parameters["icablocksize"] = ui_params.get("ica_block_size", 1)
+    parameters["peakreusetol"] = ui_params.get("peak_reuse_tol", 0)  # 0 = find the peaks at every CoV step
+    parameters["engine"] = ui_params.get("engine", "numpy")  # decomposition backend, see decomposition_engine.py
+    parameters["precision"] = ui_params.get("precision", "float64")  # "float32" halves the memory of the pipeline
+    parameters["outofcore"] = 1 if ui_params.get("out_of_core") == "Yes" else 0  # keep large arrays on disk
+    parameters["storedir"] = ui_params.get("store_dir", "")  # directory of the on-disk arrays, "" = a temporary one
+    parameters["cachedir"] = ui_params.get("cache_dir", "")  # directory of the stage cache, "" = no cache
+    parameters["cachesize"] = ui_params.get("cache_size", 2048)  # MB of disk used by the stage cache
+    parameters["nworkers"] = ui_params.get("workers", 1)  # processes decomposing electrodes in parallel
+    parameters["blasthreads"] = ui_params.get("blas_threads", 0)  # BLAS threads per process, 0 = share the cores
 
     # Set algorithm-specific parameters
     parameters["CoVDR"] = 0.3  # Threshold for CoV of Discharge rate
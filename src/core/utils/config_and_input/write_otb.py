@@ -0,0 +1,61 @@
+import io
+import tarfile
+import numpy as np
+
+
+def write_otb(filename, raw=None, nchans=64, seconds=20, nmus=0, fsamp=2048, path=None, target=None, seed=0, mode="w"):
+    """
+    Writes a 16 bit .otb+ recording with one grid (GR08MM1305) and the three .sip feedback files,
+    as read by open_otb. Used to make synthetic recordings for the tests and benchmarks.
+
+    Args:
+        filename: path of the archive
+        raw: channels x samples of ADC values; by default nchans x seconds of noise are generated,
+            plus nmus regular spike trains convolved with random MUAPs
+        nchans: number of channels of the generated recording
+        seconds: duration of the generated recording
+        nmus: number of motor units of the generated recording (0 = noise only)
+        fsamp: sampling frequency
+        path: path feedback signal (trial2.sip), zeros by default
+        target: target feedback signal (trial3.sip), ones by default
+        seed: seed of the generated recording
+        mode: tarfile mode, e.g. "w:gz" for a compressed archive
+    """
+    if raw is None:
+        raw = spiking_adc_values(nchans, int(seconds * fsamp), nmus, fsamp, seed)
+
+    nchans, nsamples = np.shape(raw)
+    path = np.zeros(nsamples) if path is None else path
+    target = np.ones(nsamples) if target is None else target
+    xml = (
+        f'<Device SampleFrequency="{fsamp}" ad_bits="16" DeviceTotalChannels="{nchans}">'
+        '<Channels><Adapter><Channel ID="GR08MM1305" Muscle="TA"/></Adapter></Channels></Device>'
+    )
+    members = {
+        "trial.xml": xml.encode(),
+        "trial.sig": np.asarray(raw).T.astype(np.int16).tobytes(),
+        "trial1.sip": np.zeros(nsamples).tobytes(),
+        "trial2.sip": np.asarray(path, dtype=float).tobytes(),
+        "trial3.sip": np.asarray(target, dtype=float).tobytes(),
+    }
+    with tarfile.open(filename, mode) as tar:
+        for name, blob in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(blob)
+            tar.addfile(info, io.BytesIO(blob))
+
+
+def spiking_adc_values(nchans, nsamples, nmus, fsamp, seed):
+    """Noise plus nmus regular spike trains convolved with random MUAPs, in 16 bit ADC values (5 V range)."""
+    rng = np.random.default_rng(seed)
+    data = rng.normal(scale=2.0, size=(nchans, nsamples))
+    for _ in range(nmus):
+        isi = fsamp / rng.uniform(8, 15)
+        discharges = np.cumsum(rng.normal(isi, 0.1 * isi, size=int(nsamples / isi * 1.5))).astype(int)
+        train = np.zeros(nsamples)
+        train[discharges[(discharges > 50) & (discharges < nsamples - 50)]] = 1
+        muap = rng.normal(size=(nchans, 40)) * np.hanning(40) * rng.uniform(5, 20)
+        for chan in range(nchans):
+            data[chan] += np.convolve(train, muap[chan], mode="same")
+
+    return np.round(data / 5000 * 2**16)
@@ -1,6 +1,8 @@
 from .bandpass_filter import bandpass_filter
-from .extend_emg import extend_emg
-from .whiten_emg import whiten_emg
+from .extend_emg import extend_emg, ExtendedEMG
+from .whiten_emg import whiten_emg, whitening_matrices
+from .two_class_kmeans import two_class_kmeans
+from .evaluate_source import evaluate_source
 from .get_spikes import get_spikes
 from .min_cov_isi import min_cov_isi
 from .get_silhouette import get_silhouette
@@ -9,11 +11,26 @@ from .batch_process_filters import batch_process_filters
 from .remove_duplicates import remove_duplicates
 from .remove_duplicates_between_arrays import remove_duplicates_between_arrays
 from .remove_outliers import remove_outliers
+from .extended_signal import ExtendedSignal
 from .refine_mus import refine_mus
 from .get_pulse_trains import get_pulse_trains
 from .get_mu_filters import get_mu_filters
 from .get_online_parameters import get_online_parameters
-from .fixed_point_alg import fixed_point_alg
+from .fixed_point_alg import fixed_point_alg, fixed_point_alg_block
+from .decompose_electrodes import decompose_electrodes
+from .workspace import Workspace, peak_working_set, reset_peak_working_set
+from .signal_store import SignalStore, StoredArray
+from .stage_cache import StageCache, CachedEngine
+from .mu_agreement import match_motor_units, rate_of_agreement
+from .decomposition_engine import (
+    DecompositionEngine,
+    DecompositionParameters,
+    NumpyEngine,
+    SeparationResult,
+    SpheredBatch,
+    get_engine,
+    register_engine,
+)
 from .mathematical_functions import (
     square,
     skew,
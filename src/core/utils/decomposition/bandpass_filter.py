@@ -1,15 +1,49 @@
+import functools
 import numpy as np
 import scipy
 
+# channels filtered at a time, so that the float64 temporaries of sosfiltfilt only hold a few of them
+CHANNEL_BLOCK = 8
 
-def bandpass_filter(signal, fsamp, emg_type="surface"):
+
+def bandpass_filter(signal, fsamp, emg_type="surface", out=None):
     """
     Applies a bandpass filter to EMG signals.
 
     Filters the signal based on the EMG type (surface or intramuscular)
-    with different cutoff frequencies for each type.
+    with different cutoff frequencies for each type. The channels are filtered
+    forwards and backwards CHANNEL_BLOCK at a time, with the filter in second-order
+    sections, and written straight into the result: sosfiltfilt works in float64, so
+    a float32 signal never needs a float64 copy of all its channels.
+
+    Args:
+        signal: EMG signals (channels x samples)
+        fsamp: Sampling frequency
+        emg_type: "surface" or "intra"
+        out: Optional array to write the filtered signals into (may be signal itself)
     """
 
+    sos, padlen = design_bandpass(fsamp, emg_type)
+
+    signal = np.asarray(signal)
+    if out is None:
+        out = np.empty(signal.shape, dtype=np.float32 if signal.dtype == np.float32 else np.float64)
+
+    if signal.ndim < 2:
+        out[...] = scipy.signal.sosfiltfilt(sos, signal, axis=-1, padtype="odd", padlen=padlen)
+        return out
+
+    # each block is read before it is overwritten, so out may be signal itself
+    for first in range(0, signal.shape[0], CHANNEL_BLOCK):
+        block = slice(first, first + CHANNEL_BLOCK)
+        out[block] = scipy.signal.sosfiltfilt(sos, signal[block], axis=-1, padtype="odd", padlen=padlen)
+
+    return out
+
+
+@functools.lru_cache(maxsize=None)
+def design_bandpass(fsamp, emg_type="surface"):
+    """Designs the Butterworth bandpass for a sampling frequency and EMG type, returning (sos, padlen)."""
     if emg_type == "surface":
         lowfreq = 20
         highfreq = 500
@@ -18,18 +52,16 @@ def bandpass_filter(signal, fsamp, emg_type="surface"):
         lowfreq = 100
         highfreq = 4400
         order = 3
+    else:
+        raise ValueError(f"Unknown EMG type {emg_type}")
 
     nyq = fsamp / 2
     lowcut = lowfreq / nyq
     highcut = highfreq / nyq
-    [b, a] = scipy.signal.butter(order, [lowcut, highcut], "bandpass")
     # the cut off frequencies should be inputted as normalised angular frequencies
+    sos = scipy.signal.butter(order, [lowcut, highcut], "bandpass", output="sos")
 
-    filtered_signal = np.zeros([np.shape(signal)[0], np.shape(signal)[1]])
-
-    for chan in range(np.shape(signal)[0]):
-        filtered_signal[chan, :] = scipy.signal.filtfilt(
-            b, a, signal[chan, :], padtype="odd", padlen=3 * (max(len(b), len(a)) - 1)
-        )
+    # same edge padding as filtfilt with the (b, a) form of the filter: 3 * filter order
+    padlen = 3 * 2 * order
 
-    return filtered_signal
+    return sos, padlen
@@ -1,49 +1,52 @@
 import numpy as np
 import scipy
-from sklearn.cluster import KMeans
-from core.utils.decomposition.get_spikes import maxk
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans_groups
+from core.utils.decomposition.evaluate_source import maxk
+from core.utils.decomposition.signal_store import chunk_rows
 
 
-def batch_process_filters(whit_sig, mu_filters, plateau, extender, diff, orig_sig_size, fsamp):
+def batch_process_filters(whit_sig, mu_filters, plateau, extender, diff, orig_sig_size, fsamp, out=None):
     """
     Processes motor unit filters across all signal batches.
 
     Combines filter outputs across all batched windows to create consistent
-    pulse trains and discharge times for the entire signal duration.
+    pulse trains and discharge times for the entire signal duration: the filters of every window
+    are stacked into one matrix and applied to the whitened observations of each window with one
+    matrix product, then all pulse trains are squared, normalised and split into spikes and noise
+    together. With out, a zeroed (MUs x orig_sig_size) array such as one of a SignalStore, the
+    pulse trains are written into it and squared and normalised a few rows at a time.
     """
     mu_count = 0
-    for batch in range(np.shape(whit_sig)[0]):
+    for batch in range(len(whit_sig)):
         mu_count += np.shape(mu_filters[batch])[1]
 
-    pulse_trains = np.zeros([mu_count, orig_sig_size])
-    discharge_times = [None] * mu_count
-    mu_batch_count = 0
-
-    for win_1 in range(np.shape(whit_sig)[0]):
-        for mu_candidate in range(np.shape(mu_filters[win_1])[1]):
-            for win_2 in range(np.shape(whit_sig)[0]):
-
-                pulse_trains[
-                    mu_batch_count, int(plateau[win_2 * 2]) : int(plateau[(win_2 + 1) * 2 - 1]) + extender - diff
-                ] = (np.transpose(mu_filters[win_1][:, mu_candidate]) @ whit_sig[win_1])
-
-            pulse_trains[mu_batch_count, :] = np.multiply(
-                pulse_trains[mu_batch_count, :], abs(pulse_trains[mu_batch_count, :])
-            )
-
-            # peaks variable holds the indices of all peaks
-            peaks, _ = scipy.signal.find_peaks(
-                np.squeeze(pulse_trains[mu_batch_count, :]), distance=np.round(fsamp * 0.005) + 1
-            )
-            pulse_trains[mu_batch_count, :] /= np.mean(maxk(pulse_trains[mu_batch_count, :], 10))
-
-            # two classes: 1) spikes 2) noise
-            kmeans = KMeans(n_clusters=2, init="k-means++", n_init=1).fit(
-                pulse_trains[mu_batch_count, peaks].reshape(-1, 1)
-            )
-            spikes_ind = np.argmax(kmeans.cluster_centers_)
-            discharge_times[mu_batch_count] = peaks[np.where(kmeans.labels_ == spikes_ind)]
-            print(f"Batch processing MU#{mu_batch_count+1} out of {mu_count} MUs")
-            mu_batch_count += 1
+    if out is None:
+        pulse_trains = np.zeros([mu_count, orig_sig_size], dtype=whit_sig[0].dtype if len(whit_sig) else np.float64)
+    else:
+        pulse_trains = out
+    if mu_count == 0:
+        return pulse_trains, []
+
+    # every MU filter applied to the whitened observations of every window
+    filters = np.concatenate([np.asarray(mu_filters[win]) for win in range(len(whit_sig))], axis=1)
+    for win in range(len(whit_sig)):
+        start, stop = int(plateau[win * 2]), int(plateau[(win + 1) * 2 - 1]) + extender - diff
+        pulse_trains[:, start:stop] = filters.T.astype(whit_sig[win].dtype, copy=False) @ whit_sig[win]
+
+    peaks = [None] * mu_count
+    distance = np.round(fsamp * 0.005) + 1
+    for first, last in chunk_rows(mu_count, orig_sig_size, pulse_trains.dtype.itemsize):
+        block = pulse_trains[first:last]  # a view, updated in place
+        block *= np.abs(block)
+
+        # peaks holds the indices of all peaks of each pulse train
+        for mu in range(first, last):
+            peaks[mu], _ = scipy.signal.find_peaks(block[mu - first], distance=distance)
+        block /= np.mean(maxk(block, 10), axis=1, keepdims=True)
+
+    # two classes: 1) spikes 2) noise
+    labels = two_class_kmeans_groups([pulse_trains[mu, peaks[mu]] for mu in range(mu_count)])
+    discharge_times = [peaks[mu][labels[mu] == 1] for mu in range(mu_count)]
+    print(f"Batch processed {mu_count} MUs")
 
     return pulse_trains, discharge_times
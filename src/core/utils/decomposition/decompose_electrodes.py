@@ -0,0 +1,150 @@
+import copy
+import os
+import queue
+import multiprocessing as mp
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from threadpoolctl import threadpool_info, threadpool_limits
+
+
+def decompose_electrodes(
+    emg_obj, nwins, cf_type="skew", n_workers=1, blas_threads=0, progress=None, plot_callback=None
+):
+    """
+    Decomposes every electrode of a batched offline_EMG object and gathers the results into mu_dict.
+
+    With n_workers > 1 the electrodes are fanned out to a pool of worker processes, each limited
+    to blas_threads BLAS threads, and are merged back in electrode order so mu_dict, plateau_coords
+    and mus_in_array end up exactly as after the sequential loop. Progress messages from the workers
+    are forwarded to progress; plot updates are only sent in sequential mode.
+
+    Each electrode runs on its own seed, drawn from NumPy's global generator in electrode order
+    before any work starts, so random initialisation gives the same separations whatever n_workers.
+
+    Args:
+        emg_obj: offline_EMG instance that has already been formatted and batched
+        nwins: Number of intervals per electrode
+        cf_type: Contrast function passed to fast_ICA_and_CKC
+        n_workers: Number of worker processes (1 runs the electrodes one after another in this process)
+        blas_threads: BLAS threads per worker process, 0 shares the caller's BLAS threads evenly between workers
+        progress: Optional callable taking (message, progress fraction or None)
+        plot_callback: Optional plot callback, used in sequential mode only
+    """
+    nelectrodes = int(emg_obj.signal_dict["nelectrodes"])
+    n_workers = max(1, min(int(n_workers), nelectrodes))
+    seeds = np.random.randint(0, 2**31 - 1, size=nelectrodes)
+
+    if n_workers == 1:
+        for g in range(nelectrodes):
+            with electrode_random_state(seeds[g]):
+                emg_obj.decompose_electrode(g, g * nwins, nwins, cf_type, progress, plot_callback)
+        return
+
+    if not blas_threads:
+        blas_threads = max(1, caller_blas_threads() // n_workers)
+
+    # spawn rather than fork: the caller usually has BLAS and Qt threads running
+    context = mp.get_context("spawn")
+    with context.Manager() as manager, ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        messages = manager.Queue()
+        pending = {
+            pool.submit(
+                _decompose_electrode_task,
+                _electrode_snapshot(emg_obj, g, nwins),
+                g,
+                nwins,
+                cf_type,
+                blas_threads,
+                messages,
+                int(seeds[g]),
+            ): g
+            for g in range(nelectrodes)
+        }
+        results = {}
+
+        while pending:
+            done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+            _forward_messages(messages, progress)
+            for future in done:
+                results[pending.pop(future)] = future.result()
+
+        _forward_messages(messages, progress)
+
+    _merge_electrode_results(emg_obj, [results[g] for g in range(nelectrodes)])
+
+
+def caller_blas_threads():
+    """BLAS threads the caller may use: its current threadpool limit (e.g. inside a batch job), or all the cores."""
+    limits = [info["num_threads"] for info in threadpool_info() if info["user_api"] == "blas"]
+    return min(limits) if limits else (os.cpu_count() or 1)
+
+
+@contextmanager
+def electrode_random_state(seed):
+    """Seeds NumPy's global generator for one electrode, restoring the caller's state afterwards."""
+    state = np.random.get_state()
+    np.random.seed(seed)
+    try:
+        yield
+    finally:
+        np.random.set_state(state)
+
+
+def _electrode_snapshot(emg_obj, g, nwins):
+    """Copies the state one electrode needs, with its intervals moved to the front of batched_data."""
+    snapshot = copy.copy(emg_obj)
+    snapshot.signal_dict = {k: v for k, v in emg_obj.signal_dict.items() if k not in ("batched_data", "filtered_data")}
+    snapshot.signal_dict["batched_data"] = emg_obj.signal_dict["batched_data"][g * nwins : (g + 1) * nwins]
+    snapshot.decomp_dict = {}
+    snapshot.mu_dict = dict(pulse_trains=[], discharge_times=[[] for _ in range(max(g, 1))])
+    snapshot.plateau_coords = np.array(emg_obj.plateau_coords, dtype=float).copy()
+    snapshot.drawing_mode = 0
+
+    # sequentially, later electrodes see the plateau already trimmed by the first electrode's sphering
+    if g != 0:
+        for interval in range(nwins):
+            snapshot.trim_plateau_edges(interval)
+
+    return snapshot
+
+
+def _decompose_electrode_task(emg_obj, g, nwins, cf_type, blas_threads, messages, seed):
+    """Runs in a worker process: decomposes one electrode and returns what the merge step needs."""
+
+    def progress(message, value):
+        messages.put((message, value))
+
+    with threadpool_limits(limits=blas_threads), electrode_random_state(seed):
+        emg_obj.decompose_electrode(g, 0, nwins, cf_type, progress)
+
+    return dict(
+        pulse_trains=emg_obj.mu_dict["pulse_trains"],
+        discharge_times=emg_obj.mu_dict["discharge_times"][g],
+        mus_in_array=emg_obj.mus_in_array,
+        plateau_coords=emg_obj.plateau_coords,
+        peak_working_set=emg_obj.peak_working_sets[g],
+    )
+
+
+def _merge_electrode_results(emg_obj, results):
+    """Gathers per-electrode results into mu_dict in electrode order."""
+    for g, result in enumerate(results):
+        emg_obj.mu_dict["pulse_trains"].extend(result["pulse_trains"])
+        if g != 0:
+            emg_obj.mu_dict["discharge_times"].append([])
+        emg_obj.mu_dict["discharge_times"][g].extend(result["discharge_times"])
+        emg_obj.peak_working_sets[g] = result["peak_working_set"]
+
+    emg_obj.plateau_coords = results[0]["plateau_coords"]
+    emg_obj.mus_in_array = results[-1]["mus_in_array"]
+
+
+def _forward_messages(messages, progress):
+    while True:
+        try:
+            message, value = messages.get_nowait()
+        except queue.Empty:
+            return
+        if progress is not None:
+            progress(message, value)
@@ -0,0 +1,338 @@
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+import scipy
+
+from core.utils.decomposition.notch_filter import notch_filter
+from core.utils.decomposition.bandpass_filter import bandpass_filter
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.decomposition.whiten_emg import whitening_matrices
+from core.utils.decomposition.signal_store import filter_rows, scratch_copy
+from core.utils.decomposition.evaluate_source import evaluate_source
+from core.utils.decomposition.get_silhouette import get_silhouette
+from core.utils.decomposition.min_cov_isi import min_cov_isi
+from core.utils.decomposition.peel_off import peel_off
+from core.utils.decomposition.fixed_point_alg import fixed_point_alg, fixed_point_alg_block, deflate_block_vector
+from core.utils.decomposition.mathematical_functions import (
+    square,
+    skew,
+    exp,
+    logcosh,
+    dot_square,
+    dot_skew,
+    dot_exp,
+    dot_logcosh,
+)
+
+CONTRAST_FUNCTIONS = {
+    "square": (square, dot_square),
+    "skew": (skew, dot_skew),
+    "exp": (exp, dot_exp),
+    "logcosh": (logcosh, dot_logcosh),
+}
+
+
+@dataclass
+class DecompositionParameters:
+    """Settings the engines need for one electrode, taken from offline_EMG by offline_EMG.engine_parameters."""
+
+    fsamp: float
+    extended_channels: int = 1000  # target number of channels after extension
+    edges2remove: float = 0.5  # seconds removed at each edge after whitening
+    to_filter: bool = True
+    emg_type: str = "surface"
+    differential_mode: int = 0
+    its: int = 75
+    cf_type: str = "skew"
+    initialisation: int = 0  # 0 = initialise at the maxima of the whitened signals, 1 = random
+    peel_off: int = 0
+    sil_thr: float = 0.9
+    cov_thr: float = 0.5
+    cov_filter: int = 1
+    ica_block_size: int = 1  # > 1 = vectors moved in blocks, then deflated in order (deflate_block_vector)
+    peak_reuse_tol: float = 0
+    fpa_its: int = 500  # maximum number of iterations of the fixed point algorithm
+    dtype: type = np.float64  # precision of the signals, whitened observations and separation (float32 or float64)
+    chunk_samples: int = 0  # out-of-core mode: columns handled at a time (0 = all at once)
+
+    @property
+    def edge_samples(self) -> int:
+        return int(np.round(self.fsamp * self.edges2remove))
+
+    def extension_factor(self, nchans: int) -> int:
+        return int(np.round(self.extended_channels / nchans))
+
+    def whitened_shape(self, nchans: int, nsamples: int) -> Tuple[int, int]:
+        """Shape of the whitened observations of a batch of nchans x nsamples, after the edges are removed."""
+        ext_factor = self.extension_factor(nchans)
+        return nchans * ext_factor, nsamples - self.differential_mode + ext_factor - 1 - 2 * self.edge_samples + 1
+
+
+@dataclass
+class SpheredBatch:
+    """One batch of EMG after filtering, extension and whitening."""
+
+    whitened: np.ndarray  # whitened extended observations without the edges (extended channels x samples)
+    whiten_mat: np.ndarray
+    dewhiten_mat: np.ndarray
+    covariance: np.ndarray  # covariance of the extended observations (not de-meaned)
+    extend_mean: np.ndarray  # row means of the extended observations
+    eig: Tuple[np.ndarray, np.ndarray]  # eigenvalues and eigenvectors of the de-meaned covariance
+    ext_factor: int  # number of delayed copies of each channel
+    _inverse: Optional[np.ndarray] = field(default=None, repr=False)
+
+    def inverse_covariance(self) -> np.ndarray:
+        """Pseudoinverse of covariance, computed on first use (see inverse_extended_covariance)."""
+        if self._inverse is None:
+            self._inverse = inverse_extended_covariance(self.covariance, self.eig, self.extend_mean)
+        return self._inverse
+
+
+@dataclass
+class SeparationResult:
+    """Separation vectors found in one sphered batch, with their scores."""
+
+    mu_filters: np.ndarray  # MU filters in the whitened space (extended channels x iterations)
+    sils: np.ndarray
+    covs: np.ndarray
+    accepted: np.ndarray  # iterations meeting the SIL (and CoV) thresholds
+
+    @property
+    def accepted_filters(self) -> np.ndarray:
+        return self.mu_filters[:, self.accepted]
+
+
+def accepted_separations(sils, covs, params) -> np.ndarray:
+    """Iterations whose SIL (and, with the CoV filter, CoV) meet the thresholds of params."""
+    accepted = np.asarray(sils) >= params.sil_thr
+    if params.cov_filter:
+        accepted &= np.asarray(covs) <= params.cov_thr
+    return accepted
+
+
+def precision_dtype(precision):
+    """Maps a precision parameter ("float32", "float64" or a dtype) onto np.float32 or np.float64."""
+    dtype = np.dtype(precision).type
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Unsupported precision {precision}, use float32 or float64")
+    return dtype
+
+
+def inverse_extended_covariance(covariance, eig, extend_mean):
+    """
+    Pseudoinverse of the extended covariance from the eigendecomposition of its de-meaned version.
+
+    The covariance is the de-meaned one plus the outer product of the means, which a rank one
+    (Sherman-Morrison) update accounts for; rank deficient covariances fall back to pinv.
+    """
+    evalues, evectors = eig
+    if evalues.min() > evalues.max() * 1e-15:
+        inv_demeaned = (evectors / evalues) @ evectors.T
+        projected_mean = inv_demeaned @ extend_mean
+        return inv_demeaned - np.outer(projected_mean, projected_mean) / (1 + extend_mean @ projected_mean)
+
+    return np.linalg.pinv(covariance, hermitian=True)
+
+
+class DecompositionEngine:
+    """
+    Interface of the decomposition backends used by offline_EMG.
+
+    prepare turns one batch of EMG (channels x samples) into a SpheredBatch, and separate runs the
+    source separation on it. Engines hold no per-recording state, so one instance can serve every
+    electrode and worker process.
+    """
+
+    name = "base"
+
+    def prepare(self, batch: np.ndarray, params: DecompositionParameters, out=None) -> SpheredBatch:
+        """out, if given, is an array of params.whitened_shape and dtype to hold the whitened observations."""
+        raise NotImplementedError
+
+    def separate(
+        self, sphered: SpheredBatch, params: DecompositionParameters, callback: Optional[Callable] = None
+    ) -> SeparationResult:
+        """callback, if given, is called as callback(i, source, spikes, sil, cov) after each scored iteration."""
+        raise NotImplementedError
+
+
+class NumpyEngine(DecompositionEngine):
+    """Reference engine: NumPy sphering and the Numba fixed point algorithm with CKC refinement."""
+
+    name = "numpy"
+
+    def prepare(self, batch, params, out=None):
+        """
+        1) Filter the batched EMG data
+        2) Extend to improve speed of convergence/reduce numerical instability
+        3) Remove any DC component
+        4) Whiten
+
+        The covariance and its eigendecomposition are always computed in float64; the filtered batch
+        and the whitened observations are in params.dtype.
+        """
+        if params.to_filter and params.chunk_samples:
+            # out of core, a batch from a store is filtered a few channels at a time into a scratch file
+            batch = filter_rows(batch, params.fsamp, params.emg_type, out=scratch_copy(batch), chunked=True)
+
+        batch = np.asarray(batch, dtype=params.dtype)
+
+        if params.to_filter and not params.chunk_samples:
+            # Apply notch and bandpass filters (notch_filter returns a new array, filtered in place after)
+            batch = notch_filter(batch, params.fsamp)
+            bandpass_filter(batch, params.fsamp, emg_type=params.emg_type, out=batch)
+
+        # differentiation - typical EMG generation model treats low amplitude spikes/MUs as noise
+        if params.differential_mode:  # just a basic 1st order differential (bipolar processing)
+            batch = np.diff(batch, n=1, axis=-1)
+
+        # signal extension - increasing the number of channels to 1000
+        # Holobar 2007 -  Multichannel Blind Source Separation using Convolutive Kernel Compensation
+        extended = ExtendedEMG(batch, params.extension_factor(len(batch)), params.chunk_samples)
+
+        # Compute signal covariance matrix (blockwise, from the lag autocorrelations)
+        covariance = extended.covariance()
+
+        # de-mean the extended emg observations: only the covariance and the projection need it
+        extend_mean = extended.mean()
+        demeaned_cov = covariance - np.outer(extend_mean, extend_mean)
+
+        # whiten the signal, with one eigendecomposition kept for the pseudoinverse (computed on request)
+        eig = scipy.linalg.eigh(demeaned_cov)
+        whiten_mat, dewhiten_mat = whitening_matrices(demeaned_cov, eig)
+
+        # remove the edges, only projecting the columns that are kept
+        edge_samples = params.edge_samples
+        whitened = extended.project(
+            whiten_mat.astype(params.dtype, copy=False), edge_samples - 1, extended.shape[1] - edge_samples, out
+        )
+        whitened -= (whiten_mat @ extend_mean).astype(params.dtype)[:, None]
+
+        return SpheredBatch(whitened, whiten_mat, dewhiten_mat, covariance, extend_mean, eig, extended.ext_factor)
+
+    def separate(self, sphered, params, callback=None):
+        its = params.its
+        cf, dot_cf = CONTRAST_FUNCTIONS[params.cf_type]
+
+        # only peel-off changes the residual, otherwise the whitened observations are used as they are
+        Z = scratch_copy(sphered.whitened) if params.peel_off == 1 else sphered.whitened
+        nextended = np.shape(Z)[0]
+
+        B_sep_mat = np.zeros([nextended, its], dtype=Z.dtype)
+        mu_filters = np.zeros([nextended, its], dtype=Z.dtype)
+        sils = np.zeros(its)
+        covs = np.zeros(its)
+        init_its = np.zeros([its], dtype=int)  # tracker of initialisaitons of separation vectors across iterations
+
+        # with peel-off the residual changes after every accepted vector, so blocks fall back to single vectors
+        block_size = 1 if params.peel_off == 1 else max(1, int(params.ica_block_size))
+
+        for block_start in range(0, its, block_size):
+            block = range(block_start, min(block_start + block_size, its))
+
+            #################### FIXED POINT ALGORITHM #################################
+            w_block = np.zeros([nextended, len(block)], dtype=Z.dtype)
+            for j, i in enumerate(block):
+                if params.initialisation:
+                    # generate a random vector
+                    w_block[:, j] = np.random.randn(nextended, nextended)[:, 0]
+                else:
+                    if i == 0:
+                        # identify the time instant at which the maximum of the squared summation of all whitened extended observation vectors
+                        sort_sq_sum_Z = np.argsort(np.square(np.sum(Z, axis=0)))
+
+                    init_its[i] = sort_sq_sum_Z[-(i + 1)]
+                    w_block[:, j] = Z[:, int(init_its[i])]
+
+            if len(block) == 1:
+                # orthogonalise and normalize separation vector
+                w_sep_vect = w_block[:, 0]
+                w_sep_vect -= np.dot(B_sep_mat @ B_sep_mat.T, w_sep_vect)
+                w_sep_vect /= np.linalg.norm(w_sep_vect)
+
+                # use the fixed point algorithm to identify consecutive separation vectors
+                w_block[:, 0] = fixed_point_alg(w_sep_vect, B_sep_mat, Z, cf, dot_cf, params.fpa_its)
+            else:
+                # the whole block is deflated against the existing sources at once
+                w_block -= B_sep_mat @ (B_sep_mat.T @ w_block)
+                w_block /= np.linalg.norm(w_block, axis=0)
+                w_init = w_block.copy()
+
+                w_block = fixed_point_alg_block(w_block, B_sep_mat, Z, cf, dot_cf, params.fpa_its)
+
+            for j, i in enumerate(block):
+                if j > 0:
+                    # B_sep_mat now holds the earlier vectors of the block, as in the sequential path
+                    w_block[:, j] = deflate_block_vector(
+                        w_block[:, j], w_init[:, j], B_sep_mat, Z, cf, dot_cf, params.fpa_its
+                    )
+                Z = self._evaluate_separation_vector(
+                    w_block[:, j], i, Z, B_sep_mat, mu_filters, sils, covs, params, callback
+                )
+
+        ####################################### MU FILTER THRESHOLDING ###############################################
+        return SeparationResult(mu_filters, sils, covs, accepted_separations(sils, covs, params))
+
+    @staticmethod
+    def _evaluate_separation_vector(w_sep_vect, i, Z, B_sep_mat, mu_filters, sils, covs, params, callback):
+        """
+        Refines separation vector i and scores it.
+
+        Minimises the CoV of the discharges, stores the MU filter, SIL and CoV of iteration i,
+        and peels the source off Z if requested. Returns the (possibly updated) Z.
+        """
+        # get the first iteration of spikes (source, peaks, spike/noise classes and CoV in one pass)
+        evaluation = evaluate_source(w_sep_vect, Z, params.fsamp)
+        spikes = evaluation["spikes"]
+
+        # the deflation uses the vector found by the fixed point algorithm, not the refined MU filter
+        B_sep_mat[:, i] = w_sep_vect.real
+
+        ################# MINIMISATION OF COV OF DISCHARGES ############################
+        if len(spikes) > 1:
+            # update the sepearation vector by summing all the spikes
+            w_n_p1 = np.sum(Z[:, spikes], axis=1)
+
+            # minimisation of covariance of interspike intervals
+            mu_filters[:, i], spikes, covs[i], evaluation = min_cov_isi(
+                w_n_p1,
+                B_sep_mat,
+                Z,
+                params.fsamp,
+                evaluation["cov"],
+                spikes,
+                reuse_tol=params.peak_reuse_tol,
+                return_evaluation=True,
+            )
+
+            # calculate SIL, reusing the last evaluation of min_cov_isi (which is of the MU filter)
+            source, spikes, sils[i] = get_silhouette(mu_filters[:, i], Z, params.fsamp, evaluation)
+
+            # peel off
+            if params.peel_off == 1 and sils[i] > params.sil_thr:
+                Z = peel_off(Z, spikes, params.fsamp)
+
+            print(f"Iteration {i+1}/{params.its} - SIL: {sils[i]:.4f}, CoV: {covs[i]:.4f}, Spikes: {len(spikes)}")
+
+            if callback is not None:
+                callback(i, source, spikes, sils[i], covs[i])
+        else:
+            print(f"Iteration #{i+1} - less than 10 spikes")
+
+        return Z
+
+
+ENGINES: Dict[str, type] = {"numpy": NumpyEngine}
+
+
+def register_engine(engine_class):
+    """Makes an engine class available to get_engine (and the "engine" parameter) under its name."""
+    ENGINES[engine_class.name] = engine_class
+    return engine_class
+
+
+def get_engine(name="numpy"):
+    """Returns a new instance of the engine registered under name."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown decomposition engine {name}, available: {', '.join(sorted(ENGINES))}")
+    return ENGINES[name]()
@@ -0,0 +1,98 @@
+import numpy as np
+import scipy
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+
+
+def evaluate_source(w_n, Z, fsamp, previous=None, reuse_tol=0):
+    """
+    Scores a separation vector with a single pass over the whitened signals.
+
+    Estimates the source w_n.T @ Z (squared, keeping the negatives), finds its peaks at least 20 ms
+    apart and splits them once into spikes and noise, giving everything get_spikes, get_silhouette
+    and min_cov_isi need.
+
+    Args:
+        w_n: Separation vector
+        Z: Whitened signals (extended channels x samples)
+        fsamp: Sampling frequency
+        previous: Optional earlier result of evaluate_source on the same Z
+        reuse_tol: If w_n is within this cosine distance of the vector of previous, the peaks of
+            previous are kept and the source is only evaluated at those peaks (0 = always search)
+
+    Returns:
+        Dictionary with
+            w: the separation vector
+            source: the source normalised by the mean of its 10 largest peaks (None if the peaks were reused)
+            peaks: all peaks of the source
+            heights: the normalised source at the peaks
+            spike_cluster: the peaks of the high cluster
+            spikes: spike_cluster without the outliers above mean + 4 std
+            sil: silhouette of the spike cluster (0 with fewer than two peaks)
+            cov: coefficient of variation of the interspike intervals of spikes (nan with fewer than two spikes)
+    """
+    w_n = np.asarray(w_n)
+
+    if previous is not None and reuse_tol > 0 and cosine_distance(w_n, previous["w"]) < reuse_tol:
+        source_pred = None
+        peaks = previous["peaks"]
+        heights = np.dot(np.transpose(w_n), Z[:, peaks]).real
+        heights = np.multiply(heights, abs(heights))
+    else:
+        source_pred = np.dot(np.transpose(w_n), Z).real
+        source_pred = np.multiply(source_pred, abs(source_pred))  # keep the negatives
+        peaks, _ = scipy.signal.find_peaks(np.squeeze(source_pred), distance=np.round(fsamp * 0.02) + 1)
+        heights = source_pred[peaks]
+
+    norm = np.mean(maxk(heights, 10))
+    heights = heights / norm
+    if source_pred is not None:
+        source_pred /= norm
+
+    if len(peaks) > 1:
+
+        # two classes: 1) spikes 2) noise
+        labels, centroids, inertia = two_class_kmeans(heights)
+        spike_cluster = peaks[labels == 1]
+        spike_heights = heights[labels == 1]
+
+        # remove outliers from the spikes cluster with a std-based threshold
+        spikes = spike_cluster[spike_heights <= np.mean(spike_heights) + 4 * np.std(spike_heights)]
+
+        # difference between the within-cluster sums of point-to-centroid distances; as the spike centroid
+        # is the mean of the spikes, their distances to the noise centroid add n * (centroid gap)^2
+        intra_sums = inertia[1]
+        inter_sums = intra_sums + len(spike_cluster) * (centroids[1] - centroids[0]) ** 2
+        sil = (inter_sums - intra_sums) / max(intra_sums, inter_sums)
+    else:
+        spike_cluster = spikes = peaks
+        sil = 0
+
+    if len(spikes) > 1:
+        # coefficient of variation of the interspike intervals
+        ISI = np.diff(spikes / fsamp)
+        cov = np.std(ISI) / np.mean(ISI)
+    else:
+        cov = np.nan
+
+    return {
+        "w": w_n,
+        "source": source_pred,
+        "peaks": peaks,
+        "heights": heights,
+        "spike_cluster": spike_cluster,
+        "spikes": spikes,
+        "sil": sil,
+        "cov": cov,
+    }
+
+
+def cosine_distance(w_a, w_b):
+    """1 - |cos| of the angle between two separation vectors."""
+    return 1 - abs(np.vdot(w_a, w_b)) / (np.linalg.norm(w_a) * np.linalg.norm(w_b))
+
+
+def maxk(signal, k):
+    """
+    Returns the k largest values in the signal.
+    """
+    return np.partition(signal, -k, axis=-1)[..., -k:]
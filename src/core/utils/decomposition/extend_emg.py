@@ -1,5 +1,8 @@
 import numpy as np
 
+# columns of the extended matrix copied out of the strided view at a time in ExtendedEMG.project
+PROJECT_BLOCK = 2048
+
 
 def extend_emg(extended_template, signal, ext_factor):
     """
@@ -17,3 +20,141 @@ def extend_emg(extended_template, signal, ext_factor):
         extended_template[nchans * i : nchans * (i + 1), i : nobvs + i] = signal
 
     return extended_template
+
+
+def lag_covariance(lags):
+    """
+    The block Toeplitz matrix (R * nchans x R * nchans) of the per-lag autocorrelations lags[k]
+    (R x nchans x nchans), e.g. the covariance of an extended signal from its lag_products.
+    """
+    R, nchans = lags.shape[0], lags.shape[1]
+
+    # blocks for lag differences -(R-1) .. R-1, block (i, j) = A[i - j] (transposed for i < j)
+    blocks = np.concatenate([lags[:0:-1].transpose(0, 2, 1), lags])
+    lag_index = np.arange(R)[:, None] - np.arange(R)[None, :] + R - 1
+    return blocks[lag_index].transpose(0, 2, 1, 3).reshape(R * nchans, R * nchans)
+
+
+class ExtendedEMG:
+    """
+    The extended observation matrix of extend_emg, without building it.
+
+    Row i*nchans + c holds channel c delayed by i samples, over nobvs + R - 1 columns. As every
+    delayed copy is complete, the covariance is block Toeplitz: block (i, j) is the lag i - j
+    autocorrelation of the signal, so it only needs R small products. Projections w.T @ X_ext
+    are multichannel FIR filters, and single columns can be gathered directly from the signal.
+
+    With chunk_samples > 0 (out-of-core mode, e.g. for a signal in a SignalStore) the lag products
+    and the projections walk through the signal chunk_samples columns at a time, so only one chunk
+    of the signal is held in memory.
+    """
+
+    def __init__(self, signal, ext_factor, chunk_samples=0):
+        self.signal = np.asarray(signal)
+        self.ext_factor = int(ext_factor)
+        self.chunk_samples = int(chunk_samples)
+        self.nchans, self.nobvs = self.signal.shape
+        self.shape = (self.nchans * self.ext_factor, self.nobvs + self.ext_factor - 1)
+
+    def toarray(self, out=None):
+        """Materialises the extended matrix (into out if given), identical to extend_emg."""
+        if out is None:
+            out = np.zeros(self.shape, dtype=self.signal.dtype)
+        else:
+            out[...] = 0
+        return extend_emg(out, self.signal, self.ext_factor)
+
+    def view(self):
+        """
+        Read-only strided view of the extended matrix, backed by one zero-padded copy of the signal.
+
+        The samples are stored time-major with the channels reversed, so that moving down one row
+        (next channel, or next delay after the last channel) is a fixed step back in memory.
+        """
+        R = self.ext_factor
+        padded = np.zeros([self.nobvs + 2 * (R - 1), self.nchans], dtype=self.signal.dtype)
+        padded[R - 1 : R - 1 + self.nobvs] = self.signal[::-1].T
+        itemsize = padded.itemsize
+        first = padded[R - 1 :].reshape(-1)[self.nchans - 1 :]  # channel 0 at delay 0, column 0
+        return np.lib.stride_tricks.as_strided(
+            first, shape=self.shape, strides=(-itemsize, self.nchans * itemsize), writeable=False
+        )
+
+    def lag_products(self, dtype=None):
+        """Per-lag autocorrelations A[k] = sum_t x(t) x(t + k).T for k = 0 .. R-1 (accumulated in dtype if given)."""
+        if not self.chunk_samples or self.chunk_samples >= self.nobvs:
+            x = self.signal if dtype is None else self.signal.astype(dtype, copy=False)
+            return np.stack([x[:, : max(self.nobvs - k, 0)] @ x[:, k:].T for k in range(self.ext_factor)])
+
+        # accumulated over chunks of t, each read with the R - 1 samples that follow it
+        lags = None
+        for start in range(0, self.nobvs, self.chunk_samples):
+            stop = min(start + self.chunk_samples, self.nobvs)
+            x = np.asarray(self.signal[:, start : min(stop + self.ext_factor - 1, self.nobvs)], dtype=dtype)
+            if lags is None:
+                lags = np.zeros([self.ext_factor, self.nchans, self.nchans], dtype=x.dtype)
+            for k in range(self.ext_factor):
+                last = min(stop, self.nobvs - k) - start
+                if last > 0:
+                    lags[k] += x[:, :last] @ x[:, k : k + last].T
+        return lags
+
+    def covariance(self, dtype=np.float64):
+        """
+        X_ext @ X_ext.T / ncols, assembled blockwise from the lag autocorrelations. The products are
+        accumulated in float64 by default, also for float32 signals, as the covariance gets inverted.
+        """
+        return lag_covariance(self.lag_products(dtype) / self.shape[1])
+
+    def mean(self):
+        """Row means of the extended matrix (every delayed copy holds the whole signal)."""
+        return np.tile(self.signal.sum(axis=1, dtype=np.float64), self.ext_factor) / self.shape[1]
+
+    def project(self, weights, start=0, stop=None, out=None):
+        """
+        weights @ X_ext[:, start:stop] for one (extended channels,) or several (n x extended channels)
+        filters. A few filters are applied as a multichannel FIR filter (one small product per delay);
+        many filters, e.g. a whitening matrix, as one product per block of columns of the strided view.
+        The result is written into out (n x (stop - start)) if given.
+        """
+        stop = self.shape[1] if stop is None else stop
+        weights = np.asarray(weights)
+        single = weights.ndim == 1
+        weights = np.atleast_2d(weights)
+
+        if out is None:
+            projected = np.empty([weights.shape[0], stop - start], dtype=np.result_type(weights, self.signal))
+        else:
+            projected = out.reshape(weights.shape[0], stop - start)
+
+        if self.chunk_samples and stop - start > self.chunk_samples:
+            # chunk by chunk, each from the slice of the signal its columns are delayed copies of
+            for first in range(start, stop, self.chunk_samples):
+                last = min(first + self.chunk_samples, stop)
+                low = max(0, first - self.ext_factor + 1)
+                part = ExtendedEMG(np.asarray(self.signal[:, low : min(last, self.nobvs)]), self.ext_factor)
+                part.project(weights, first - low, last - low, out=projected[:, first - start : last - start])
+        elif weights.shape[0] <= self.nchans:
+            projected[...] = 0
+            lagged = weights.reshape(-1, self.ext_factor, self.nchans)
+            for i in range(self.ext_factor):
+                # output column t takes signal sample t - i
+                first, last = max(start, i), min(stop, i + self.nobvs)
+                if first < last:
+                    projected[:, first - start : last - start] += lagged[:, i, :] @ self.signal[:, first - i : last - i]
+        else:
+            view = self.view()
+            for first in range(start, stop, PROJECT_BLOCK):
+                last = min(first + PROJECT_BLOCK, stop)
+                projected[:, first - start : last - start] = weights @ np.ascontiguousarray(view[:, first:last])
+
+        return projected[0] if single else projected
+
+    def columns(self, idx):
+        """X_ext[:, idx], gathered from the delayed signal (zero where a delay runs off the signal)."""
+        idx = np.asarray(idx, dtype=int)
+        delayed = idx[None, :] - np.arange(self.ext_factor)[:, None]
+        valid = (delayed >= 0) & (delayed < self.nobvs)
+
+        cols = self.signal[:, np.clip(delayed, 0, self.nobvs - 1)] * valid  # (nchans, R, len(idx))
+        return cols.transpose(1, 0, 2).reshape(self.shape[0], len(idx))
@@ -0,0 +1,55 @@
+import numpy as np
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.decomposition.signal_store import select_rows
+
+
+class ExtendedSignal:
+    """
+    The extended signal of one electrode, shared by refine_mus, get_pulse_trains, get_mu_filters and
+    get_online_parameters.
+
+    Holds the accepted channels extended to about nbextchan channels (an ExtendedEMG, never
+    materialised) and computes the pseudoinverse of their covariance once, on first use. MU filters
+    are estimated from discharge times and applied to the whole signal for all MUs at once. An
+    explicit ext_factor takes precedence over nbextchan.
+    """
+
+    def __init__(self, signal, signal_mask=None, nbextchan=1500, chunk_samples=0, ext_factor=None):
+        if signal_mask is not None:
+            signal = select_rows(signal, np.flatnonzero(np.asarray(signal_mask)[: len(signal)] != 1))
+        self.signal = signal
+        self.nsamples = np.shape(signal)[1]
+        if ext_factor is None:
+            ext_factor = round(nbextchan / np.shape(signal)[0])
+        self.extended = ExtendedEMG(signal, ext_factor, chunk_samples)
+        self.ext_factor = self.extended.ext_factor
+        self._inverse = None
+
+    @classmethod
+    def for_electrode(cls, data, rejected_channels, chans_per_electrode, g, nbextchan=1500, chunk_samples=0):
+        """The extended signal of electrode g of data, without its rejected channels."""
+        signal = data[chans_per_electrode[g] * g : (g + 1) * chans_per_electrode[g], :]
+        return cls(signal, rejected_channels[g], nbextchan, chunk_samples)
+
+    def inverse_covariance(self):
+        """Pseudoinverse of the covariance of the extended signal, computed on first use."""
+        if self._inverse is None:
+            self._inverse = np.linalg.pinv(self.extended.covariance(), hermitian=True)
+        return self._inverse
+
+    def mu_filters(self, discharge_times):
+        """MU filters (extended channels x MUs): the sums of the extended signal at the discharge times of each MU."""
+        filters = np.zeros([self.extended.shape[0], len(discharge_times)])
+        for mu, times in enumerate(discharge_times):
+            filters[:, mu] = np.sum(self.extended.columns(times), axis=1)
+        return filters
+
+    def project(self, mu_filters, out=None):
+        """
+        Sources of all MU filters (extended channels x MUs) over the signal, mu_filters.T @ inv(cov) @ X_ext
+        without the last ext_factor - 1 columns, in one product (MUs x samples, into out if given).
+        """
+        weights = (np.asarray(mu_filters).T @ self.inverse_covariance()).astype(self.signal.dtype, copy=False)
+        if out is None:
+            out = np.zeros([weights.shape[0], self.nsamples], dtype=self.signal.dtype)
+        return self.extended.project(weights, 0, self.nsamples, out=out)
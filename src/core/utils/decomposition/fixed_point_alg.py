@@ -33,34 +33,74 @@ def dot_logcosh(x):
     return 1 - np.tanh(x) ** 2
 
 
+# Contrast kernels: each fills g_wx in place and returns the mean of the contrast derivative,
+# evaluating the expensive term (tanh, exp) only once per sample
+@jit(nopython=True, fastmath=True, cache=True)
+def _contrast_skew(wx, g_wx):
+    acc = 0.0
+    for i in range(wx.shape[0]):
+        sq = wx[i] * wx[i]
+        g_wx[i] = sq * wx[i] / 3
+        acc += sq
+    return 2 * acc / (3 * wx.shape[0])
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _contrast_square(wx, g_wx):
+    acc = 0.0
+    for i in range(wx.shape[0]):
+        g_wx[i] = wx[i] * wx[i]
+        acc += wx[i]
+    return 2 * acc / wx.shape[0]
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _contrast_logcosh(wx, g_wx):
+    acc = 0.0
+    for i in range(wx.shape[0]):
+        th = np.tanh(wx[i])
+        g_wx[i] = th
+        acc += th * th
+    return 1 - acc / wx.shape[0]
+
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _contrast_exp(wx, g_wx):
+    acc = 0.0
+    for i in range(wx.shape[0]):
+        sq = wx[i] * wx[i]
+        e = np.exp(-sq / 2)
+        g_wx[i] = e
+        acc += (sq - 1) * e
+    return acc / wx.shape[0]
+
+
 # Highly optimized fixed point algorithm
-@jit(nopython=True, fastmath=True, cache=True, parallel=False)
+@jit(nopython=True, fastmath=True, cache=True)
 def _fixed_point_core(w, X, B, cf_func_id, maxiter=500):
     """
     Efficient implementation of fixed point algorithm.
 
+    Both products with X go through the BLAS matrix-vector routines, and the
+    deflation uses B @ (B.T @ w) so the dense B @ B.T is never formed.
+
     Args:
         w: Initial separation vector (flattened)
-        X: Whitened signal matrix
-        B: Basis matrix
-        cf_func_id: 0=skew, 1=kurtosis, 2=logcosh
+        X: Whitened signal matrix (C-contiguous)
+        B: Basis matrix (C-contiguous)
+        cf_func_id: 0=skew, 1=kurtosis, 2=logcosh, 3=exp
         maxiter: Maximum iterations
 
     Returns:
         w: Updated separation vector
     """
-    n_features, n_samples = X.shape
+    n_samples = X.shape[1]
     tolerance = 1e-4
 
-    # Pre-compute B^T*B once outside the loop
-    B_T_B = B @ B.T
-
     # Pre-allocate arrays for intermediate values
     w_old = np.zeros_like(w)
     w_new = np.zeros_like(w)
-
-    # Pre-compute buffer for X @ g_wx calculations
-    buffer = np.zeros(n_features)
+    g_wx = np.zeros_like(X[0])
     counter = 0
 
     # Main iteration loop
@@ -69,38 +109,28 @@ def _fixed_point_core(w, X, B, cf_func_id, maxiter=500):
         w_old[:] = w
 
         # Calculate w^T * X
-        wx = w @ X
+        wx = np.dot(w, X)
 
         # Apply contrast function based on ID
-        if cf_func_id == 0:  # skew
-            g_wx = wx**3 / 3
-            mean_gp = np.mean(2 * wx**2 / 3)
-        elif cf_func_id == 1:  # kurtosis
-            g_wx = wx**2
-            mean_gp = np.mean(2 * wx)
-        else:  # logcosh
-            g_wx = np.tanh(wx)
-            mean_gp = np.mean(1 - np.tanh(wx) ** 2)
-
-        # Calculate X @ g_wx for the new w (faster than naive matrix multiplication)
-        buffer.fill(0)
-        for i in range(n_samples):
-            for j in range(n_features):
-                buffer[j] += X[j, i] * g_wx[i]
-
-        # Normalize by sample count
-        buffer /= n_samples
-
-        # Subtract A*w_old
-        w_new[:] = buffer - mean_gp * w_old
+        if cf_func_id == 0:
+            mean_gp = _contrast_skew(wx, g_wx)
+        elif cf_func_id == 1:
+            mean_gp = _contrast_square(wx, g_wx)
+        elif cf_func_id == 3:
+            mean_gp = _contrast_exp(wx, g_wx)
+        else:
+            mean_gp = _contrast_logcosh(wx, g_wx)
+
+        # Calculate X @ g_wx, normalised by sample count, and subtract A*w_old
+        w_new[:] = np.dot(X, g_wx) / n_samples - mean_gp * w_old
 
         # Orthogonalize against existing sources
-        w_new = w_new - B_T_B @ w_new
+        w_new -= np.dot(B, np.dot(B.T, w_new))
 
         # Normalize
         norm = np.sqrt(np.sum(w_new**2))
         if norm > 1e-10:  # Avoid division by near-zero
-            w_new = w_new / norm
+            w_new /= norm
 
         # Check for convergence
         angle = np.abs(np.dot(w_new, w_old))
@@ -129,25 +159,137 @@ def fixed_point_alg(w, B, X, cf_type, dot_cf, its=500):
     Returns:
         w: Updated separation vector
     """
-    # Ensure inputs are properly formatted
-    w_flat = w.ravel()
+    # Ensure inputs are properly formatted, in the precision of X (float32 or float64)
+    w_flat = w.ravel().astype(X.dtype)
 
     # Ensure arrays are in C-contiguous format for Numba
-    if not X.flags.c_contiguous:
-        X = np.ascontiguousarray(X)
-    if not B.flags.c_contiguous:
-        B = np.ascontiguousarray(B)
-
-    # Map contrast function based on the input function objects
-    # This checks identity of function objects to determine which one was passed
-    if cf_type is skew:
-        cf_id = 0
-    elif cf_type is square:
-        cf_id = 1
-    else:  # Default to logcosh
-        cf_id = 2
+    # (store arrays of the out-of-core mode are passed as plain arrays over the same mapping)
+    X = np.ascontiguousarray(X)
+    B = np.ascontiguousarray(B, dtype=X.dtype)
+
+    cf_id = _contrast_id(cf_type)
 
     # Run optimized core algorithm
-    result = _fixed_point_core(w_flat.copy(), X, B, cf_id, its)
+    result = _fixed_point_core(w_flat, X, B, cf_id, its)
     # Return in the original format expected by the caller
     return result
+
+
+def _contrast_id(cf_type):
+    """Maps a contrast function object onto the id used by the compiled kernels."""
+    # matched by name, so both these kernels and the ones in mathematical_functions are recognised
+    return {"skew": 0, "square": 1, "logcosh": 2, "exp": 3}.get(getattr(cf_type, "__name__", ""), 2)
+
+
+def _block_contrast(WX, cf_id):
+    """
+    Evaluates the contrast function and the mean of its derivative for a block of projections.
+
+    Args:
+        WX: Projections of the block of separation vectors onto the signal (n_vectors x n_samples)
+        cf_id: 0=skew, 1=kurtosis, 2=logcosh, 3=exp
+
+    Returns:
+        g_wx: Contrast function applied to WX
+        mean_gp: Mean of the contrast derivative for each separation vector
+    """
+    if cf_id == 0:  # skew
+        sq_wx = np.square(WX)
+        return sq_wx * WX / 3, np.mean(sq_wx, axis=1) * (2 / 3)
+    elif cf_id == 1:  # kurtosis
+        return np.square(WX), np.mean(WX, axis=1) * 2
+    elif cf_id == 3:  # exp
+        sq_wx = np.square(WX)
+        g_wx = np.exp(-sq_wx / 2)
+        return g_wx, np.mean((sq_wx - 1) * g_wx, axis=1)
+    else:  # logcosh
+        g_wx = np.tanh(WX)
+        return g_wx, 1 - np.mean(np.square(g_wx), axis=1)
+
+
+def fixed_point_alg_block(W, B, X, cf_type, dot_cf, its=500):
+    """
+    Runs the fixed point algorithm on a block of separation vectors at once.
+
+    Each column of W follows the same update as fixed_point_alg, but the projections
+    and the updates of the whole block are computed with matrix-matrix products, and
+    the block is deflated against B in a single product per iteration. The columns are
+    not orthogonalised against each other: for a fixed B every column converges to the
+    vector fixed_point_alg would return for it, but in a deflation sequence the later
+    columns of a block still have to be deflated against the earlier ones, see
+    deflate_block_vector.
+
+    Args:
+        W: Initial separation vectors (n_features x n_vectors)
+        B: Basis matrix of previously found separation vectors
+        X: Whitened signal matrix
+        cf_type: Contrast function
+        dot_cf: Derivative of contrast function (unused, for compatibility)
+        its: Maximum iterations
+
+    Returns:
+        W: Updated separation vectors (n_features x n_vectors)
+    """
+    tolerance = 1e-4
+    n_samples = X.shape[1]
+    cf_id = _contrast_id(cf_type)
+
+    W = np.array(W, dtype=X.dtype, copy=True)
+    B = np.asarray(B, dtype=X.dtype)
+    active = np.arange(W.shape[1])
+    counter = 0
+
+    while counter < its and active.size:
+        W_old = W[:, active]
+
+        # one GEMM for the projections and one for the update of all active vectors
+        g_wx, mean_gp = _block_contrast(W_old.T @ X, cf_id)
+        W_new = (X @ g_wx.T) / n_samples - W_old * mean_gp
+
+        # orthogonalise the block against the existing sources
+        W_new -= B @ (B.T @ W_new)
+
+        norm = np.sqrt(np.sum(np.square(W_new), axis=0))
+        W_new[:, norm > 1e-10] /= norm[norm > 1e-10]
+        W[:, active] = W_new
+
+        # converged vectors leave the block, the rest carry on iterating
+        angle = np.abs(np.sum(W_new * W_old, axis=0))
+        active = active[np.abs(angle - 1.0) >= tolerance]
+        counter += 1
+
+    return W
+
+
+def deflate_block_vector(w, w_init, B, X, cf_type, dot_cf, its=500, restart=0.5):
+    """
+    Brings a column of fixed_point_alg_block (deflated against the B from before its block) in line
+    with the sequential deflation, once the earlier columns of its block have been added to B.
+
+    The converged column is deflated against the new B and iterated again from there, which only
+    takes a few iterations when it is a source that none of the earlier columns found. If less than
+    restart of its norm is left (it converged to a source found by an earlier column), it is
+    iterated from its initial vector instead, as in the sequential path.
+
+    The result is the vector of the sequential path unless the extra deflation would have moved
+    the initial vector to the basin of another source, which can happen for initial vectors near
+    the boundary between two sources: block mode is therefore opt-in (ica_block_size > 1).
+
+    Args:
+        w: Column converged by fixed_point_alg_block
+        w_init: Initial vector of the column
+        B: Basis matrix, including the earlier columns of the block
+        X: Whitened signal matrix
+        cf_type: Contrast function
+        dot_cf: Derivative of contrast function (unused, for compatibility)
+        its: Maximum iterations
+        restart: Norm left after deflation under which the column restarts from w_init
+
+    Returns:
+        w: Separation vector deflated against B
+    """
+    w = w - B @ (B.T @ w)
+    if np.linalg.norm(w) < restart:
+        w = w_init - B @ (B.T @ w_init)
+    w /= np.linalg.norm(w)
+    return fixed_point_alg(w, B, X, cf_type, dot_cf, its)
@@ -1,17 +1,21 @@
 import numpy as np
-from core.utils.decomposition.get_spikes import get_spikes
+from core.utils.decomposition.evaluate_source import evaluate_source
 
 
-def min_cov_isi(w_n, B, Z, fsamp, cov_n, spikes_n):
+def min_cov_isi(w_n, B, Z, fsamp, cov_n, spikes_n, reuse_tol=0, return_evaluation=False):
     """
     Minimizes coefficient of variation (CoV) of inter-spike intervals.
 
     Iteratively refines the separation vector to achieve more regular
     motor unit firing patterns by minimizing the CoV of the interspike
-    intervals.
+    intervals. Each step estimates the source once with evaluate_source;
+    with reuse_tol > 0, steps that barely change the vector keep the
+    previous peaks. With return_evaluation, the evaluation of the returned
+    vector is returned as well, so its SIL does not need another pass.
     """
 
     cov_n_1 = cov_n + 0.1
+    evaluation = None
 
     while cov_n < cov_n_1:
 
@@ -19,17 +23,17 @@ def min_cov_isi(w_n, B, Z, fsamp, cov_n, spikes_n):
         spikes_n_1 = spikes_n.copy()
 
         w_n_1 = w_n.copy()
-        _, spikes_n = get_spikes(w_n, Z, fsamp)
-
-        # determine the interspike interval
-        ISI = np.diff(spikes_n / fsamp)
-        # determine the coefficient of variation
-        cov_n = np.std(ISI) / np.mean(ISI)
+        evaluation = evaluate_source(w_n, Z, fsamp, evaluation, reuse_tol)
+        spikes_n = evaluation["spikes"]
+        cov_n = evaluation["cov"]
 
         # update the sepearation vector by summing all the spikes
         w_n = np.sum(Z[:, spikes_n], axis=1)  # summing the spiking across time, leaving an array that is channels x 1
 
     if len(spikes_n_1) < 2:
-        _, spikes_n_1 = get_spikes(w_n, Z, fsamp)
+        spikes_n_1 = evaluate_source(w_n, Z, fsamp)["spikes"]
+
+    if return_evaluation:
+        return w_n_1, spikes_n_1, cov_n_1, evaluation
 
     return w_n_1, spikes_n_1, cov_n_1
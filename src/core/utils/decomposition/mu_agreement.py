@@ -0,0 +1,61 @@
+import numpy as np
+
+
+def rate_of_agreement(discharges_a, discharges_b, tolerance):
+    """
+    Rate of agreement between two discharge trains: matched / (n_a + n_b - matched).
+
+    A discharge of a is matched when a discharge of b lies within tolerance samples of it; every
+    discharge of b is matched at most once.
+    """
+    discharges_a = np.sort(np.asarray(discharges_a, dtype=np.int64).ravel())
+    discharges_b = np.sort(np.asarray(discharges_b, dtype=np.int64).ravel())
+    if len(discharges_a) == 0 or len(discharges_b) == 0:
+        return 0.0
+
+    # nearest discharge of b for every discharge of a
+    right = np.clip(np.searchsorted(discharges_b, discharges_a), 0, len(discharges_b) - 1)
+    left = np.clip(right - 1, 0, len(discharges_b) - 1)
+    nearest = np.where(
+        np.abs(discharges_b[left] - discharges_a) <= np.abs(discharges_b[right] - discharges_a), left, right
+    )
+    within = np.abs(discharges_b[nearest] - discharges_a) <= tolerance
+
+    matched = len(np.unique(nearest[within]))
+    return matched / (len(discharges_a) + len(discharges_b) - matched)
+
+
+def match_motor_units(reference, test, fsamp, tolerance=0.0005, min_agreement=0.3):
+    """
+    Pairs the motor units of two decompositions of the same recording by their discharge times.
+
+    Args:
+        reference: List of discharge time arrays (samples) of the reference decomposition
+        test: List of discharge time arrays of the decomposition to validate
+        fsamp: Sampling frequency
+        tolerance: Largest difference (in seconds) between two discharges counted as the same
+        min_agreement: Smallest rate of agreement for two motor units to be paired
+
+    Returns:
+        pairs: List of (reference index, test index, rate of agreement), best pairs first, each
+            motor unit used at most once
+        agreement: Rate of agreement of every reference / test combination
+    """
+    tolerance_samples = int(np.round(tolerance * fsamp))
+    agreement = np.zeros([len(reference), len(test)])
+    for i, discharges_ref in enumerate(reference):
+        for j, discharges_test in enumerate(test):
+            agreement[i, j] = rate_of_agreement(discharges_ref, discharges_test, tolerance_samples)
+
+    pairs = []
+    used_ref, used_test = set(), set()
+    for flat in np.argsort(agreement, axis=None)[::-1]:
+        i, j = np.unravel_index(flat, agreement.shape)
+        if agreement[i, j] < min_agreement:
+            break
+        if i not in used_ref and j not in used_test:
+            pairs.append((int(i), int(j), float(agreement[i, j])))
+            used_ref.add(i)
+            used_test.add(j)
+
+    return pairs, agreement
@@ -8,51 +8,54 @@ def notch_filter(signal, fsamp, to_han=False):
 
     Identifies frequency components with magnitudes greater than 5 standard deviations
     away from the median frequency component magnitude and removes them from the signal.
+    All channels are transformed together with a single rfft; the detection runs on
+    windows of fsamp frequency bins and each detected bin is widened to a 4 Hz band.
     """
 
-    bandwidth_as_index = int(round(4 * (np.shape(signal)[1] / fsamp)))
-    filtered_signal = np.zeros([np.shape(signal)[0], np.shape(signal)[1]])
-
-    for chan in range(np.shape(signal)[0]):
-
-        if to_han:
-            hwindow = scipy.signal.hann(np.shape(signal[chan, :])[0])
-            final_signal = signal[chan, :] * hwindow
-        else:
-            final_signal = signal[chan, :]
-
-        fourier_signal = np.fft.fft(final_signal)
-        fourier_interf = np.zeros(len(fourier_signal), dtype="complex128")
-        interf2remove = np.zeros(len(fourier_signal), dtype=np.int32)
-        window = fsamp
-        tracker = 0
-
-        for interval in range(0, len(fourier_signal) - window + 1, window):
-            median_freq = np.median(abs(fourier_signal[interval + 1 : interval + window + 1]))
-            std_freq = np.std(abs(fourier_signal[interval + 1 : interval + window + 1]))
-            # interference is defined as when the magnitude of a given frequency component in the fourier spectrum
-            # is greater than 5 times the std, relative to the median magnitude
-            label_interf = list(
-                np.where(abs(fourier_signal[interval + 1 : interval + window + 1]) > median_freq + 5 * std_freq)[0]
-            )
-            # np.where gives tuple, element access to the array
-            # need to shift these labels to make sure they are not relative to the window only, but to the whole signal
-            label_interf = [x + interval + 1 for x in label_interf]
-
-            if label_interf:
-                for i in range(int(-np.floor(bandwidth_as_index / 2)), int(np.floor(bandwidth_as_index / 2) + 1)):
-
-                    temp_shifted_list = [x + i for x in label_interf]
-                    interf2remove[tracker : tracker + len(label_interf)] = temp_shifted_list
-                    tracker = tracker + len(label_interf)
-
-        indexf2remove = np.where(np.logical_and(interf2remove >= 0, interf2remove <= len(fourier_signal) / 2))[0]
-        fourier_interf[interf2remove[indexf2remove]] = fourier_signal[interf2remove[indexf2remove]]
-        corrector = int(len(fourier_signal) - np.floor(len(fourier_signal) / 2) * 2)
-
-        fourier_interf[int(np.ceil(len(fourier_signal) / 2)) :] = np.flip(
-            np.conj(fourier_interf[1 : int(np.ceil(len(fourier_signal) / 2) + 1 - corrector)])
-        )
-        filtered_signal[chan, :] = signal[chan, :] - np.fft.ifft(fourier_interf).real
-
-    return filtered_signal
+    signal = np.asarray(signal)
+    dtype = signal.dtype if signal.dtype == np.float32 else np.float64
+    nsamples = np.shape(signal)[1]
+    nbins = nsamples // 2 + 1  # bins of the one-sided spectrum, up to and including nsamples/2
+    bandwidth_as_index = int(round(4 * (nsamples / fsamp)))
+    half_band = int(np.floor(bandwidth_as_index / 2))
+    window = int(fsamp)
+
+    if to_han:
+        final_signal = signal * scipy.signal.windows.hann(nsamples)
+    else:
+        final_signal = signal
+
+    fourier_signal = np.fft.rfft(final_signal, axis=1)
+    magnitude = np.abs(fourier_signal)
+
+    # the detection windows run over the two-sided spectrum, whose upper half mirrors the lower one
+    magnitude = np.concatenate([magnitude, magnitude[:, 1 : nsamples - nbins + 1][:, ::-1]], axis=1)
+
+    # window w covers bins w*window+1 .. w*window+window; only the windows that can reach the
+    # one-sided spectrum once widened by half_band are needed
+    nwindows = (nsamples - window) // window + 1 if nsamples >= window else 0
+    nwindows = min(nwindows, max(0, (nbins - 2 + half_band) // window + 1))
+    nfull = min(nwindows, (nsamples - 1) // window)
+
+    interf = np.zeros(magnitude.shape, dtype=bool)
+    if nfull > 0:
+        windows = magnitude[:, 1 : nfull * window + 1].reshape(magnitude.shape[0], nfull, window)
+        threshold = np.median(windows, axis=2) + 5 * np.std(windows, axis=2)
+        interf[:, 1 : nfull * window + 1] = (windows > threshold[:, :, None]).reshape(magnitude.shape[0], -1)
+    if nwindows > nfull:
+        # when nsamples is a multiple of fsamp the last window is one bin short
+        last = magnitude[:, nfull * window + 1 :]
+        threshold = np.median(last, axis=1) + 5 * np.std(last, axis=1)
+        interf[:, nfull * window + 1 :] = last > threshold[:, None]
+
+    # widen every interference bin to +-half_band bins (a dilation of the mask), keeping the one-sided bins
+    counts = np.cumsum(np.pad(interf, ((0, 0), (half_band + 1, half_band)), constant_values=False), axis=1)
+    interf2remove = (counts[:, 2 * half_band + 1 :] - counts[:, : -2 * half_band - 1])[:, :nbins] > 0
+
+    # the DC component is always removed
+    interf2remove[:, 0] = True
+
+    fourier_interf = np.where(interf2remove, fourier_signal, 0)
+    filtered_signal = signal - np.fft.irfft(fourier_interf, n=nsamples, axis=1)
+
+    return filtered_signal.astype(dtype, copy=False)
@@ -15,12 +15,11 @@ def peel_off(Z, spikes, fsamp):
     waveform = np.zeros([windowl * 2 + 1])
     firings = np.zeros([np.shape(Z)[1]])
     firings[spikes] = 1  # make the firings binary
-    EMGtemp = np.empty(Z.shape)  # intialise a temporary EMG signal
 
+    # every channel only depends on itself, so each is updated in place without a full-size temporary
     for i in range(np.shape(Z)[0]):  # iterating through the (extended) channels
         temp = cutMUAP(spikes, windowl, Z[i, :])
         waveform = np.mean(temp, axis=0)
-        EMGtemp[i, :] = scipy.signal.convolve(firings, waveform, mode="same", method="auto")
+        Z[i, :] -= scipy.signal.convolve(firings, waveform, mode="same", method="auto").astype(Z.dtype)
 
-    Z -= EMGtemp
     return Z
@@ -1,91 +1,114 @@
 import numpy as np
-from core.utils.decomposition.xcorr import xcorr
 
 
 def remove_duplicates(pulse_trains, discharge_times, discharge_times2, mu_filters, maxlag, jitter_val, tol, fsamp):
     """
     Identifies and removes duplicate motor units.
 
-    Uses cross-correlation to detect motor units that likely represent the same physical unit,
-    keeping only the one with the most regular firing pattern (lowest CoV).
-    """
+    Aligns the firings of each remaining MU with those of the first one at the lag where most of their
+    discharges coincide (the peak of the cross-correlation of their binary spike trains), and counts
+    the discharges they have in common within the jitter. MUs sharing at least tol of their discharges
+    are duplicates, of which only the one with the most regular firing pattern (lowest CoV) is kept.
 
+    Works on the sorted discharge times only: the cross-correlation within maxlag is a histogram of
+    the pairwise time differences, and the common discharges are the intersection of the jittered
+    discharge runs.
+    """
     jitter_thr = int(np.round(jitter_val * fsamp))
-    spike_trains = np.zeros([np.shape(pulse_trains)[0], np.shape(pulse_trains)[1]])
+    half_width = max(jitter_thr - 1, 0)  # discharges are jittered by -(jitter_thr - 1) ... jitter_thr - 1 samples
+    maxlag = int(maxlag)
+
+    spike_times = [np.unique(np.asarray(times, dtype=np.int64)) for times in discharge_times]
+    jitter_runs = [discharge_runs(np.asarray(times, dtype=np.int64), half_width) for times in discharge_times2]
+    nspikes = [len(times) for times in discharge_times]
 
-    discharge_jits = []
     discharge_times_new = []
     pulse_trains_new = []
+    survivors = []
+    remaining = [mu for mu in range(len(discharge_times)) if nspikes[mu] > 0]  # MUs still in the running
 
-    # generating binary spike trains for each MU extracted so far
-    for i in range(np.shape(pulse_trains)[0]):
-        spike_trains[i, discharge_times[i]] = 1
-        discharge_jits.append([])  # append an empty list to be extended with jitters
-
-        # adding jitter
-        for j in range(jitter_thr):
-            discharge_jits[i].extend((discharge_times2[i] - j).tolist())
-            discharge_jits[i].extend((discharge_times2[i] + j).tolist())
-
-        discharge_jits[i].extend(discharge_times2[i].tolist())
-
-    # With the binary trains generated above, you can readily identify duplicate MUs
-    i = 1
-    while discharge_jits:
-        discharge_temp = []
-        for mu_candidate in range(len(discharge_jits)):
+    while remaining:
+        reference = remaining[0]
 
-            # calculating the cross correlation between the firings of two candidate MUs
-            corr, lags = xcorr(spike_trains[0, :], spike_trains[mu_candidate, :], int(maxlag))
-            ind_max = np.argmax(corr)
-            corr_max = np.real(corr[ind_max])
-
-            if corr_max > 0.2:
-                discharge_temp.append([x + lags[ind_max] for x in discharge_jits[mu_candidate]])
-            else:
-                discharge_temp.append(discharge_jits[mu_candidate])
-
-        # Now, we count the common discharge times
-        comdis = np.zeros(np.shape(pulse_trains)[0])
-
-        for j in range(1, np.shape(pulse_trains)[0]):  # skip the first since it is used for the baseline comparison
-            com = np.intersect1d(discharge_jits[0], discharge_temp[j])
-            com = com[np.insert(np.diff(com) != 1, 0, False)]
-            comdis[j] = len(com) / max(len(discharge_times[0]), len(discharge_times[j]))
-            com = None
+        # the fraction of common discharges with the reference, after aligning the firings
+        comdis = np.zeros(len(remaining))
+        for j in range(1, len(remaining)):  # skip the first since it is used for the baseline comparison
+            candidate = remaining[j]
+            lag = most_common_lag(spike_times[reference], spike_times[candidate], maxlag)
+            starts, ends = jitter_runs[candidate]
+            common = common_discharges(jitter_runs[reference], (starts + lag, ends + lag))
+            comdis[j] = common / max(nspikes[reference], nspikes[candidate])
 
         # use this establish the duplicate MUs, and keep only the MU that has the most stable, regular firing behaviour
-        duplicates = np.where(comdis >= tol)[0]
-        duplicates = np.insert(duplicates, 0, 0)
+        duplicates = np.insert(np.flatnonzero(comdis[1:] >= tol) + 1, 0, 0)
         CoV = np.zeros(len(duplicates))
 
         for j in range(len(duplicates)):
-            ISI = np.diff(discharge_times[duplicates[j]])
+            ISI = np.diff(discharge_times[remaining[duplicates[j]]])
             CoV[j] = np.std(ISI) / np.mean(ISI)
 
-        survivor = np.argmin(CoV)  # the surviving MU has the lowest CoV
+        survivor = remaining[duplicates[np.argmin(CoV)]]  # the surviving MU has the lowest CoV
 
-        # delete all duplicates, but save the surviving MU
-        discharge_times_new.append(discharge_times[duplicates[survivor]])
-        pulse_trains_new.append(pulse_trains[duplicates[survivor]])
+        # delete all duplicates, but save the surviving MU (rows are not copied, pulse_trains may be on disk)
+        discharge_times_new.append(discharge_times[survivor])
+        pulse_trains_new.append(pulse_trains[survivor])
+        survivors.append(survivor)
+        duplicates = set(duplicates)
+        remaining = [mu for j, mu in enumerate(remaining) if j not in duplicates]
 
-        # update firings and discharge times
-        for j in range(len(duplicates)):
-            # THE FIX IS HERE: Use np.array([]) to maintain NumPy array consistency
-            discharge_times[duplicates[-(j + 1)]] = np.array([])
-            discharge_times2[duplicates[-(j + 1)]] = np.array([])
-            discharge_jits[duplicates[-(j + 1)]] = []
+    # MU filters (one column per MU) of the surviving MUs
+    if np.ndim(mu_filters) == 2 and np.shape(mu_filters)[1] == len(discharge_times):
+        mu_filters = np.asarray(mu_filters)[:, survivors]
+
+    return discharge_times_new, pulse_trains_new, mu_filters
 
-        # if it is not empty, assign it back to the list, otherwise remove the empty element
-        discharge_times = [mu for mu in discharge_times if mu.size > 0]
-        discharge_times2 = [mu for mu in discharge_times2 if mu.size > 0]
-        discharge_jits = [mu for mu in discharge_jits if len(mu) > 0]
 
-        # Clean the spike and pulse train arrays based on identified duplicates
-        spike_trains = np.delete(spike_trains, duplicates, axis=0)
-        pulse_trains = np.delete(pulse_trains, duplicates, axis=0)
-        mu_filters = np.delete(mu_filters, duplicates, axis=0)
+def discharge_runs(times, half_width):
+    """
+    Runs of consecutive samples within half_width of the discharge times, as (starts, ends) with
+    exclusive ends. Overlapping or adjacent windows are merged into one run.
+    """
+    times = np.unique(times)
+    starts, ends = times - half_width, times + half_width + 1
+    if len(times) == 0:
+        return starts, ends
+    new_run = np.ones(len(times), dtype=bool)
+    new_run[1:] = starts[1:] > ends[:-1]
+    last = np.append(np.flatnonzero(new_run)[1:] - 1, len(times) - 1)
+    return starts[new_run], ends[last]
 
-        i += 1
 
-    return discharge_times_new, pulse_trains_new, mu_filters
+def most_common_lag(reference, candidate, maxlag):
+    """
+    Lag (within +-maxlag) at which most discharges of the reference and the candidate coincide, i.e.
+    the peak of the cross-correlation of their binary spike trains: the most frequent difference
+    reference time - candidate time. The smallest lag wins ties, and 0 is returned without any pair.
+    """
+    low = np.searchsorted(reference, candidate - maxlag, side="left")
+    high = np.searchsorted(reference, candidate + maxlag, side="right")
+    npairs = high - low
+    if npairs.sum() == 0:
+        return 0
+
+    # indices of the reference discharges paired with each candidate discharge
+    offsets = np.arange(npairs.sum()) - np.repeat(np.cumsum(npairs) - npairs, npairs)
+    differences = reference[np.repeat(low, npairs) + offsets] - np.repeat(candidate, npairs)
+    return int(np.argmax(np.bincount(differences + maxlag, minlength=2 * maxlag + 1))) - maxlag
+
+
+def common_discharges(runs_1, runs_2):
+    """
+    Number of common discharges of two sets of jittered discharge runs: the runs of samples in both
+    sets, not counting the first.
+    """
+    boundaries = np.concatenate([runs_1[0], runs_2[0], runs_1[1], runs_2[1]])
+    deltas = np.repeat([1, 1, -1, -1], [len(runs_1[0]), len(runs_2[0]), len(runs_1[1]), len(runs_2[1])])
+    if len(boundaries) == 0:
+        return 0
+
+    # number of sets covering each stretch between consecutive boundaries
+    points, inverse = np.unique(boundaries, return_inverse=True)
+    coverage = np.cumsum(np.bincount(inverse, weights=deltas, minlength=len(points)))
+    both = coverage > 1.5
+    runs = int(np.sum(both[1:] & ~both[:-1]) + both[0])
+    return max(runs - 1, 0)
@@ -1,104 +1,118 @@
 import numpy as np
-from core.utils.decomposition.xcorr import xcorr
+from core.utils.decomposition.remove_duplicates import discharge_runs
+from core.utils.decomposition.signal_store import select_rows
 
 
 def remove_duplicates_between_arrays(pulse_trains, discharge_times, muscle, maxlag, jitter_val, tol, fsamp):
     """
     Identifies and removes duplicate motor units across different electrode arrays.
 
-    Similar to remove_duplicates, but specifically handles detection of the same
-    motor unit appearing in multiple electrode arrays.
-    """
+    Similar to remove_duplicates, but in two phases: the fraction of common discharges of every pair
+    of MUs (after aligning their firings) is computed first, then MUs sharing at least tol of their
+    discharges are joined into clusters (transitively, with a union-find), and only the MU with the
+    most regular firing pattern (lowest CoV) of each cluster is kept.
 
+    Returns:
+        discharge_times_new, pulse_trains_new, muscle_new: the surviving MUs, in order of their first cluster member
+        similarity: the (MUs x MUs) fractions of common discharges of all MUs, for inspection
+    """
     jitter_thr = int(np.round(jitter_val * fsamp))
-    spike_trains = np.zeros([np.shape(pulse_trains)[0], np.shape(pulse_trains)[1]])
-
-    discharge_jits = []
-    discharge_times_new = []
-    pulse_trains_new = []
-    muscle_new = []
-
-    # generating binary spike trains for each MU extracted so far
-    for i in range(np.shape(pulse_trains)[0]):
-        spike_trains[i, discharge_times[i]] = 1
-        discharge_jits.append([])
-
-        # Convert NumPy arrays to lists before using extend()
-        for j in range(jitter_thr):
-            discharge_jits[i].extend((discharge_times[i] - j).tolist())
-            discharge_jits[i].extend((discharge_times[i] + j).tolist())
-
-        discharge_jits[i].extend(discharge_times[i].tolist())
-
-    i = 1
-    while discharge_jits:
-        discharge_temp = []
-        for mu_candidate in range(len(discharge_jits)):
-            corr, lags = xcorr(spike_trains[0, :], spike_trains[mu_candidate, :], int(maxlag))
-            ind_max = np.argmax(corr)
-            corr_max = np.real(corr[ind_max])
-
-            if corr_max > 0.2:
-                discharge_temp.append([x + lags[ind_max] for x in discharge_jits[mu_candidate]])
-            else:
-                discharge_temp.append(discharge_jits[mu_candidate])
-
-        # Now, we count the common discharge times
-        comdis = np.zeros(np.shape(pulse_trains)[0])
-
-        for j in range(1, np.shape(pulse_trains)[0]):
-            com = np.intersect1d(discharge_jits[0], discharge_temp[j])
-
-            if com.size > 1:
-                # Find indices where diff != 1, but handle empty arrays
-                diff_mask = np.diff(com) != 1
-                keep_indices = np.insert(diff_mask, 0, False)
-                com = com[keep_indices]
-            elif com.size == 0:
-                pass
-
-            # Calculate common discharge ratio
-            if len(discharge_times[0]) > 0 and len(discharge_times[j]) > 0:
-                comdis[j] = len(com) / max(len(discharge_times[0]), len(discharge_times[j]))
-            else:
-                comdis[j] = 0
-
-            # Clear com to free memory
-            com = None
-
-        duplicates = np.where(comdis >= tol)[0]
-        duplicates = np.insert(duplicates, 0, 0)
-        CoV = np.zeros(len(duplicates))
-
-        for j in range(len(duplicates)):
-            ISI = np.diff(discharge_times[duplicates[j]])
-            if ISI.size > 0:
-                CoV[j] = np.std(ISI) / np.mean(ISI)
-            else:
-                CoV[j] = float("inf")  # Set high CoV for empty arrays
-
-        survivor = np.argmin(CoV)
-
-        # delete all duplicates, but save the surviving MU
-        discharge_times_new.append(discharge_times[duplicates[survivor]])
-        pulse_trains_new.append(pulse_trains[duplicates[survivor]])
-        muscle_new.append(muscle[duplicates[survivor]])
-
-        # update firings and discharge times
-        for j in range(len(duplicates)):
-            discharge_times[duplicates[-(j + 1)]] = np.array([])
-            discharge_jits[duplicates[-(j + 1)]] = []
-
-        discharge_times = [mu for mu in discharge_times if mu.size > 0]
-        discharge_jits = [mu for mu in discharge_jits if len(mu) > 0]
-
-        # Clean the spike and pulse train arrays
-        spike_trains = np.delete(spike_trains, duplicates, axis=0)
-        pulse_trains = np.delete(pulse_trains, duplicates, axis=0)
-        muscle = np.delete(muscle, duplicates, axis=0)
-
-        i += 1
-
-    muscle_new = np.array(muscle_new)
-    pulse_trains_new = np.array(pulse_trains_new)
-    return discharge_times_new, pulse_trains_new, muscle_new
+    similarity, _ = duplicate_similarity(discharge_times, int(maxlag), max(jitter_thr - 1, 0))
+
+    # union-find over the pairs of duplicates
+    parents = np.arange(len(discharge_times))
+
+    def root(mu):
+        while parents[mu] != mu:
+            parents[mu] = parents[parents[mu]]
+            mu = parents[mu]
+        return mu
+
+    for mu_1, mu_2 in zip(*np.nonzero(np.triu(similarity >= tol, k=1))):
+        root_1, root_2 = root(mu_1), root(mu_2)
+        parents[max(root_1, root_2)] = min(root_1, root_2)  # the root is the first MU of the cluster
+
+    CoV = np.full(len(discharge_times), np.inf)  # no discharge intervals: never preferred
+    for mu, times in enumerate(discharge_times):
+        ISI = np.diff(times)
+        if ISI.size > 0:
+            CoV[mu] = np.std(ISI) / np.mean(ISI)
+
+    # the surviving MU of each cluster has the lowest CoV (the first one on ties)
+    clusters = {}
+    for mu in range(len(discharge_times)):
+        clusters.setdefault(root(mu), []).append(mu)
+    survivors = [members[int(np.argmin(CoV[members]))] for _, members in sorted(clusters.items())]
+
+    discharge_times_new = [discharge_times[mu] for mu in survivors]
+    pulse_trains_new = select_rows(pulse_trains, np.array(survivors, dtype=int))
+    muscle_new = np.asarray(muscle)[survivors]
+    return discharge_times_new, pulse_trains_new, muscle_new, similarity
+
+
+def duplicate_similarity(discharge_times, maxlag, half_width):
+    """
+    Fractions of common discharges of all pairs of MUs, and the lags aligning them.
+
+    For each MU, the lags to every later MU come at once from a histogram of the time differences of
+    all their discharge pairs within +-maxlag (the peak of the cross-correlation of the binary spike
+    trains, the smallest lag on ties and 0 without any pair), and the common discharges from the
+    overlaps of its jittered discharge runs with the shifted runs of the others, as in remove_duplicates.
+
+    Returns:
+        similarity: symmetric (MUs x MUs), common discharges / the larger number of discharges (1 on the diagonal)
+        lags: (MUs x MUs), lags[i, j] shifts the discharges of j onto those of i (antisymmetric)
+    """
+    nmus = len(discharge_times)
+    nspikes = np.array([len(times) for times in discharge_times])
+    spike_times = [np.unique(np.asarray(times, dtype=np.int64)) for times in discharge_times]
+    runs = [discharge_runs(np.asarray(times, dtype=np.int64), half_width) for times in discharge_times]
+
+    # the discharges and runs of all MUs in one sorted array each, labelled with their MU
+    all_times = np.concatenate(spike_times + [np.zeros(0, dtype=np.int64)])
+    labels = np.repeat(np.arange(nmus), [len(times) for times in spike_times])
+    order = np.argsort(all_times, kind="stable")
+    all_times, labels = all_times[order], labels[order]
+    run_starts = np.concatenate([starts for starts, _ in runs] + [np.zeros(0, dtype=np.int64)])
+    run_ends = np.concatenate([ends for _, ends in runs] + [np.zeros(0, dtype=np.int64)])
+    run_labels = np.repeat(np.arange(nmus), [len(starts) for starts, _ in runs])
+
+    similarity = np.eye(nmus)
+    lags = np.zeros((nmus, nmus), dtype=int)
+    nlags = 2 * maxlag + 1
+
+    for reference in range(nmus - 1):
+        # histogram of the differences reference time - time of each other MU within maxlag
+        low = np.searchsorted(all_times, spike_times[reference] - maxlag, side="left")
+        high = np.searchsorted(all_times, spike_times[reference] + maxlag, side="right")
+        npairs = high - low
+        offsets = np.arange(npairs.sum()) - np.repeat(np.cumsum(npairs) - npairs, npairs)
+        paired = np.repeat(low, npairs) + offsets
+        differences = np.repeat(spike_times[reference], npairs) - all_times[paired]
+        later = labels[paired] > reference
+        histogram = np.bincount(
+            labels[paired][later] * nlags + differences[later] + maxlag, minlength=nmus * nlags
+        ).reshape(nmus, nlags)
+        best = np.where(histogram.max(axis=1) > 0, np.argmax(histogram, axis=1) - maxlag, 0)
+        lags[reference, reference + 1 :] = best[reference + 1 :]
+        lags[reference + 1 :, reference] = -best[reference + 1 :]
+
+        # overlaps of the reference runs with the shifted runs of every later MU: the runs of common
+        # discharges, as the runs of each MU are separated by gaps
+        candidates = run_labels > reference
+        starts = run_starts[candidates] + best[run_labels[candidates]]
+        ends = run_ends[candidates] + best[run_labels[candidates]]
+        reference_starts, reference_ends = runs[reference]
+        overlaps = np.searchsorted(reference_starts, ends, side="left") - np.searchsorted(
+            reference_ends, starts, side="right"
+        )
+        common = np.maximum(np.bincount(run_labels[candidates], weights=overlaps, minlength=nmus) - 1, 0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fractions = np.where(
+                (nspikes > 0) & (nspikes[reference] > 0), common / np.maximum(nspikes, nspikes[reference]), 0
+            )
+        similarity[reference, reference + 1 :] = fractions[reference + 1 :]
+        similarity[reference + 1 :, reference] = fractions[reference + 1 :]
+
+    return similarity, lags
@@ -0,0 +1,137 @@
+import os
+import mmap
+import shutil
+import tempfile
+import numpy as np
+from core.utils.decomposition.notch_filter import notch_filter
+from core.utils.decomposition.bandpass_filter import bandpass_filter
+
+# bytes of signal held in memory at a time when a store array is copied or filtered in chunks
+CHUNK_BYTES = 64 << 20
+
+# bytes per sample of one channel used by the notch and bandpass filters (spectrum, mask, padded copies)
+FILTER_BYTES_PER_SAMPLE = 64
+
+
+class StoredArray(np.memmap):
+    """
+    A memory-mapped array of a SignalStore. It behaves as an ndarray, but pickles as a reference to
+    its file, so worker processes map the same data instead of receiving a copy.
+    """
+
+    def __reduce__(self):
+        if isinstance(self.base, mmap.mmap) and os.path.exists(self.filename):
+            return StoredArray, (self.filename, self.dtype, "r+", self.offset, self.shape)
+        return np.ndarray.__reduce__(np.asarray(self))
+
+
+class SignalStore:
+    """
+    On-disk arrays for the raw, filtered, batched and whitened signals and the pulse trains of
+    recordings that do not fit in memory.
+
+    Every array is a file in the store directory, mapped into memory: the pages are read and
+    written by the operating system as the pipeline walks through the signals in chunks, and do
+    not count against the process's own (anonymous) memory. A store without a directory creates a
+    temporary one, removed by close.
+    """
+
+    def __init__(self, directory=None):
+        self.owner = directory is None
+        self.directory = tempfile.mkdtemp(prefix="muedit_store_") if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name + ".dat")
+
+    def create(self, name, shape, dtype=np.float64):
+        """A new zero-filled array called name, replacing any array of the same name."""
+        shape = tuple(int(n) for n in shape)
+        if int(np.prod(shape)) == 0:
+            return np.zeros(shape, dtype=dtype)
+        return StoredArray(self.path(name), dtype=dtype, mode="w+", shape=shape)
+
+    def __contains__(self, name):
+        return os.path.exists(self.path(name))
+
+    def nbytes(self):
+        """Bytes on disk used by the arrays of the store."""
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def close(self):
+        """Removes a temporary store directory with all its arrays."""
+        if self.owner and os.path.isdir(self.directory):
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __getstate__(self):
+        # worker processes share the directory but never remove it
+        return dict(directory=self.directory, owner=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def chunk_columns(nrows, ncols, itemsize, chunk_bytes=None):
+    """(start, stop) column ranges of at most chunk_bytes over nrows rows."""
+    step = max(1, (chunk_bytes or CHUNK_BYTES) // max(1, nrows * itemsize))
+    return [(start, min(start + step, ncols)) for start in range(0, ncols, step)]
+
+
+def chunk_rows(nrows, ncols, itemsize, chunk_bytes=None):
+    """(start, stop) row ranges of at most chunk_bytes over ncols columns (at least one row each)."""
+    step = max(1, (chunk_bytes or CHUNK_BYTES) // max(1, ncols * itemsize))
+    return [(start, min(start + step, nrows)) for start in range(0, nrows, step)]
+
+
+def copy_rows(source, rows, start, stop, out):
+    """Copies source[rows, start:stop] into out chunk by chunk, so a store array is never read at once."""
+    rows = np.asarray(rows)
+    for first, last in chunk_columns(len(rows), stop - start, source.dtype.itemsize):
+        out[:, first:last] = source[rows, start + first : start + last]
+    return out
+
+
+def scratch_copy(array):
+    """
+    A copy of array that can be modified: in memory for ordinary arrays, in an anonymous file
+    next to the original for store arrays.
+    """
+    if not isinstance(array, np.memmap) or array.filename is None:
+        return array.copy()
+    return select_rows(array, np.arange(len(array)))
+
+
+def select_rows(array, rows):
+    """array[rows] (a copy), in an anonymous file next to array for store arrays."""
+    if not isinstance(array, np.memmap) or array.filename is None:
+        return np.asarray(array)[rows]
+
+    with tempfile.TemporaryFile(dir=os.path.dirname(array.filename)) as file:
+        selected = np.memmap(file, dtype=array.dtype, mode="w+", shape=(len(rows),) + array.shape[1:])
+    ncols = int(np.prod(array.shape[1:]))
+    for first, last in chunk_rows(len(rows), ncols, array.dtype.itemsize):
+        selected[first:last] = array[rows[first:last]]
+    return selected
+
+
+def chunk_samples(nrows, itemsize, chunk_bytes=None):
+    """Number of columns of an nrows array that fit in chunk_bytes."""
+    return max(1, (chunk_bytes or CHUNK_BYTES) // max(1, nrows * itemsize))
+
+
+def filter_rows(signal, fsamp, emg_type="surface", out=None, chunked=False):
+    """
+    Notch and bandpass filters signal (channels x samples) into out. Both filters treat every channel
+    on its own, so when chunked (out of core) they run on a few channels at a time.
+    """
+    out = np.empty(np.shape(signal), dtype=signal.dtype) if out is None else out
+    nrows, ncols = np.shape(signal)
+    groups = chunk_rows(nrows, ncols, FILTER_BYTES_PER_SAMPLE) if chunked else [(0, nrows)]
+
+    for first, last in groups:
+        filtered = notch_filter(signal[first:last], fsamp)
+        out[first:last] = bandpass_filter(filtered, fsamp, emg_type=emg_type, out=filtered)
+    return out
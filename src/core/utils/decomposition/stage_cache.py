@@ -0,0 +1,216 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from core.utils.decomposition.decomposition_engine import (
+    DecompositionEngine,
+    SeparationResult,
+    SpheredBatch,
+    accepted_separations,
+)
+from core.utils.decomposition.signal_store import chunk_rows
+
+# bumped whenever the stored arrays or the way they are computed change, so old entries are never read
+CACHE_VERSION = 1
+
+# settings each stage depends on (on top of its input): sphering depends on the batch, separation on
+# the whitened observations. sil_thr and cov_thr only decide which separations are accepted, which is
+# recomputed on every run, except with peel-off where sil_thr changes the residual
+PREPARE_FIELDS = ("fsamp", "extended_channels", "edges2remove", "to_filter", "emg_type", "differential_mode", "dtype")
+SEPARATE_FIELDS = (
+    "fsamp",
+    "its",
+    "cf_type",
+    "initialisation",
+    "peel_off",
+    "fpa_its",
+    "ica_block_size",
+    "peak_reuse_tol",
+    "dtype",
+)
+
+SPHERED_ARRAYS = ("whitened", "whiten_mat", "dewhiten_mat", "covariance", "extend_mean")
+
+
+def array_digest(array):
+    """Hex digest of the shape, dtype and contents of array, read a few rows at a time."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{np.shape(array)} {np.dtype(array.dtype).str}".encode())
+    rows = np.reshape(array, (len(array), -1)) if np.ndim(array) > 1 else np.reshape(array, (1, -1))
+    for first, last in chunk_rows(len(rows), rows.shape[1], rows.dtype.itemsize):
+        digest.update(np.ascontiguousarray(rows[first:last]))
+    return digest.hexdigest()
+
+
+def stage_key(stage, digest, params, fields, engine="numpy", **extra):
+    """Cache key of a stage: its input digest and the settings in fields (plus extra ones)."""
+    settings = {name: getattr(params, name) for name in fields}
+    settings.update(extra)
+    settings["dtype"] = np.dtype(settings.get("dtype", np.float64)).str
+    description = json.dumps([CACHE_VERSION, stage, engine, digest, settings], sort_keys=True, default=str)
+    return hashlib.blake2b(description.encode(), digest_size=20).hexdigest()
+
+
+class StageCache:
+    """
+    Content-addressed store of stage outputs on disk.
+
+    Every entry is a directory of .npy files named by its key, so an input file, electrode, window
+    or setting that changes gives a new key and stale entries are simply never read again. Entries
+    are written to a temporary directory and renamed into place, so worker processes can share a
+    cache. When the entries exceed max_bytes, the least recently used ones are removed.
+    """
+
+    def __init__(self, directory, max_bytes=2 << 30):
+        self.directory = directory
+        self.max_bytes = int(max_bytes)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return os.path.isdir(self.path(key))
+
+    def get(self, key, mmap_mode=None):
+        """The arrays stored under key (a dict), or None. A hit marks the entry as recently used."""
+        path = self.path(key)
+        try:
+            arrays = {
+                entry.name[:-4]: np.load(entry.path, mmap_mode=mmap_mode)
+                for entry in os.scandir(path)
+                if entry.name.endswith(".npy")
+            }
+            os.utime(path)
+        except (FileNotFoundError, ValueError, OSError):  # evicted meanwhile or partly removed
+            return None
+        return arrays
+
+    def put(self, key, arrays):
+        """Stores a dict of arrays under key, then evicts entries beyond max_bytes."""
+        temporary = self.path(f".{key}.{os.getpid()}")
+        os.makedirs(temporary, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, name + ".npy"), array)
+        try:
+            os.rename(temporary, self.path(key))
+        except OSError:  # another process stored the same entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        """(last use, bytes, path) of every entry, least recently used first."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                nbytes = sum(item.stat().st_size for item in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, nbytes, entry.path))
+            except FileNotFoundError:
+                continue
+        return sorted(entries)
+
+    def nbytes(self):
+        """Bytes on disk used by the entries."""
+        return sum(nbytes for _, nbytes, _ in self.entries())
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries = self.entries()
+        total = sum(nbytes for _, nbytes, _ in entries)
+        for _, nbytes, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= nbytes
+
+    def clear(self):
+        for _, _, path in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+class CachedEngine(DecompositionEngine):
+    """
+    Wraps an engine so that its sphered batches and raw separations (MU filters, SILs and CoVs of
+    every iteration) are kept in a StageCache and reused when the same batch is decomposed again with
+    the settings they depend on. Changing only the thresholds then re-runs the thresholding and the
+    post-processing, not the sphering and FastICA.
+
+    Separations from random initialisations are keyed by the state of the global random number
+    generator, and a hit leaves the generator in the state the separation left it in, so the
+    following stages draw the same numbers as without the cache.
+    """
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+        self.name = engine.name
+
+    def prepare(self, batch, params, out=None):
+        key = stage_key("prepare", array_digest(batch), params, PREPARE_FIELDS, self.name)
+        stored = self.cache.get(key, mmap_mode="r")
+        if stored is not None and stored["whitened"].shape == params.whitened_shape(*np.shape(batch)):
+            print("Reusing cached sphering")
+            if out is None:
+                out = np.empty(stored["whitened"].shape, dtype=params.dtype)
+            out[...] = stored["whitened"]
+            return SpheredBatch(
+                out,
+                np.array(stored["whiten_mat"]),
+                np.array(stored["dewhiten_mat"]),
+                np.array(stored["covariance"]),
+                np.array(stored["extend_mean"]),
+                (np.array(stored["evalues"]), np.array(stored["evectors"])),
+                int(stored["ext_factor"]),
+            )
+
+        sphered = self.engine.prepare(batch, params, out=out)
+        arrays = {name: getattr(sphered, name) for name in SPHERED_ARRAYS}
+        arrays.update(evalues=sphered.eig[0], evectors=sphered.eig[1], ext_factor=np.array(sphered.ext_factor))
+        self.cache.put(key, arrays)
+        return sphered
+
+    def separate(self, sphered, params, callback=None):
+        extra = dict(sil_thr=params.sil_thr) if params.peel_off == 1 else {}
+        if params.initialisation:
+            # random initialisations depend on the state of the global generator, which a hit restores
+            extra["random_state"] = random_state_digest()
+        key = stage_key("separate", array_digest(sphered.whitened), params, SEPARATE_FIELDS, self.name, **extra)
+        stored = self.cache.get(key)
+        if stored is not None:
+            print(f"Reusing cached separation of {params.its} iterations")
+            if params.initialisation:
+                set_random_state(stored)
+            mu_filters, sils, covs = stored["mu_filters"], stored["sils"], stored["covs"]
+            if callback is not None:
+                # progress of the scored iterations is replayed without their sources (not cached)
+                for i in np.flatnonzero(np.any(mu_filters, axis=0)):
+                    callback(i, None, None, sils[i], covs[i])
+            return SeparationResult(mu_filters, sils, covs, accepted_separations(sils, covs, params))
+
+        result = self.engine.separate(sphered, params, callback)
+        arrays = dict(mu_filters=result.mu_filters, sils=result.sils, covs=result.covs)
+        if params.initialisation:
+            arrays.update(random_state_arrays())
+        self.cache.put(key, arrays)
+        return result
+
+
+def random_state_digest():
+    """Digest of the state of NumPy's global random number generator."""
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return f"{array_digest(keys)} {pos} {has_gauss} {cached_gaussian!r}"
+
+
+def random_state_arrays():
+    """The state of NumPy's global random number generator as arrays."""
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return dict(random_keys=keys, random_position=np.array([pos, has_gauss]), random_gauss=np.array(cached_gaussian))
+
+
+def set_random_state(arrays):
+    """Restores the state of random_state_arrays, as if the cached stage had just run."""
+    pos, has_gauss = arrays["random_position"]
+    np.random.set_state(("MT19937", arrays["random_keys"], int(pos), int(has_gauss), float(arrays["random_gauss"])))
@@ -0,0 +1,102 @@
+import numpy as np
+
+
+def two_class_kmeans(values):
+    """
+    Splits 1-D values (e.g. peak heights) into a low (noise) and a high (spikes) cluster.
+
+    In 1-D the two clusters of any 2-means solution are contiguous in sorted order, so after a
+    sort every split point is a candidate, and the within-cluster sums of squares of all of them
+    follow from prefix sums. The best split is the exact 2-means optimum, found deterministically
+    and without the estimator overhead of sklearn's KMeans.
+
+    Args:
+        values: 1-D array (or column vector) of values
+
+    Returns:
+        labels: 1 for the values in the high cluster, 0 for the low cluster
+        centroids: [low centroid, high centroid]
+        inertia: within-cluster sums of squared distances [low, high]; their sum is KMeans' inertia_
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    nvalues = len(values)
+    labels = np.ones(nvalues, dtype=int)
+
+    if nvalues < 2:
+        centroid = values.mean() if nvalues else 0.0
+        return labels, np.array([centroid, centroid]), np.zeros(2)
+
+    order = np.argsort(values, kind="stable")
+    sorted_values = values[order] - values.mean()  # centred, so the prefix sums lose less precision
+
+    csum = np.cumsum(sorted_values)
+    csq = np.cumsum(sorted_values**2)
+    nlow = np.arange(1, nvalues)
+    low_sse = csq[:-1] - csum[:-1] ** 2 / nlow
+    high_sse = (csq[-1] - csq[:-1]) - (csum[-1] - csum[:-1]) ** 2 / (nvalues - nlow)
+    split = int(np.argmin(low_sse + high_sse)) + 1
+
+    labels[order[:split]] = 0
+    low, high = values[order[:split]], values[order[split:]]
+    centroids = np.array([low.mean(), high.mean()])
+    inertia = np.array([np.sum((low - centroids[0]) ** 2), np.sum((high - centroids[1]) ** 2)])
+
+    return labels, centroids, inertia
+
+
+def two_class_kmeans_groups(groups):
+    """
+    two_class_kmeans labels of several 1-D groups of values (e.g. the peak heights of every MU) at once.
+
+    The groups are concatenated and sorted group by group, and the split costs of all of them come
+    from one set of prefix sums, restarted at the first value of each group.
+
+    Args:
+        groups: sequence of 1-D arrays
+
+    Returns:
+        list with the labels of each group (1 = high cluster, 0 = low cluster)
+    """
+    groups = [np.asarray(values, dtype=float).ravel() for values in groups]
+    lengths = np.array([len(values) for values in groups], dtype=int)
+    if lengths.sum() == 0:
+        return [np.ones(n, dtype=int) for n in lengths]
+
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    group_ids = np.repeat(np.arange(len(groups)), lengths)
+    values = np.concatenate(groups)
+    order = np.lexsort((values, group_ids))  # stable, as the per-group argsort
+
+    # centred per group, so the prefix sums lose less precision
+    means = np.add.reduceat(values, starts[lengths > 0]) / lengths[lengths > 0]
+    sorted_values = values[order] - np.repeat(means, lengths[lengths > 0])
+
+    def group_prefix(sums):
+        # prefix sums that restart at every group
+        before = np.concatenate([[0.0], sums])[starts]
+        return sums - np.repeat(before, lengths)
+
+    csum = group_prefix(np.cumsum(sorted_values))
+    csq = group_prefix(np.cumsum(sorted_values**2))
+    ends = starts + lengths - 1
+    total_sum, total_sq = np.repeat(csum[np.maximum(ends, 0)], lengths), np.repeat(csq[np.maximum(ends, 0)], lengths)
+
+    nlow = np.arange(len(values)) - np.repeat(starts, lengths) + 1
+    nvalues = np.repeat(lengths, lengths)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low_sse = csq - csum**2 / nlow
+        high_sse = (total_sq - csq) - (total_sum - csum) ** 2 / (nvalues - nlow)
+    costs = np.where(nlow < nvalues, low_sse + high_sse, np.inf)  # the last value of a group is not a split
+
+    # first minimum of each group: sorted by group, then cost, ties kept in position order
+    best = np.lexsort((costs, group_ids))[starts[lengths > 0]]
+    splits = np.zeros(len(groups), dtype=int)
+    splits[lengths > 0] = best - starts[lengths > 0] + 1
+
+    labels = []
+    for values, start, length, split in zip(groups, starts, lengths, splits):
+        group_labels = np.ones(length, dtype=int)
+        if length >= 2:
+            group_labels[order[start : start + split] - start] = 0
+        labels.append(group_labels)
+    return labels
@@ -12,24 +12,45 @@ def whiten_emg(signal):
     """
 
     cov_mat = np.cov(np.squeeze(signal), bias=True)
+    whitening_mat, dewhitening_mat = whitening_matrices(cov_mat)
+    whitened_emg = np.matmul(whitening_mat, signal).real
+
+    return whitened_emg, whitening_mat, dewhitening_mat
+
+
+def whitening_matrices(cov_mat, eigen=None):
+    """
+    Whitening and dewhitening matrices for a covariance matrix, keeping the eigenvalues above
+    the mean of the smallest half (the rest is treated as noise).
+    eigen can pass in an (evalues, evectors) decomposition of cov_mat that is already known.
+    """
+
     # get the eigenvalues and eigenvectors of the covariance matrix
-    evalues, evectors = scipy.linalg.eigh(cov_mat)
+    evalues, evectors = scipy.linalg.eigh(cov_mat) if eigen is None else eigen
     # in MATLAB: eig(A) returns diagonal matrix D of eigenvalues and matrix V whose columns are the corresponding right eigenvectors, so that A*V = V*D
 
+    # use the rank limit to segment the eigenvalues and the eigenvectors
+    retained = retained_eigenvalues(evalues)
+    evectors = evectors[:, retained]
+    evalues = evalues[retained]
+    diag_mat = np.diag(evalues)
+    whitening_mat = evectors @ np.linalg.inv(np.sqrt(diag_mat)) @ np.transpose(evectors)
+    dewhitening_mat = evectors @ np.sqrt(diag_mat) @ np.transpose(evectors)
+
+    return whitening_mat, dewhitening_mat
+
+
+def retained_eigenvalues(evalues):
+    """
+    Mask of the eigenvalues of a covariance matrix kept by whitening_matrices: those above the mean
+    of the smallest half (the rest is treated as noise).
+    """
     sorted_evalues = np.sort(evalues)[::-1]
     penalty = np.mean(sorted_evalues[len(sorted_evalues) // 2 :])  # int won't wokr for odd numbers
-    penalty = max(0, penalty)  # type:ignore
+    penalty = max(0, penalty)  # type: ignore
 
     rank_limit = np.sum(evalues > penalty) - 1
-    if rank_limit < np.shape(signal)[0]:
+    if rank_limit < len(evalues):
         hard_limit = (np.real(sorted_evalues[rank_limit]) + np.real(sorted_evalues[rank_limit + 1])) / 2
 
-    # use the rank limit to segment the eigenvalues and the eigenvectors
-    evectors = evectors[:, evalues > hard_limit]
-    evalues = evalues[evalues > hard_limit]
-    diag_mat = np.diag(evalues)
-    whitening_mat = evectors @ np.linalg.inv(np.sqrt(diag_mat)) @ np.transpose(evectors)
-    dewhitening_mat = evectors @ np.sqrt(diag_mat) @ np.transpose(evectors)
-    whitened_emg = np.matmul(whitening_mat, signal).real
-
-    return whitened_emg, whitening_mat, dewhitening_mat
+    return evalues > hard_limit
@@ -0,0 +1,86 @@
+import os
+import sys
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Workspace:
+    """
+    Named buffers for the large per-interval arrays of a decomposition (e.g. the whitened observations).
+
+    Every name is backed by one buffer that is allocated on first use, grown when a larger array is
+    asked for, and otherwise reused: decomposing the next electrode overwrites the arrays handed out
+    for the previous one instead of allocating new ones. Buffers are not pickled, so worker processes
+    start with an empty workspace of their own.
+
+    With a SignalStore, the buffers are files of the store instead of memory (out-of-core mode).
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._buffers = {}
+
+    def array(self, name, shape, dtype=np.float64):
+        """An uninitialised array of the given shape and dtype in the buffer called name."""
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.nbytes < nbytes:
+            # drop the old buffer before allocating the larger one
+            buffer = None
+            self._buffers.pop(name, None)
+            if self.store is None:
+                buffer = np.empty(nbytes, dtype=np.uint8)
+            else:
+                # one file per process, as pool workers share the store
+                buffer = self.store.create(f"workspace_{os.getpid()}_{name}", (nbytes,), np.uint8)
+            self._buffers[name] = buffer
+        return buffer[:nbytes].view(dtype).reshape(shape)
+
+    @property
+    def nbytes(self):
+        """Bytes held by all buffers."""
+        return sum(buffer.nbytes for buffer in self._buffers.values())
+
+    def release(self):
+        """Frees all buffers."""
+        self._buffers.clear()
+
+    def __getstate__(self):
+        return dict(store=self.store)
+
+    def __setstate__(self, state):
+        self.store = state.get("store")
+        self._buffers = {}
+
+
+def reset_peak_working_set():
+    """Restarts the peak resident set size of this process from the current one (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_working_set():
+    """Peak resident set size of this process in bytes, since the last reset_peak_working_set on Linux."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if resource is None:
+        return 0
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
@@ -0,0 +1,392 @@
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from scipy.signal import find_peaks
+from core.utils.manual_editing.getsil import getsil
+from core.utils.manual_editing.refinesil import refinesil
+from core.utils.manual_editing.extendfilter import extendfilter
+from core.utils.manual_editing.sliding_filter import SlidingFilter
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+from core.utils.decomposition.remove_outliers import remove_outliers
+from core.utils.decomposition.remove_duplicates import remove_duplicates
+from core.utils.decomposition.remove_duplicates_between_arrays import remove_duplicates_between_arrays
+from core.utils.decomposition.extended_signal import ExtendedSignal
+
+UNITS_PER_WORKER = 8
+
+# windows of extend_filter_job between two previews
+PREVIEW_STEPS = 4
+
+
+def editor_extension_factor(nchans):
+    """The extension factor the manual editor uses to update all MU filters: about 1000 channels, at most 25 lags."""
+    return min(1000 // nchans, 25)
+
+
+class EditJobCancelled(Exception):
+    """Raised inside a job function when its job has been cancelled."""
+
+
+class EditJob:
+    """
+    One edit of the manual editor, run away from the GUI thread (see workers.EditJobWorker).
+
+    The job function is called as function(job, *args, **kwargs). It works on copies of the edited
+    data and returns the edit as a result, which the editor applies on the GUI thread, so a cancelled
+    or failed job leaves the edition untouched. Between steps the function calls job.report, which
+    forwards its progress (and optionally a partial result to preview) and raises EditJobCancelled
+    once the job has been cancelled.
+    """
+
+    def __init__(self, name, function, *args, **kwargs):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.progress_callback = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop at its next step (thread-safe)."""
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        """Raises EditJobCancelled if the job has been cancelled."""
+        if self._cancel.is_set():
+            raise EditJobCancelled(self.name)
+
+    def report(self, message, fraction, partial=None):
+        """Reports the progress of the job (fraction between 0 and 1), then stops it if cancelled."""
+        self.check()
+        if self.progress_callback is not None:
+            self.progress_callback(self, message, float(fraction), partial)
+
+    def run(self):
+        """Runs the job function in the calling thread and returns its result."""
+        self.check()
+        return self.function(self, *self.args, **self.kwargs)
+
+
+def unit_sil(pulse_train, discharge_times, fsamp):
+    """SIL and continuous SIL of one MU (0 and a single zero row with fewer than 3 discharges)."""
+    if len(discharge_times) > 2:
+        try:
+            return getsil(pulse_train, fsamp), refinesil(pulse_train, discharge_times, fsamp)
+        except Exception as e:
+            print(f"Error calculating SIL: {e}")
+    return 0, np.zeros((1, 2))
+
+
+def unit_sil_after_edit(pulse_train, discharge_times, fsamp, sil, silcon, start, stop):
+    """
+    unit_sil of one MU whose discharge times (not its pulse train) changed between samples start and
+    stop, from its SIL values before the edit: the SIL of the pulse train is kept, and only the windows
+    of the continuous SIL around the edit are recomputed.
+    """
+    if len(discharge_times) > 2 and 1 < len(silcon) == int(np.floor(len(pulse_train) / fsamp)):
+        try:
+            return sil, refinesil(pulse_train, discharge_times, fsamp, silcon, (start, stop))
+        except Exception as e:
+            print(f"Error calculating SIL: {e}")
+    return unit_sil(pulse_train, discharge_times, fsamp)
+
+
+def unit_edit(pulse_train, discharge_times, fsamp, keep_pulse_train=False):
+    """The edit of one MU: its new pulse train (None if kept), discharge times and SIL values."""
+    sil, silcon = unit_sil(pulse_train, discharge_times, fsamp)
+    return {
+        "pulse_train": None if keep_pulse_train else pulse_train,
+        "discharge_times": discharge_times,
+        "sil": sil,
+        "silcon": silcon,
+    }
+
+
+def silhouette_job(job, units, fsamp, is_current=None):
+    """
+    Computes the SIL values of units in the background, in order.
+
+    Args:
+        units: [(key, version, pulse_train, discharge_times)], the version of each unit's discharge times
+        is_current: optional callable key -> True when the SIL of the unit is already known (computed
+            by someone else meanwhile), checked before each unit to skip it
+
+    Each SIL is reported as a partial result (key, version, sil, silcon) as soon as it is known.
+    """
+    for n, (key, version, pulse_train, discharge_times) in enumerate(units):
+        if is_current is not None and is_current(key):
+            continue
+        sil, silcon = unit_sil(pulse_train, discharge_times, fsamp)
+        job.report(f"Computing SIL values ({n + 1}/{len(units)})", (n + 1) / len(units), (key, version, sil, silcon))
+
+
+def update_filter_job(job, emg_data, emg_mask, pulse_train, discharge_times, idx, fsamp, emg_type, lock=False):
+    """
+    Re-estimates the filter of one MU from its discharge times in the window idx (extendfilter).
+
+    With lock, the discharge times are kept and only the pulse train is updated.
+
+    Returns:
+        dict with the edited unit (see unit_edit)
+    """
+    job.report("Updating the MU filter...", 0)
+    updated_pulse_train, updated_discharge_times = extendfilter(
+        emg_data, emg_mask, pulse_train.copy(), discharge_times, idx, fsamp, emg_type
+    )
+    if lock:
+        updated_discharge_times = discharge_times
+
+    job.report("Computing the SIL...", 0.9)
+    return unit_edit(updated_pulse_train, updated_discharge_times, fsamp)
+
+
+def extend_filter_job(job, emg_data, emg_mask, pulse_train, discharge_times, current_idx, fsamp, emg_type):
+    """
+    Extends the filter of one MU from the window current_idx to the whole signal.
+
+    The window slides forward, then backward, in half-window steps, and the filter is re-estimated
+    in each of them (extendfilter, with the covariances of the overlapping windows built incrementally
+    by a SlidingFilter). The pulse train and discharge times are reported as a partial result
+    (pulse_train, discharge_times) every PREVIEW_STEPS windows, for a live preview.
+
+    Returns:
+        dict with the edited unit (see unit_edit)
+    """
+    pulse_train = pulse_train.copy()
+    signal_length = len(pulse_train)
+    step = max(len(current_idx) // 2, 1)
+    first, last = current_idx[0], current_idx[0] + 2 * step  # two whole steps, so the windows share half
+    nforward = max(int((signal_length - current_idx[-1]) / step), 0)
+    nbackward = max(int(current_idx[0] / step), 0)
+    nsteps = max(nforward + nbackward, 1)
+    sliding = SlidingFilter(emg_data, emg_mask, fsamp, emg_type)
+
+    done = 0
+    for direction, nwindows in ((1, nforward), (-1, nbackward)):
+        start, stop = first, last
+        for j in range(1, nwindows + 1):
+            # the boundary with the previous window splits this one into its shared and its new samples
+            middle = stop if direction == 1 else start
+            start = max(first + direction * j * step, 0)
+            stop = min(last + direction * j * step, signal_length)
+            if start >= stop:
+                break
+
+            pulse_train, discharge_times = sliding.update(pulse_train, discharge_times, start, stop, middle)
+
+            done += 1
+            partial = (pulse_train.copy(), discharge_times) if done % PREVIEW_STEPS == 0 else None
+            job.report(f"Extending the MU filter ({done}/{nsteps})", done / nsteps, partial)
+
+    job.report("Computing the SIL...", 1)
+    return unit_edit(pulse_train, discharge_times, fsamp)
+
+
+def remove_outliers_job(job, pulse_trains, discharge_times, fsamp, n_workers=1):
+    """
+    Removes the discharges creating outlying discharge rates from every MU (remove_outliers).
+
+    The MUs are processed in n_workers worker processes (see map_units).
+
+    Returns:
+        dict of the edited units, {(array_idx, mu_idx): unit edit}
+    """
+    units = [
+        (array_idx, mu_idx)
+        for array_idx in range(len(pulse_trains))
+        for mu_idx in range(len(pulse_trains[array_idx]))
+        if len(discharge_times.get((array_idx, mu_idx), ())) > 1
+    ]
+    arguments = [
+        (pulse_trains[array_idx][mu_idx, :], discharge_times[array_idx, mu_idx], fsamp) for array_idx, mu_idx in units
+    ]
+
+    edits = map_units(job, unit_outliers, units, arguments, "Removing outliers", n_workers)
+    job.report("Outliers removed", 1)
+    return edits
+
+
+def update_all_filters_job(job, emg_data, pulse_trains, discharge_times, fsamp, n_workers=1):
+    """
+    Re-estimates the filters of all MUs from their discharge times over the whole signal.
+
+    The extended signal of each array (editor_extension_factor) and the pseudoinverse of its
+    covariance are computed once (ExtendedSignal), and the pulse trains of all its MUs come from
+    one product. Their spikes and SIL values are then found in n_workers worker processes (see
+    map_units).
+
+    Args:
+        emg_data: the accepted channels of each array (channels x samples)
+        pulse_trains: the pulse trains of each array (MUs x samples)
+        discharge_times: {(array_idx, mu_idx): discharge times}
+        fsamp: sampling frequency
+        n_workers: number of worker processes
+
+    Returns:
+        dict of the edited units, {(array_idx, mu_idx): unit edit}
+    """
+    units, arguments = [], []
+
+    for array_idx in range(len(pulse_trains)):
+        mus = [
+            mu_idx
+            for mu_idx in range(len(pulse_trains[array_idx]))
+            if len(discharge_times.get((array_idx, mu_idx), ())) > 1
+        ]
+        if not mus:
+            continue
+
+        job.report(f"Estimating the filters of Array #{array_idx+1}", 0.5 * array_idx / len(pulse_trains))
+        extended = ExtendedSignal(emg_data[array_idx], ext_factor=editor_extension_factor(len(emg_data[array_idx])))
+        sources = extended.project(extended.mu_filters([discharge_times[array_idx, mu_idx] for mu_idx in mus]))
+
+        units += [(array_idx, mu_idx) for mu_idx in mus]
+        arguments += [(source, fsamp) for source in sources]
+
+    edits = map_units(job, unit_update, units, arguments, "Updating the filters", n_workers, start=0.5)
+    job.report("Filters updated", 1)
+    return edits
+
+
+def unit_outliers(pulse_train, discharge_times, fsamp):
+    """The edit of one MU without the discharges creating outlying discharge rates (pulse train kept)."""
+    filtered_times = remove_outliers(pulse_train[None, :], [discharge_times], fsamp, threshold=0.3)[0]
+    return unit_edit(pulse_train, filtered_times, fsamp, keep_pulse_train=True)
+
+
+def unit_update(source, fsamp):
+    """
+    The edit of one MU from its source (the output of its filter): the squared and normalised pulse
+    train, and its spikes, the peaks of the high class without the outliers.
+    """
+    pulse_train = source * np.abs(source)
+    peaks, _ = find_peaks(pulse_train, distance=round(0.005 * fsamp))
+
+    # Normalize using top peaks
+    if len(peaks) >= 10:
+        pulse_train = pulse_train / np.mean(np.sort(pulse_train[peaks])[-10:])
+    elif len(peaks) > 0:
+        pulse_train = pulse_train / np.mean(pulse_train[peaks])
+
+    # Cluster peaks to find spikes, keeping the class with the highest centroid, then remove outliers
+    if len(peaks) >= 2:
+        labels, _, _ = two_class_kmeans(pulse_train[peaks])
+        spikes = peaks[labels == 1]
+        threshold = np.mean(pulse_train[spikes]) + 3 * np.std(pulse_train[spikes])
+        spikes = spikes[pulse_train[spikes] <= threshold]
+    else:
+        spikes = peaks
+
+    return unit_edit(pulse_train, spikes, fsamp)
+
+
+def map_units(job, function, units, arguments, message, n_workers=1, start=0, stop=1):
+    """
+    Calls function(*arguments[n]) for every unit, reporting the progress of the job from start to stop.
+
+    With more than one worker the calls are fanned out to a pool of n_workers spawned processes (with
+    at least UNITS_PER_WORKER units each, to pay for their startup), and the calls still pending are
+    dropped when the job is cancelled, without waiting for the running ones. The results only come back together, so they can be merged
+    into the edition at once.
+
+    Returns:
+        {unit: result}
+    """
+    n_workers = max(1, min(int(n_workers), len(units) // UNITS_PER_WORKER))
+    results = {}
+
+    if n_workers == 1:
+        for n, (unit, args) in enumerate(zip(units, arguments)):
+            job.report(f"{message} ({n + 1}/{len(units)})", start + (stop - start) * n / len(units))
+            results[unit] = function(*args)
+        return results
+
+    # spawn rather than fork: the caller usually has BLAS and Qt threads running
+    context = mp.get_context("spawn")
+    with ProcessPoolExecutor(n_workers, mp_context=context) as pool:
+        pending = {pool.submit(function, *args): unit for unit, args in zip(units, arguments)}
+        try:
+            while pending:
+                job.report(
+                    f"{message} ({len(results)}/{len(units)})", start + (stop - start) * len(results) / len(units)
+                )
+                done, _ = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+        except EditJobCancelled:
+            # return at once, leaving the running calls to finish in their workers
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    return results
+
+
+def remove_duplicates_within_arrays_job(job, pulse_trains, discharge_times, fsamp):
+    """
+    Removes the duplicate MUs of each array (remove_duplicates).
+
+    Returns:
+        dict with the new Pulsetrain and Dischargetimes of the edition (the SIL values of the
+        renumbered units are left to the editor to compute)
+    """
+    edition = {"Pulsetrain": [], "Dischargetimes": {}}
+
+    for array_idx, pulse_train in enumerate(pulse_trains):
+        job.report(f"Removing duplicates in Array #{array_idx+1}", array_idx / len(pulse_trains))
+        times = [discharge_times.get((array_idx, mu_idx), np.array([])) for mu_idx in range(pulse_train.shape[0])]
+
+        if pulse_train.shape[0] > 0:
+            times, pulse_train, _ = remove_duplicates(
+                pulse_train, times, times, np.zeros((1, 1)), round(fsamp / 40), 0.00025, 0.3, fsamp
+            )
+            pulse_train = np.array(pulse_train).reshape(len(times), pulse_trains[array_idx].shape[1])
+
+        edition["Pulsetrain"].append(pulse_train)
+        for mu_idx in range(pulse_train.shape[0]):
+            edition["Dischargetimes"][array_idx, mu_idx] = times[mu_idx]
+
+    job.report("Duplicates removed", 1)
+    return edition
+
+
+def remove_duplicates_between_arrays_job(job, pulse_trains, discharge_times, fsamp):
+    """
+    Removes the MUs duplicated across arrays (remove_duplicates_between_arrays).
+
+    Returns:
+        dict with the new Pulsetrain and Dischargetimes of the edition (the SIL values of the
+        renumbered units are left to the editor to compute)
+    """
+    job.report("Removing duplicates between arrays...", 0)
+    muscle = np.concatenate(
+        [np.full(pulse_train.shape[0], array_idx) for array_idx, pulse_train in enumerate(pulse_trains)]
+    )
+    all_pulse_trains = np.concatenate(pulse_trains, axis=0)
+    all_times = [
+        discharge_times.get((array_idx, mu_idx), np.array([]))
+        for array_idx, pulse_train in enumerate(pulse_trains)
+        for mu_idx in range(pulse_train.shape[0])
+    ]
+
+    times, unique_pulse_trains, unique_muscle, _ = remove_duplicates_between_arrays(
+        all_pulse_trains, all_times, muscle, round(fsamp / 40), 0.00025, 0.3, fsamp
+    )
+
+    edition = {"Pulsetrain": [], "Dischargetimes": {}}
+    for array_idx in range(len(pulse_trains)):
+        kept = np.flatnonzero(unique_muscle == array_idx)
+        edition["Pulsetrain"].append(
+            np.asarray(unique_pulse_trains)[kept].reshape(len(kept), all_pulse_trains.shape[1])
+        )
+        for mu_idx, unit in enumerate(kept):
+            edition["Dischargetimes"][array_idx, mu_idx] = times[unit]
+
+    job.report("Duplicates removed", 1)
+    return edition
@@ -1,9 +1,9 @@
 import numpy as np
 from scipy import signal
-from sklearn.cluster import KMeans
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
 from core.utils.decomposition.bandpass_filter import bandpass_filter
-from core.utils.decomposition.extend_emg import extend_emg
-from core.utils.decomposition.whiten_emg import whiten_emg
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.decomposition.whiten_emg import whitening_matrices
 
 
 def extendfilter(EMG, EMGmask, PulseT, distime, idx, fsamp, EMGtype):
@@ -21,23 +21,23 @@ def extendfilter(EMG, EMGmask, PulseT, distime, idx, fsamp, EMGtype):
         # Adjust spike indices to be relative to the window
         spikes2 = spikes1 - idx[0]
 
-        # Extend the EMG signal
+        # Extend the EMG signal (without building the extended matrix)
         exFactor1 = round(nbextchan / EMG.shape[0])
-        extended_template = np.zeros([EMG.shape[0] * exFactor1, EMG.shape[1] + exFactor1 - 1])
-        eSIG = extend_emg(extended_template, EMG, exFactor1)
+        eSIG = ExtendedEMG(EMG, exFactor1)
 
         # Create covariance matrix and its pseudoinverse
-        ReSIG = np.dot(eSIG, eSIG.T) / eSIG.shape[1]
+        ReSIG = eSIG.covariance()
         iReSIGt = np.linalg.pinv(ReSIG)
 
-        # Perform PCA and whitening
-        wSIG, _, dewhiteningMatrix = whiten_emg(eSIG)
+        # Perform PCA and whitening (from the covariance of the de-meaned extended signal)
+        mean = eSIG.mean()
+        whiteningMatrix, dewhiteningMatrix = whitening_matrices(ReSIG - np.outer(mean, mean))
 
         # Calculate the filter as the sum of whitened signal at spike times
-        MUFilters = np.sum(wSIG[:, spikes2], axis=1).reshape(-1, 1)
+        MUFilters = (whiteningMatrix @ np.sum(eSIG.columns(spikes2), axis=1)).reshape(-1, 1)
 
         # Update the pulse train
-        Pt = np.dot(np.dot(np.dot(dewhiteningMatrix, MUFilters).T, iReSIGt), eSIG)
+        Pt = eSIG.project(np.dot(np.dot(dewhiteningMatrix, MUFilters).T, iReSIGt))
         Pt = Pt[0, : EMG.shape[1]]
 
         # Set edges to zero
@@ -57,26 +57,23 @@ def extendfilter(EMG, EMGmask, PulseT, distime, idx, fsamp, EMGtype):
             Pt = Pt / np.mean(top_values)
 
             # K-means clustering to separate peaks
-            kmeans = KMeans(n_clusters=2, random_state=0).fit(Pt[peaks].reshape(-1, 1))
-            labels = kmeans.labels_
-            centroids = kmeans.cluster_centers_
+            labels, _, _ = two_class_kmeans(Pt[peaks])
 
-            # Find the class with the highest centroid
-            idx2 = np.argmax(centroids)
-            spikes2 = peaks[labels == idx2]
+            # Keep the class with the highest centroid
+            spikes2 = peaks[labels == 1]
 
             # Remove outliers
             outlier_threshold = np.mean(Pt[spikes2]) + 3 * np.std(Pt[spikes2])
             spikes2 = spikes2[Pt[spikes2] <= outlier_threshold]
 
             # Update the pulse train in the time window
-            start_idx = idx[0] + edge_samples - 1
-            end_idx = idx[-1] - edge_samples
+            start_idx = idx[0] + edge_samples
+            end_idx = idx[-1] - edge_samples + 1
             PulseT[start_idx:end_idx] = Pt[edge_samples:-edge_samples]
 
             # Update the discharge times
             distime = np.setdiff1d(distime, spikes1)
-            distime = np.append(distime, spikes2 + idx[0] - 1)
+            distime = np.append(distime, spikes2 + idx[0])
             distime = np.sort(distime)
 
     return PulseT, distime
@@ -1,6 +1,6 @@
 import numpy as np
 from scipy import signal
-from sklearn.cluster import KMeans
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
 
 
 def getsil(PulseT, fsamp):
@@ -13,24 +13,18 @@ def getsil(PulseT, fsamp):
     PulseT = PulseT / np.mean(top_values)
 
     # K-means clustering to separate the peaks
-    X = PulseT[peaks].reshape(-1, 1)
-    kmeans = KMeans(n_clusters=2, random_state=0).fit(X)
-    labels = kmeans.labels_
-    centroids = kmeans.cluster_centers_
+    labels, centroids, inertia = two_class_kmeans(PulseT[peaks])
 
-    # Find the class with the highest centroid
-    idx2 = np.argmax(centroids)
-
-    # Calculate silhouette
-    cluster_idx = labels == idx2
-    other_idx = np.logical_not(cluster_idx)
+    # Calculate silhouette on the class with the highest centroid
+    nspikes = np.sum(labels == 1)
+    other_idx = labels == 0
 
     # Calculate within-cluster distance
-    within = np.sum(np.square(X[cluster_idx] - centroids[idx2])) / np.sum(cluster_idx)
+    within = inertia[1] / nspikes
 
-    # Calculate between-cluster distance
+    # Calculate between-cluster distance (the spike centroid is the mean of the spikes)
     if np.sum(other_idx) > 0:
-        between = np.sum(np.square(X[cluster_idx] - centroids[1 - idx2])) / np.sum(cluster_idx)
+        between = within + (centroids[1] - centroids[0]) ** 2
         sil = (between - within) / max(within, between)
     else:
         sil = 0
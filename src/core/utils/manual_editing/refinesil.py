@@ -1,9 +1,39 @@
 import numpy as np
 from scipy.signal import find_peaks
-from sklearn.cluster import KMeans
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans_groups
 
 
-def refinesil(PulseT, distime, fsamp):
+def refinesil(PulseT, distime, fsamp, sil_vals=None, dirty=None):
+    """
+    Continuous silhouette of a pulse train: the silhouette of its peaks in each one-second window
+    with more than 2 peaks and more than 2 discharges (NaN in the others).
+
+    The peaks and discharge times are assigned to all the windows with one searchsorted, and the
+    peaks of every window are split in two classes at once (two_class_kmeans_groups).
+
+    Args:
+        PulseT: pulse train
+        distime: discharge times (samples)
+        fsamp: sampling frequency
+        sil_vals: optional previous result for the same pulse train, whose windows are reused
+        dirty: optional (start, stop) samples where distime changed since sil_vals; only the windows
+            around them are recomputed
+
+    Returns:
+        sil_vals: [time of the window (samples), silhouette] for each window
+    """
+    nwindows = int(np.floor(len(PulseT) / fsamp))
+    windows = np.arange(nwindows)
+
+    # Previous windows are reused when only the discharge times changed, in the dirty range
+    if sil_vals is not None and dirty is not None and len(sil_vals) == nwindows:
+        sil_vals = np.array(sil_vals, dtype=float)
+        first = max(int(np.floor(dirty[0] / fsamp)), 0)
+        last = min(int(np.ceil(dirty[1] / fsamp)) + 1, nwindows)
+        windows = windows[first:last]
+    else:
+        sil_vals = np.zeros((nwindows, 2))
+
     # Peak detection
     spikes, _ = find_peaks(PulseT, distance=round(fsamp * 0.005))
 
@@ -12,35 +42,36 @@ def refinesil(PulseT, distime, fsamp):
         max_vals = np.sort(PulseT[spikes])[-10:]
         PulseT = PulseT / np.mean(max_vals)
 
-    # Initialize silhouette values array
-    sil_vals = np.zeros((int(np.floor(len(PulseT) / fsamp)), 2))
-
-    # Calculate silhouette values for each time window
-    for i in range(int(np.floor(len(PulseT) / fsamp))):
-        # Find spikes in current window
-        idx = np.where((spikes > 1 + (i - 1) * fsamp) & (spikes < i * fsamp))[0]
-        idx1 = np.where((distime > 1 + (i - 1) * fsamp) & (distime < i * fsamp))[0]
-
-        if len(idx) > 2 and len(idx1) > 2:
-            # Run K-means
-            kmeans = KMeans(n_clusters=2, random_state=0).fit(PulseT[spikes[idx]].reshape(-1, 1))
-            L = kmeans.labels_
-            C = kmeans.cluster_centers_
-
-            # Calculate intra-cluster distances
-            idx2 = np.argmax(C)
-            within = kmeans.inertia_
-
-            # Calculate inter-cluster distances
-            other_cluster = 1 if idx2 == 0 else 0
-            points_in_cluster = PulseT[spikes[idx]][L == idx2].reshape(-1, 1)
-            between = np.sum((points_in_cluster - C[other_cluster]) ** 2)
-
-            # Store time point and silhouette value
-            sil_vals[i, 0] = np.floor(i * fsamp - (fsamp / 2))
-            sil_vals[i, 1] = (between - within) / max(within, between)
-        else:
-            sil_vals[i, 0] = np.floor(i * fsamp - (fsamp / 2))
-            sil_vals[i, 1] = np.nan
+    # Peaks and discharges strictly inside each window, 1 + (i - 1) * fsamp < t < i * fsamp
+    starts, ends = 1 + (windows - 1) * fsamp, windows * fsamp
+    first_spike = np.searchsorted(spikes, starts, side="right")
+    nspikes = np.searchsorted(spikes, ends, side="left") - first_spike
+    distime = np.sort(np.ravel(distime))
+    ndischarges = np.searchsorted(distime, ends, side="left") - np.searchsorted(distime, starts, side="right")
+
+    sil_vals[windows, 0] = np.floor(windows * fsamp - (fsamp / 2))
+    sil_vals[windows, 1] = np.nan
+
+    # K-means of the peaks of every window with enough of them
+    valid = (nspikes > 2) & (ndischarges > 2)
+    if np.any(valid):
+        groups = [PulseT[spikes[first : first + n]] for first, n in zip(first_spike[valid], nspikes[valid])]
+        labels = np.concatenate(two_class_kmeans_groups(groups))
+        values = np.concatenate(groups)
+
+        # Centroids and intra-cluster distances of the two classes of each window
+        classes = 2 * np.repeat(np.arange(len(groups)), nspikes[valid]) + labels
+        counts = np.bincount(classes, minlength=2 * len(groups))
+        centroids = np.bincount(classes, weights=values, minlength=2 * len(groups)) / counts
+        inertia = np.bincount(classes, weights=(values - centroids[classes]) ** 2, minlength=2 * len(groups))
+        centroids, inertia, counts = centroids.reshape(-1, 2), inertia.reshape(-1, 2), counts.reshape(-1, 2)
+
+        within = inertia.sum(axis=1)
+
+        # Inter-cluster distances (from the points of the highest cluster to the other centroid)
+        between = inertia[:, 1] + counts[:, 1] * (centroids[:, 1] - centroids[:, 0]) ** 2
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sil_vals[windows[valid], 1] = (between - within) / np.maximum(within, between)
 
     return sil_vals
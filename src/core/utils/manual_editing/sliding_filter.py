@@ -0,0 +1,120 @@
+import numpy as np
+import scipy
+from scipy import signal
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+from core.utils.decomposition.bandpass_filter import bandpass_filter
+from core.utils.decomposition.extend_emg import ExtendedEMG, lag_covariance
+from core.utils.decomposition.whiten_emg import retained_eigenvalues
+
+
+class SlidingFilter:
+    """
+    extendfilter for the windows of one array sliding over the signal, as in extend_mu_filter.
+
+    Consecutive windows share half of their samples, so each window is split into the part it shares
+    with the previous window and the part entering it. The lag autocorrelations of the extended
+    signal are kept per part, and the covariance of a window is those of its two parts plus the lag
+    products across their boundary: only the entering samples are new. One eigendecomposition of the
+    covariance then gives both the retained (whitened) subspace and the inverse of the covariance on
+    it, where extendfilter takes a pseudoinverse and a separate eigendecomposition.
+
+    The accepted channels are bandpassed once over the whole signal instead of window by window
+    (which only differs near the window edges, where the pulse train is not updated). Only the lag
+    products of the two parts of the last window are kept, as the next window shares one of them.
+    """
+
+    def __init__(self, emg, emg_mask, fsamp, emg_type="surface", nbextchan=1000):
+        self.signal = bandpass_filter(np.asarray(emg)[np.ravel(emg_mask) == 0], fsamp, emg_type)
+        self.fsamp = fsamp
+        self.ext_factor = round(nbextchan / self.signal.shape[0])
+        self.segments = {}
+
+    def lag_products(self, start, stop):
+        """Per-lag autocorrelations of the samples start:stop (see ExtendedEMG.lag_products), cached or not."""
+        if (start, stop) in self.segments:
+            return self.segments[start, stop]
+        return ExtendedEMG(self.signal[:, start:stop], self.ext_factor).lag_products()
+
+    def boundary_products(self, start, middle, stop):
+        """The lag products x(t) x(t + k).T of start:stop with t before middle and t + k from middle on."""
+        lags = np.zeros([self.ext_factor, self.signal.shape[0], self.signal.shape[0]])
+        for k in range(1, self.ext_factor):
+            first, last = max(start, middle - k), min(middle, stop - k)
+            if first < last:
+                lags[k] = self.signal[:, first:last] @ self.signal[:, first + k : last + k].T
+        return lags
+
+    def covariance(self, start, stop, middle=None):
+        """
+        The covariance of the extended samples start:stop (ExtendedEMG.covariance), from the lag
+        products of start:middle and middle:stop, which replace the cached ones.
+        """
+        if middle is None or not start < middle < stop:
+            lags = self.lag_products(start, stop)
+        else:
+            first, second = self.lag_products(start, middle), self.lag_products(middle, stop)
+            self.segments = {(start, middle): first, (middle, stop): second}
+            lags = first + second + self.boundary_products(start, middle, stop)
+        return lag_covariance(lags / (stop - start + self.ext_factor - 1))
+
+    def update(self, pulse_train, discharge_times, start, stop, middle=None):
+        """
+        extendfilter(emg, emg_mask, pulse_train, discharge_times, np.arange(start, stop), ...) from
+        the samples start:stop, split at middle (the boundary with the previous window).
+
+        Returns:
+            pulse_train (updated in place) and discharge_times
+        """
+        fsamp = self.fsamp
+
+        # Find spikes in the window (excluding edges)
+        edge_samples = round(0.1 * fsamp)
+        valid_window = np.arange(start + edge_samples, stop - edge_samples)
+        spikes1 = np.intersect1d(valid_window, discharge_times)
+
+        if len(spikes1) == 0:
+            return pulse_train, discharge_times
+
+        # Adjust spike indices to be relative to the window
+        spikes2 = spikes1 - start
+        window = ExtendedEMG(self.signal[:, start:stop], self.ext_factor)
+
+        # Inverse of the covariance on its retained subspace: the MU filter projected on the whitened
+        # subspace, (dewhitening @ whitening @ filter).T @ pinv(covariance) in extendfilter
+        evalues, evectors = scipy.linalg.eigh(self.covariance(start, stop, middle))
+        retained = retained_eigenvalues(evalues)
+        basis = evectors[:, retained]
+        weights = ((np.sum(window.columns(spikes2), axis=1) @ basis) / evalues[retained]) @ basis.T
+
+        # Update the pulse train
+        Pt = window.project(weights, 0, stop - start)
+
+        # Set edges to zero
+        Pt[:edge_samples] = 0
+        Pt[-edge_samples:] = 0
+
+        # Normalize the pulse train
+        Pt = Pt * np.abs(Pt)
+        peaks, _ = signal.find_peaks(Pt, distance=round(fsamp * 0.005))
+
+        if len(peaks) > 2:
+            # Normalize using the top 10 peak values or all if fewer
+            top_values = np.sort(Pt[peaks])[-10:]
+            Pt = Pt / np.mean(top_values)
+
+            # K-means clustering to separate peaks, keeping the class with the highest centroid
+            labels, _, _ = two_class_kmeans(Pt[peaks])
+            spikes2 = peaks[labels == 1]
+
+            # Remove outliers
+            outlier_threshold = np.mean(Pt[spikes2]) + 3 * np.std(Pt[spikes2])
+            spikes2 = spikes2[Pt[spikes2] <= outlier_threshold]
+
+            # Update the pulse train in the time window
+            pulse_train[start + edge_samples : stop - edge_samples] = Pt[edge_samples:-edge_samples]
+
+            # Update the discharge times
+            discharge_times = np.setdiff1d(discharge_times, spikes1)
+            discharge_times = np.sort(np.append(discharge_times, spikes2 + start))
+
+        return pulse_train, discharge_times
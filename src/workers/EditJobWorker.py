@@ -0,0 +1,67 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+import queue
+import traceback
+
+from core.utils.manual_editing.edit_jobs import EditJobCancelled
+
+
+class EditJobWorker(QThread):
+    """
+    Worker thread running the edit jobs of the manual editor (core.utils.manual_editing.edit_jobs.EditJob)
+    one after another, from a queue.
+
+    Jobs are submitted from the GUI thread, and their progress, results, failures and cancellations
+    come back to it through signals, so the numerical work of an edit never blocks the editor.
+    """
+
+    job_progress = pyqtSignal(object, str, float, object)  # job, message, fraction, partial result
+    job_finished = pyqtSignal(object, object)  # job, result
+    job_cancelled = pyqtSignal(object)  # job
+    job_failed = pyqtSignal(object, str)  # job, error message
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.jobs = queue.Queue()
+        self.current_job = None
+
+    def submit(self, job):
+        """Queues a job, starting the thread if needed."""
+        job.progress_callback = self.job_progress.emit
+        self.jobs.put(job)
+        if not self.isRunning():
+            self.start()
+
+    def stop(self, cancel=True):
+        """Stops the thread once the queued jobs are done (cancelling them first by default)."""
+        if not self.isRunning():
+            return
+        if cancel:
+            for job in [self.current_job] + list(self.jobs.queue):
+                if job is not None:
+                    job.cancel()
+        self.jobs.put(None)
+        self.wait()
+
+    def run(self):
+        """Runs the queued jobs until stopped."""
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+
+            self.current_job = job
+            try:
+                result = job.run()
+            except EditJobCancelled:
+                self.job_cancelled.emit(job)
+            except Exception as e:
+                print(f"Exception in EditJobWorker ({job.name}): {str(e)}")
+                traceback.print_exc()
+                self.job_failed.emit(job, str(e))
+            else:
+                if job.cancelled:
+                    self.job_cancelled.emit(job)
+                else:
+                    self.job_finished.emit(job, result)
+            finally:
+                self.current_job = None
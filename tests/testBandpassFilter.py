@@ -0,0 +1,66 @@
+"""
+Checks the second-order-section bandpass filter against per-channel filtfilt
+with the (b, a) form of the same Butterworth filter.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy
+import tracemalloc
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.bandpass_filter import bandpass_filter, design_bandpass
+
+
+def reference_bandpass_filter(signal, fsamp, emg_type):
+    lowfreq, highfreq, order = (20, 500, 2) if emg_type == "surface" else (100, 4400, 3)
+    b, a = scipy.signal.butter(order, [lowfreq / (fsamp / 2), highfreq / (fsamp / 2)], "bandpass")
+    return np.array([scipy.signal.filtfilt(b, a, chan, padtype="odd", padlen=3 * (len(b) - 1)) for chan in signal])
+
+
+class TestBandpassFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.signal = np.random.default_rng(0).normal(scale=50, size=(8, 10240 * 2))
+
+    def testMatchesFiltfilt(self):
+        for fsamp, emg_type in [(2048, "surface"), (10240, "intra")]:
+            expected = reference_bandpass_filter(self.signal, fsamp, emg_type)
+            npt.assert_allclose(bandpass_filter(self.signal, fsamp, emg_type), expected, atol=1e-9)
+
+    def testOutArgument(self):
+        expected = bandpass_filter(self.signal, 2048)
+        signal = self.signal.copy()
+        result = bandpass_filter(signal, 2048, out=signal)
+        self.assertIs(result, signal)
+        npt.assert_allclose(signal, expected)
+
+    def testFloat32(self):
+        result = bandpass_filter(self.signal.astype(np.float32), 2048)
+        self.assertEqual(result.dtype, np.float32)
+        npt.assert_allclose(result, bandpass_filter(self.signal, 2048), atol=1e-3)
+
+    def testFloat32InPlaceMemory(self):
+        signal = np.random.default_rng(1).normal(size=(64, 50000)).astype(np.float32)
+        expected = bandpass_filter(signal.astype(np.float64), 2048)
+
+        tracemalloc.start()
+        try:
+            bandpass_filter(signal, 2048, out=signal)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        # a float64 copy of all the channels alone would be twice the signal
+        self.assertLess(peak, signal.nbytes)
+        npt.assert_allclose(signal, expected, atol=1e-3)
+
+    def testDesignIsCached(self):
+        self.assertIs(design_bandpass(2048, "surface"), design_bandpass(2048, "surface"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Checks that the headless batch decomposition recognises its own outputs, so restarted runs skip them.
+"""
+
+import unittest
+from unittest import mock
+import tempfile
+import scipy.io as sio
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from batch_decompose import job_thread_budget, parameters_match
+from core.utils.config_and_input.prepare_parameters import prepare_parameters
+
+
+class TestBatchDecompose(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.savename = os.path.join(self.tmpdir.name, "trial_output_decomp.mat")
+        self.parameters = prepare_parameters({})
+        sio.savemat(self.savename, {"parameters": self.parameters}, do_compression=True)
+
+    def testSavedParametersMatch(self):
+        # empty strings (storedir, cachedir) come back from loadmat as empty arrays
+        self.assertEqual(self.parameters["storedir"], "")
+        self.assertTrue(parameters_match(self.savename, self.parameters))
+
+    def testExecutionParametersAreIgnored(self):
+        self.parameters.update(outofcore=1, storedir=self.tmpdir.name, cachedir=self.tmpdir.name, nworkers=4)
+        self.assertTrue(parameters_match(self.savename, self.parameters))
+
+    def testResultParametersMustMatch(self):
+        self.parameters["silthr"] = self.parameters["silthr"] + 0.05
+        self.assertFalse(parameters_match(self.savename, self.parameters))
+
+    def testJobsShareTheCores(self):
+        self.parameters.update(nworkers=4, blasthreads=0)
+        with mock.patch("os.cpu_count", return_value=16):
+            job_parameters, blas_threads = job_thread_budget(self.parameters, 4)
+
+        self.assertEqual(blas_threads, 4)
+        self.assertEqual(job_parameters["blasthreads"], 1)
+        self.assertEqual(self.parameters["blasthreads"], 0)
+
+    def testExplicitBlasThreadsArePerProcess(self):
+        self.parameters.update(nworkers=4, blasthreads=2)
+        job_parameters, blas_threads = job_thread_budget(self.parameters, 4)
+
+        self.assertEqual(blas_threads, 2)
+        self.assertEqual(job_parameters["blasthreads"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
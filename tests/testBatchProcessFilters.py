@@ -0,0 +1,68 @@
+"""
+Checks the stacked batch_process_filters against applying every MU filter to every window on its own.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.batch_process_filters import batch_process_filters
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+from core.utils.decomposition.evaluate_source import maxk
+from testDecompositionEngine import spike_train_emg
+
+
+def reference_batch_process_filters(whit_sig, mu_filters, plateau, extender, diff, orig_sig_size, fsamp):
+    """One filter and one window at a time."""
+    pulse_trains, discharge_times = [], []
+    for win_1 in range(len(whit_sig)):
+        for mu in range(np.shape(mu_filters[win_1])[1]):
+            pulse_train = np.zeros(orig_sig_size)
+            for win_2 in range(len(whit_sig)):
+                start, stop = int(plateau[win_2 * 2]), int(plateau[(win_2 + 1) * 2 - 1]) + extender - diff
+                pulse_train[start:stop] = mu_filters[win_1][:, mu] @ whit_sig[win_2]
+            pulse_train *= np.abs(pulse_train)
+            peaks, _ = scipy.signal.find_peaks(pulse_train, distance=np.round(fsamp * 0.005) + 1)
+            pulse_train /= np.mean(maxk(pulse_train, 10))
+            labels, _, _ = two_class_kmeans(pulse_train[peaks])
+            pulse_trains.append(pulse_train)
+            discharge_times.append(peaks[labels == 1])
+    return np.array(pulse_trains), discharge_times
+
+
+class TestBatchProcessFilters(unittest.TestCase):
+
+    def testMatchesPerFilterProducts(self):
+        fsamp, extender = 2048, 5
+        emg = spike_train_emg(fsamp, fsamp * 4, nchans=8)
+        plateau = np.array([100, 3000, 4200, 7500])
+        whit_sig = [emg[:, plateau[0] : plateau[1] + extender], emg[:, plateau[2] : plateau[3] + extender]]
+        rng = np.random.default_rng(4)
+        mu_filters = [rng.normal(size=(8, 3)), rng.normal(size=(8, 2))]
+
+        pulse_trains, discharge_times = batch_process_filters(
+            whit_sig, mu_filters, plateau, extender, 0, emg.shape[1], fsamp
+        )
+        expected_trains, expected_times = reference_batch_process_filters(
+            whit_sig, mu_filters, plateau, extender, 0, emg.shape[1], fsamp
+        )
+
+        self.assertEqual(pulse_trains.shape, (5, emg.shape[1]))
+        npt.assert_allclose(pulse_trains, expected_trains, atol=1e-10)
+        for times, expected in zip(discharge_times, expected_times):
+            npt.assert_array_equal(times, expected)
+
+    def testNoFilters(self):
+        pulse_trains, discharge_times = batch_process_filters(
+            [np.ones((4, 100))], [np.zeros((4, 0))], np.array([0, 99]), 1, 0, 200, 2048
+        )
+        self.assertEqual(pulse_trains.shape, (0, 200))
+        self.assertEqual(discharge_times, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
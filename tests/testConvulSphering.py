@@ -0,0 +1,55 @@
+"""
+Checks that convul_sphering, which works from the block Toeplitz covariance, gives the
+whitened observations and matrices of the dense extend / detrend / whiten_emg path.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.EmgDecomposition import offline_EMG
+from core.utils.decomposition.extend_emg import extend_emg
+from core.utils.decomposition.whiten_emg import whiten_emg
+
+
+class TestConvulSphering(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        sources = rng.laplace(size=(4, 3000)) ** 3
+        signal = rng.normal(size=(16, 4)) @ sources + rng.normal(size=(16, 3000)) + 1.5
+
+        emg = offline_EMG(save_dir=".", to_filter=False)
+        emg.ext_factor, emg.edges2remove, emg.differential_mode = 160, 0.05, 0
+        emg.signal_dict = dict(fsamp=2048, batched_data=[signal])
+        emg.plateau_coords = np.array([0, 3000])
+
+        n = 16 * 10
+        ncols = 3000 + 10 - 1 - 2 * int(np.round(2048 * 0.05)) + 1
+        emg.signal_dict.update(sq_extend_obvs=np.zeros([1, n, n]), inv_extend_obvs=[None], sphering_eig=[None])
+        emg.decomp_dict = dict(
+            whiten_mat=np.zeros([1, n, n]), dewhiten_mat=np.zeros([1, n, n]), whitened_obvs=np.zeros([1, n, ncols])
+        )
+        self.emg, self.signal = emg, signal
+
+    def testMatchesDenseSphering(self):
+        self.emg.convul_sphering(1, 0, 0)
+
+        extended = extend_emg(np.zeros([160, 3009]), self.signal, 10)
+        covariance = extended @ extended.T / extended.shape[1]
+        whitened, whiten_mat, dewhiten_mat = whiten_emg(scipy.signal.detrend(extended, axis=-1, type="constant"))
+        edges = int(np.round(2048 * 0.05))
+
+        npt.assert_allclose(self.emg.signal_dict["sq_extend_obvs"][0], covariance, atol=1e-10)
+        npt.assert_allclose(self.emg.decomp_dict["whiten_mat"][0], whiten_mat, atol=1e-8)
+        npt.assert_allclose(self.emg.decomp_dict["dewhiten_mat"][0], dewhiten_mat, atol=1e-8)
+        npt.assert_allclose(self.emg.decomp_dict["whitened_obvs"][0], whitened[:, edges - 1 : -edges], atol=1e-8)
+        npt.assert_allclose(self.emg.inverse_covariance(0), np.linalg.pinv(covariance), atol=1e-8)
+
+
+if __name__ == "__main__":
+    unittest.main()
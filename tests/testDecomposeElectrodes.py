@@ -0,0 +1,70 @@
+"""
+Checks that decompose_electrodes gives the same motor units with worker processes as in sequential mode,
+when the separation vectors are initialised at random, and that its workers stay within the caller's BLAS threads.
+"""
+
+import contextlib
+import io
+import unittest
+from unittest import mock
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.EmgDecomposition import offline_EMG
+from core.utils.decomposition.decompose_electrodes import caller_blas_threads, decompose_electrodes
+from testDecompositionEngine import spike_train_emg
+
+
+def two_electrode_emg(fsamp, nsamples):
+    """A batched offline_EMG with two 16-channel electrodes and random initialisation."""
+    data = np.vstack([spike_train_emg(fsamp, nsamples, seed=1), spike_train_emg(fsamp, nsamples, seed=2)])
+    emg = offline_EMG(save_dir=".", to_filter=False)
+    emg.apply_parameters({"nbextchan": 160, "edges": 0.05, "NITER": 4, "initialization": 1})
+    emg.signal_dict = dict(data=data, fsamp=fsamp, nchans=32, nelectrodes=2, target=np.ones(nsamples))
+    emg.chans_per_electrode = [16, 16]
+    emg.rejected_channels = [np.zeros(16), np.zeros(16)]
+    emg.emgopt = ["surface", "surface"]
+    emg.decomp_dict = {}
+    emg.mu_dict = dict(pulse_trains=[], discharge_times=[[]])
+    emg.batch_wo_target()
+    return emg
+
+
+class TestDecomposeElectrodes(unittest.TestCase):
+
+    def decompose(self, n_workers):
+        emg = two_electrode_emg(2048, 2048 * 4)
+        np.random.seed(7)
+        with contextlib.redirect_stdout(io.StringIO()):
+            decompose_electrodes(emg, 1, "skew", n_workers=n_workers)
+        return emg, np.random.get_state()[1]
+
+    def testWorkersMatchSequential(self):
+        sequential, sequential_state = self.decompose(1)
+        parallel, parallel_state = self.decompose(2)
+
+        npt.assert_array_equal(sequential_state, parallel_state)
+        self.assertEqual(len(sequential.mu_dict["pulse_trains"]), len(parallel.mu_dict["pulse_trains"]))
+        for a, b in zip(sequential.mu_dict["pulse_trains"], parallel.mu_dict["pulse_trains"]):
+            npt.assert_allclose(a, b, atol=1e-10)
+        for g in range(2):
+            self.assertEqual(len(sequential.mu_dict["discharge_times"][g]), len(parallel.mu_dict["discharge_times"][g]))
+            for a, b in zip(sequential.mu_dict["discharge_times"][g], parallel.mu_dict["discharge_times"][g]):
+                npt.assert_array_equal(a, b)
+        npt.assert_array_equal(sequential.mus_in_array, parallel.mus_in_array)
+
+    def testCallerLimitBoundsTheWorkers(self):
+        info = [dict(user_api="blas", num_threads=4), dict(user_api="openmp", num_threads=16)]
+        with mock.patch("core.utils.decomposition.decompose_electrodes.threadpool_info", return_value=info):
+            self.assertEqual(caller_blas_threads(), 4)
+
+        with mock.patch("core.utils.decomposition.decompose_electrodes.threadpool_info", return_value=[]):
+            with mock.patch("os.cpu_count", return_value=16):
+                self.assertEqual(caller_blas_threads(), 16)
+
+
+if __name__ == "__main__":
+    unittest.main()
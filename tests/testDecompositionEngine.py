@@ -0,0 +1,122 @@
+"""
+Checks the engine interface: the reference engine's prepare and separate on synthetic spike trains,
+and that offline_EMG runs whichever engine the parameters name.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.EmgDecomposition import offline_EMG
+from core.utils.decomposition.extend_emg import extend_emg
+from core.utils.decomposition.decomposition_engine import (
+    ENGINES,
+    DecompositionParameters,
+    NumpyEngine,
+    SeparationResult,
+    SpheredBatch,
+    get_engine,
+    register_engine,
+)
+
+
+def spike_train_emg(fsamp, nsamples, nchans=16, nsources=3, seed=0):
+    """Sparse regular spike trains convolved with short random MUAPs, plus noise."""
+    rng = np.random.default_rng(seed)
+    emg = rng.normal(scale=0.05, size=(nchans, nsamples))
+    for _ in range(nsources):
+        spikes = np.arange(rng.integers(50, 200), nsamples - 20, int(fsamp / rng.uniform(10, 15)))
+        train = np.zeros(nsamples)
+        train[spikes] = 1
+        muap = rng.normal(size=(nchans, 10)) * np.hanning(10)
+        emg += np.array([np.convolve(train, muap[c])[:nsamples] for c in range(nchans)])
+    return emg
+
+
+class TestDecompositionEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.params = DecompositionParameters(
+            fsamp=2048, extended_channels=160, edges2remove=0.05, to_filter=False, its=6, cov_filter=0
+        )
+        self.batch = spike_train_emg(2048, 2048 * 6)
+
+    def testPrepare(self):
+        sphered = NumpyEngine().prepare(self.batch, self.params)
+        ext_factor = 10
+        width = self.batch.shape[1] + ext_factor - 1 - 2 * self.params.edge_samples + 1
+
+        self.assertIsInstance(sphered, SpheredBatch)
+        self.assertEqual(sphered.ext_factor, ext_factor)
+        self.assertEqual(sphered.whitened.shape, (160, width))
+        extended = extend_emg(np.zeros([160, self.batch.shape[1] + ext_factor - 1]), self.batch, ext_factor)
+        extended -= extended.mean(axis=1, keepdims=True)
+        edges = self.params.edge_samples
+        npt.assert_allclose(sphered.whitened, sphered.whiten_mat @ extended[:, edges - 1 : -edges], atol=1e-8)
+        npt.assert_allclose(sphered.inverse_covariance(), np.linalg.pinv(sphered.covariance), rtol=1e-6, atol=1e-8)
+
+    def testSeparate(self):
+        engine = NumpyEngine()
+        sphered = engine.prepare(self.batch, self.params)
+        iterations = []
+        result = engine.separate(sphered, self.params, lambda i, *scores: iterations.append(i))
+
+        self.assertIsInstance(result, SeparationResult)
+        self.assertEqual(result.mu_filters.shape, (160, 6))
+        npt.assert_array_equal(result.accepted, result.sils >= self.params.sil_thr)
+        self.assertEqual(result.accepted_filters.shape[1], np.sum(result.accepted))
+        self.assertGreater(np.sum(result.accepted), 0)
+        self.assertEqual(iterations, list(range(6)))
+
+    def testBlockSeparationMatchesSequential(self):
+        batch = spike_train_emg(2048, 2048 * 6, nsources=8)
+        results = []
+        for block_size in (1, 4):
+            params = DecompositionParameters(
+                fsamp=2048, extended_channels=160, edges2remove=0.05, to_filter=False, its=12, cov_filter=0
+            )
+            params.ica_block_size = block_size
+            engine = NumpyEngine()
+            spikes = {}
+            result = engine.separate(engine.prepare(batch, params), params, lambda i, s, sp, *_: spikes.update({i: sp}))
+            results.append((result, spikes))
+
+        (sequential, sequential_spikes), (block, block_spikes) = results
+        npt.assert_array_equal(block.accepted, sequential.accepted)
+        self.assertGreater(np.sum(block.accepted), 0)
+        npt.assert_allclose(block.accepted_filters, sequential.accepted_filters, atol=1e-8)
+        for i in np.flatnonzero(sequential.accepted):
+            npt.assert_array_equal(block_spikes[i], sequential_spikes[i])
+
+    def testOfflineEmgUsesRegisteredEngine(self):
+        calls = []
+
+        @register_engine
+        class RecordingEngine(NumpyEngine):
+            name = "recording"
+
+            def prepare(self, batch, params, out=None):
+                calls.append(params.extended_channels)
+                return super().prepare(batch, params, out=out)
+
+        self.addCleanup(ENGINES.pop, "recording")
+
+        emg = offline_EMG(save_dir=".", to_filter=False)
+        emg.apply_parameters({"engine": "recording", "nbextchan": 160, "edges": 0.05})
+        emg.signal_dict = dict(fsamp=2048, batched_data=[self.batch])
+        emg.plateau_coords = np.array([0, self.batch.shape[1]])
+        emg.signal_dict.update(sq_extend_obvs=[None], inv_extend_obvs=[None], sphering_eig=[None])
+        emg.decomp_dict = dict(whiten_mat=[None], dewhiten_mat=[None], whitened_obvs=[None])
+        emg.convul_sphering(1, 0, 0)
+
+        self.assertEqual(calls, [160])
+        self.assertEqual(emg.ext_number, 10)
+        with self.assertRaises(ValueError):
+            get_engine("missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Checks the edit jobs of the manual editor, run synchronously: their progress reports, cancellation,
+and the unit edits and editions they return without touching their inputs.
+"""
+
+import time
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+import core.utils.manual_editing.edit_jobs as edit_jobs
+from core.utils.decomposition.extend_emg import extend_emg
+from core.utils.manual_editing.edit_jobs import (
+    EditJob,
+    EditJobCancelled,
+    unit_sil,
+    silhouette_job,
+    unit_update,
+    update_all_filters_job,
+    extend_filter_job,
+    remove_duplicates_within_arrays_job,
+)
+
+
+def unit_emg(nsamples, spikes, nchans=8, seed=0):
+    """EMG of MUs discharging at known times (one array per MU), with MUAPs ending at each discharge, plus noise."""
+    rng = np.random.default_rng(seed)
+    emg = rng.normal(scale=0.2, size=(nchans, nsamples))
+    for times in spikes:
+        train = np.zeros(nsamples)
+        train[np.asarray(times) - 9] = 1
+        muap = rng.normal(size=(nchans, 10)) * np.hanning(10)
+        emg += np.array([np.convolve(train, muap[c])[:nsamples] for c in range(nchans)])
+    return emg
+
+
+class TestEditJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.fsamp = 2048
+        self.nsamples = self.fsamp * 4
+        self.spikes = [np.arange(100, self.nsamples - 50, 150), np.arange(170, self.nsamples - 50, 230)]
+        self.emg = unit_emg(self.nsamples, self.spikes)
+        self.pulse_trains = [np.zeros((2, self.nsamples))]
+        self.discharge_times = {(0, 0): self.spikes[0][::2], (0, 1): self.spikes[1][::2]}
+
+    def testUpdateAllFilters(self):
+        reports = []
+        job = EditJob("update", update_all_filters_job, [self.emg], self.pulse_trains, self.discharge_times, self.fsamp)
+        job.progress_callback = lambda job, message, fraction, partial: reports.append(fraction)
+        edits = job.run()
+
+        self.assertEqual(reports, sorted(reports))
+        self.assertEqual(reports[-1], 1)
+        self.assertFalse(np.any(self.pulse_trains[0]))  # the inputs are left untouched
+        for mu in range(2):
+            unit = edits[0, mu]
+            self.assertEqual(unit["pulse_train"].shape, (self.nsamples,))
+            # the filter from every other discharge finds all of them
+            found = np.intersect1d(unit["discharge_times"], self.spikes[mu] + np.arange(-2, 3)[:, None])
+            self.assertGreater(len(found), 0.9 * len(self.spikes[mu]))
+            self.assertGreater(unit["sil"], 0.8)
+            self.assertEqual(unit["silcon"].shape, (4, 2))
+
+    def testUpdateAllFiltersKeepsTheEditorExtension(self):
+        self.assertEqual(edit_jobs.editor_extension_factor(8), 25)
+        self.assertEqual(edit_jobs.editor_extension_factor(64), 15)
+
+        job = EditJob("update", update_all_filters_job, [self.emg], self.pulse_trains, self.discharge_times, self.fsamp)
+        edits = job.run()
+
+        # the pulse train from a materialised extension with 25 lags, as the editor always used
+        X = extend_emg(np.zeros([8 * 25, self.nsamples + 24]), self.emg, 25)
+        mu_filter = X[:, self.discharge_times[0, 0]].sum(axis=1)
+        source = (mu_filter @ np.linalg.pinv(X @ X.T / X.shape[1]) @ X)[: self.nsamples]
+        npt.assert_allclose(edits[0, 0]["pulse_train"], unit_update(source, self.fsamp)["pulse_train"], atol=1e-6)
+
+    def testUpdateAllFiltersInWorkers(self):
+        arguments = ([self.emg, self.emg[::-1]], self.pulse_trains * 2, self.discharge_times, self.fsamp)
+        self.discharge_times.update({(1, mu): times for (_, mu), times in list(self.discharge_times.items())})
+        sequential = EditJob("update", update_all_filters_job, *arguments).run()
+
+        units_per_worker = edit_jobs.UNITS_PER_WORKER
+        edit_jobs.UNITS_PER_WORKER = 1
+        try:
+            pooled = EditJob("update", update_all_filters_job, *arguments, n_workers=2).run()
+        finally:
+            edit_jobs.UNITS_PER_WORKER = units_per_worker
+
+        self.assertEqual(sorted(pooled), [(0, 0), (0, 1), (1, 0), (1, 1)])
+        for unit in sequential:
+            npt.assert_allclose(pooled[unit]["pulse_train"], sequential[unit]["pulse_train"])
+            npt.assert_array_equal(pooled[unit]["discharge_times"], sequential[unit]["discharge_times"])
+            npt.assert_allclose(pooled[unit]["silcon"], sequential[unit]["silcon"])
+
+    def testCancel(self):
+        job = EditJob("update", update_all_filters_job, [self.emg], self.pulse_trains, self.discharge_times, self.fsamp)
+        job.progress_callback = lambda job, message, fraction, partial: job.cancel()
+        with self.assertRaises(EditJobCancelled):
+            job.run()
+
+    def testCancelDoesNotWaitForRunningUnits(self):
+        units_per_worker = edit_jobs.UNITS_PER_WORKER
+        edit_jobs.UNITS_PER_WORKER = 1
+        try:
+            job = EditJob("sleep", edit_jobs.map_units, time.sleep, range(4), [(4,)] * 4, "Sleeping", n_workers=2)
+            start = time.monotonic()
+            # cancel once the first calls are running in the workers
+            job.progress_callback = lambda job, *args: time.monotonic() - start > 1.5 and job.cancel()
+            with self.assertRaises(EditJobCancelled):
+                job.run()
+            self.assertLess(time.monotonic() - start, 3)
+        finally:
+            edit_jobs.UNITS_PER_WORKER = units_per_worker
+
+    def testExtendReportsPartialResults(self):
+        partials = []
+        pulse_train = np.zeros(self.nsamples)
+        job = EditJob(
+            "extend",
+            extend_filter_job,
+            self.emg,
+            np.zeros(8),
+            pulse_train,
+            self.spikes[0],
+            np.arange(self.fsamp, 2 * self.fsamp),
+            self.fsamp,
+            "surface",
+        )
+        job.progress_callback = lambda job, message, fraction, partial: partials.append(partial)
+        unit = job.run()
+
+        # 6 windows, previewed every PREVIEW_STEPS
+        previews = [partial for partial in partials if partial is not None]
+        self.assertEqual(len(partials), 7)
+        self.assertEqual(len(previews), 6 // edit_jobs.PREVIEW_STEPS)
+        self.assertFalse(np.any(pulse_train))
+        self.assertGreater(np.count_nonzero(unit["pulse_train"]), self.nsamples // 2)
+
+    def testSilhouettesOneUnitAtATime(self):
+        pulse_train = np.abs(np.random.default_rng(1).normal(scale=0.1, size=self.nsamples))
+        pulse_train[self.spikes[0]] = 1
+        units = [((0, 0), 3, pulse_train, self.spikes[0]), ((0, 1), 0, pulse_train, self.spikes[1])]
+        partials = []
+        job = EditJob("SIL", silhouette_job, units, self.fsamp, is_current=lambda key: key == (0, 1))
+        job.progress_callback = lambda job, message, fraction, partial: partials.append(partial)
+        job.run()
+
+        # the unit whose SIL is already known is skipped
+        self.assertEqual(len(partials), 1)
+        key, version, sil, silcon = partials[0]
+        self.assertEqual((key, version), ((0, 0), 3))
+        expected_sil, expected_silcon = unit_sil(pulse_train, self.spikes[0], self.fsamp)
+        self.assertEqual(sil, expected_sil)
+        npt.assert_array_equal(silcon, expected_silcon)
+
+    def testRemoveDuplicatesWithinArrays(self):
+        pulse_trains = [np.arange(3)[:, None] * np.ones(self.nsamples)]
+        discharge_times = {(0, 0): self.spikes[0], (0, 1): self.spikes[1], (0, 2): self.spikes[0][1:] + 3}
+        job = EditJob("duplicates", remove_duplicates_within_arrays_job, pulse_trains, discharge_times, self.fsamp)
+        edition = job.run()
+
+        npt.assert_array_equal(edition["Pulsetrain"][0][:, 0], [0, 1])
+        self.assertEqual(sorted(edition["Dischargetimes"]), [(0, 0), (0, 1)])
+        self.assertEqual(sorted(edition), ["Dischargetimes", "Pulsetrain"])  # no SIL, computed lazily
+        self.assertEqual(len(discharge_times), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
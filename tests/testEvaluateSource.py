@@ -0,0 +1,80 @@
+"""
+Checks the fused source evaluation against separate projection, peak finding and clustering,
+and that min_cov_isi hands back the evaluation of the vector it returns.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.evaluate_source import evaluate_source
+from core.utils.decomposition.get_silhouette import get_silhouette
+from core.utils.decomposition.min_cov_isi import min_cov_isi
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+
+
+def whitened_spiking_signals(fsamp, seed=0):
+    rng = np.random.default_rng(seed)
+    Z = rng.normal(size=(40, fsamp * 10))
+    spikes = np.cumsum(rng.integers(150, 250, 100))
+    Z[:5, spikes[spikes < Z.shape[1]]] += 6
+    w = rng.normal(size=40) * 0.1
+    w[:5] += 1
+    return Z, w
+
+
+class TestEvaluateSource(unittest.TestCase):
+
+    def setUp(self):
+        self.fsamp = 2048
+        self.Z, self.w = whitened_spiking_signals(self.fsamp)
+
+    def testMatchesSeparateSteps(self):
+        evaluation = evaluate_source(self.w, self.Z, self.fsamp)
+
+        source = self.w @ self.Z
+        source = source * abs(source)
+        peaks, _ = scipy.signal.find_peaks(source, distance=np.round(self.fsamp * 0.02) + 1)
+        source /= np.mean(np.sort(source[peaks])[-10:])
+        labels, _, _ = two_class_kmeans(source[peaks])
+        high = source[peaks[labels == 1]]
+        spikes = peaks[labels == 1][high <= high.mean() + 4 * high.std()]
+        intra = np.sum((high - high.mean()) ** 2)
+        inter = np.sum((high - source[peaks[labels == 0]].mean()) ** 2)
+        ISI = np.diff(spikes / self.fsamp)
+
+        npt.assert_allclose(evaluation["source"], source)
+        npt.assert_array_equal(evaluation["peaks"], peaks)
+        npt.assert_array_equal(evaluation["spikes"], spikes)
+        self.assertAlmostEqual(evaluation["sil"], (inter - intra) / max(inter, intra))
+        self.assertAlmostEqual(evaluation["cov"], np.std(ISI) / np.mean(ISI))
+
+    def testMinCovIsiEvaluation(self):
+        first = evaluate_source(self.w, self.Z, self.fsamp)
+        w_n = np.sum(self.Z[:, first["spikes"]], axis=1)
+        w_last, spikes, cov, evaluation = min_cov_isi(
+            w_n, None, self.Z, self.fsamp, first["cov"], first["spikes"], return_evaluation=True
+        )
+
+        npt.assert_array_equal(evaluation["w"], w_last)
+        self.assertEqual(get_silhouette(w_last, self.Z, self.fsamp, evaluation)[2], evaluation["sil"])
+        npt.assert_array_equal(min_cov_isi(w_n, None, self.Z, self.fsamp, first["cov"], first["spikes"])[1], spikes)
+
+    def testReusePeaks(self):
+        first = evaluate_source(self.w, self.Z, self.fsamp)
+        reused = evaluate_source(self.w * 1.01, self.Z, self.fsamp, first, reuse_tol=1e-6)
+        self.assertIsNone(reused["source"])
+        npt.assert_array_equal(reused["spikes"], first["spikes"])
+        self.assertAlmostEqual(reused["sil"], first["sil"])
+
+        # a different vector searches the peaks again
+        other = evaluate_source(self.Z[:, first["spikes"]].sum(axis=1), self.Z, self.fsamp, first, reuse_tol=1e-6)
+        self.assertIsNotNone(other["source"])
+
+
+if __name__ == "__main__":
+    unittest.main()
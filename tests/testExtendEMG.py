@@ -0,0 +1,52 @@
+"""
+Checks that ExtendedEMG reproduces the matrix built by extend_emg and the products
+the decomposition takes on it, without materialising it.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.extend_emg import extend_emg, ExtendedEMG
+
+
+class TestExtendEMG(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.signal = rng.normal(size=(6, 500))
+        self.ext_factor = 7
+        self.extended = ExtendedEMG(self.signal, self.ext_factor)
+        self.dense = extend_emg(np.zeros(self.extended.shape), self.signal, self.ext_factor)
+
+    def testViewAndArray(self):
+        npt.assert_array_equal(self.extended.view(), self.dense)
+        npt.assert_array_equal(self.extended.toarray(), self.dense)
+        out = np.ones(self.extended.shape)
+        npt.assert_array_equal(self.extended.toarray(out=out), self.dense)
+
+    def testCovarianceAndMean(self):
+        npt.assert_allclose(self.extended.covariance(), self.dense @ self.dense.T / self.dense.shape[1], atol=1e-12)
+        npt.assert_allclose(self.extended.mean(), self.dense.mean(axis=1), atol=1e-12)
+
+    def testProject(self):
+        weights = np.random.default_rng(1).normal(size=(3, self.dense.shape[0]))
+        npt.assert_allclose(self.extended.project(weights), weights @ self.dense, atol=1e-10)
+        npt.assert_allclose(self.extended.project(weights[0]), weights[0] @ self.dense, atol=1e-10)
+
+    def testProjectColumnRange(self):
+        # few filters go through the per-delay products, many through the strided view
+        for nfilters in (2, 50):
+            weights = np.random.default_rng(2).normal(size=(nfilters, self.dense.shape[0]))
+            npt.assert_allclose(self.extended.project(weights, 10, 300), weights @ self.dense[:, 10:300], atol=1e-10)
+
+    def testColumns(self):
+        idx = np.array([0, 3, 250, 499, 500, 505])
+        npt.assert_array_equal(self.extended.columns(idx), self.dense[:, idx])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Checks the shared extended signal of an electrode: its batched projection against the materialised
+extension and covariance pseudoinverse, and the post-processing functions that use it.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.extended_signal import ExtendedSignal
+from core.utils.decomposition.refine_mus import refine_mus
+from core.utils.decomposition.get_mu_filters import get_mu_filters
+from core.utils.decomposition.get_pulse_trains import get_pulse_trains
+from core.utils.decomposition.get_online_parameters import get_online_parameters
+from testDecompositionEngine import spike_train_emg
+
+
+class TestExtendedSignal(unittest.TestCase):
+
+    def setUp(self):
+        self.fsamp = 2048
+        self.data = spike_train_emg(self.fsamp, self.fsamp * 5, nchans=16, nsources=2, seed=3)
+        self.rejected = [np.zeros(16, dtype=int)]
+        self.rejected[0][[2, 9]] = 1
+        self.extended = ExtendedSignal.for_electrode(self.data, self.rejected, [16], 0, nbextchan=140)
+
+    def testProjectMatchesMaterialisedExtension(self):
+        self.assertEqual(self.extended.ext_factor, 10)
+        X = self.extended.extended.toarray()
+        inverse = np.linalg.pinv(X @ X.T / X.shape[1])
+        filters = np.random.default_rng(0).normal(size=(X.shape[0], 3))
+
+        npt.assert_allclose(self.extended.inverse_covariance(), inverse, atol=1e-6 * np.abs(inverse).max())
+        expected = filters.T @ inverse @ X[:, : self.data.shape[1]]
+        npt.assert_allclose(self.extended.project(filters), expected, atol=1e-6 * np.abs(expected).max())
+        self.assertIs(self.extended.inverse_covariance(), self.extended.inverse_covariance())
+
+        times = [np.array([20, 500, 3000]), np.array([5])]
+        npt.assert_allclose(self.extended.mu_filters(times)[:, 0], X[:, times[0]].sum(axis=1))
+
+    def testPostProcessingSharesTheExtension(self):
+        spikes = np.arange(300, self.data.shape[1] - 300, 170)
+        filters = get_mu_filters(self.data, self.rejected, [spikes], [16], 0, extended=self.extended)
+        self.assertEqual(filters.shape, (140, 1))
+
+        pulse_trains, discharge_times, ext_factor = get_pulse_trains(
+            self.data, self.rejected, filters, [16], self.fsamp, 0, extended=self.extended
+        )
+        self.assertEqual(pulse_trains.shape, (1, self.data.shape[1]))
+        self.assertEqual(ext_factor, 10)
+        self.assertGreater(len(discharge_times[0]), 0)
+
+        ext_factor, inverse, norm, centroids = get_online_parameters(
+            self.data, self.rejected, filters, [16], self.fsamp, 0, extended=self.extended
+        )
+        self.assertIs(inverse, self.extended.inverse_covariance())
+        self.assertGreater(norm[0], 0)
+        self.assertGreater(centroids[0, 0], centroids[0, 1])
+
+    def testRefineWithSharedExtension(self):
+        extended = ExtendedSignal(self.data, self.rejected[0])
+        discharge_times = [np.arange(300, self.data.shape[1] - 300, 170)]
+        pulse_trains = np.zeros((1, self.data.shape[1]))
+
+        shared = refine_mus(self.data, self.rejected[0], pulse_trains, discharge_times, self.fsamp, extended=extended)
+        own = refine_mus(self.data, self.rejected[0], pulse_trains, discharge_times, self.fsamp)
+        npt.assert_allclose(shared[0], own[0])
+        npt.assert_array_equal(shared[1][0], own[1][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
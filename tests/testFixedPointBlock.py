@@ -0,0 +1,65 @@
+"""
+Checks the fixed point kernels: contrast selection, and that the block algorithm
+reproduces the sequential one column by column.
+Runs on synthetic data, so no expected output files are needed.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.fixed_point_alg import fixed_point_alg, fixed_point_alg_block, _contrast_id
+from core.utils.decomposition.mathematical_functions import (
+    square,
+    skew,
+    exp,
+    logcosh,
+    dot_square,
+    dot_skew,
+    dot_exp,
+    dot_logcosh,
+)
+
+
+def whitened_mixture(n_channels=40, n_samples=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    sources = rng.laplace(size=(n_channels, n_samples)) ** 3
+    mixed = rng.normal(size=(n_channels, n_channels)) @ sources
+    mixed -= mixed.mean(axis=1, keepdims=True)
+    evalues, evectors = np.linalg.eigh(np.cov(mixed, bias=True))
+    return evectors @ np.diag(evalues**-0.5) @ evectors.T @ mixed
+
+
+class TestFixedPointBlock(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.Z = whitened_mixture()
+        self.B = np.zeros([self.Z.shape[0], 10])
+        self.B[:, 0] = rng.normal(size=self.Z.shape[0])
+        self.B[:, 0] /= np.linalg.norm(self.B[:, 0])
+
+        W = rng.normal(size=(self.Z.shape[0], 4))
+        W -= self.B @ (self.B.T @ W)
+        self.W = W / np.linalg.norm(W, axis=0)
+
+    def testBlockMatchesSequential(self):
+        for cf, dot_cf in [(skew, dot_skew), (square, dot_square), (logcosh, dot_logcosh), (exp, dot_exp)]:
+            block = fixed_point_alg_block(self.W, self.B, self.Z, cf, dot_cf, 500)
+            for col in range(self.W.shape[1]):
+                sequential = fixed_point_alg(self.W[:, col].copy(), self.B, self.Z, cf, dot_cf, 500)
+                npt.assert_allclose(block[:, col], sequential, atol=1e-10)
+
+    def testContrastSelection(self):
+        self.assertEqual([_contrast_id(cf) for cf in (skew, square, logcosh, exp)], [0, 1, 2, 3])
+
+    def testBlockIsOrthogonalToBasis(self):
+        block = fixed_point_alg_block(self.W, self.B, self.Z, skew, dot_skew, 500)
+        npt.assert_allclose(self.B.T @ block, 0, atol=1e-10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Checks the float32 mode: the whitened observations and separation stay in float32 and find the
+same motor units as float64, and the discharge matching used to validate it.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.decomposition_engine import DecompositionParameters, NumpyEngine, precision_dtype
+from core.utils.decomposition.evaluate_source import evaluate_source
+from core.utils.decomposition.mu_agreement import match_motor_units, rate_of_agreement
+from testDecompositionEngine import spike_train_emg
+
+
+class TestFloat32Mode(unittest.TestCase):
+
+    def setUp(self):
+        self.batch = spike_train_emg(2048, 2048 * 6)
+        self.runs = {}
+        for dtype in (np.float64, np.float32):
+            params = DecompositionParameters(
+                fsamp=2048, extended_channels=160, edges2remove=0.05, its=6, cov_filter=0, dtype=dtype
+            )
+            engine = NumpyEngine()
+            sphered = engine.prepare(self.batch.astype(dtype), params)
+            self.runs[dtype] = (sphered, engine.separate(sphered, params))
+
+    def testPrecisionIsKept(self):
+        sphered, result = self.runs[np.float32]
+        self.assertEqual(sphered.whitened.dtype, np.float32)
+        self.assertEqual(result.mu_filters.dtype, np.float32)
+        self.assertEqual(sphered.covariance.dtype, np.float64)
+        npt.assert_allclose(sphered.whitened, self.runs[np.float64][0].whitened, atol=1e-3)
+
+    def testSameMotorUnits(self):
+        discharges = {}
+        for dtype, (sphered, result) in self.runs.items():
+            discharges[dtype] = [
+                evaluate_source(w, sphered.whitened, 2048)["spikes"] for w in result.accepted_filters.T
+            ]
+
+        pairs, _ = match_motor_units(discharges[np.float64], discharges[np.float32], 2048, min_agreement=0.9)
+        self.assertGreater(len(pairs), 0)
+        self.assertEqual(len(pairs), len(discharges[np.float64]))
+
+    def testRateOfAgreement(self):
+        self.assertEqual(rate_of_agreement([10, 20, 30], [10, 21, 40], 1), 2 / 4)
+        self.assertEqual(rate_of_agreement([10, 11], [10], 1), 1 / 2)
+        self.assertEqual(rate_of_agreement([], [10], 1), 0)
+
+    def testPrecisionNames(self):
+        self.assertIs(precision_dtype("float32"), np.float32)
+        self.assertIs(precision_dtype(np.float64), np.float64)
+        with self.assertRaises(ValueError):
+            precision_dtype("float16")
+
+
+if __name__ == "__main__":
+    unittest.main()
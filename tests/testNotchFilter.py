@@ -0,0 +1,83 @@
+"""
+Checks the vectorised notch filter against the per-channel implementation it replaced,
+on synthetic signals with line interference.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import scipy
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.notch_filter import notch_filter
+
+
+def reference_notch_filter(signal, fsamp, to_han=False):
+    """Previous implementation: one fft per channel and index lists per window."""
+    bandwidth_as_index = int(round(4 * (np.shape(signal)[1] / fsamp)))
+    filtered_signal = np.zeros([np.shape(signal)[0], np.shape(signal)[1]])
+
+    for chan in range(np.shape(signal)[0]):
+        if to_han:
+            final_signal = signal[chan, :] * scipy.signal.windows.hann(np.shape(signal[chan, :])[0])
+        else:
+            final_signal = signal[chan, :]
+
+        fourier_signal = np.fft.fft(final_signal)
+        fourier_interf = np.zeros(len(fourier_signal), dtype="complex128")
+        interf2remove = np.zeros(len(fourier_signal), dtype=np.int32)
+        window = fsamp
+        tracker = 0
+
+        for interval in range(0, len(fourier_signal) - window + 1, window):
+            segment = abs(fourier_signal[interval + 1 : interval + window + 1])
+            label_interf = list(np.where(segment > np.median(segment) + 5 * np.std(segment))[0])
+            label_interf = [x + interval + 1 for x in label_interf]
+
+            if label_interf:
+                for i in range(int(-np.floor(bandwidth_as_index / 2)), int(np.floor(bandwidth_as_index / 2) + 1)):
+                    interf2remove[tracker : tracker + len(label_interf)] = [x + i for x in label_interf]
+                    tracker = tracker + len(label_interf)
+
+        indexf2remove = np.where(np.logical_and(interf2remove >= 0, interf2remove <= len(fourier_signal) / 2))[0]
+        fourier_interf[interf2remove[indexf2remove]] = fourier_signal[interf2remove[indexf2remove]]
+        corrector = int(len(fourier_signal) - np.floor(len(fourier_signal) / 2) * 2)
+        fourier_interf[int(np.ceil(len(fourier_signal) / 2)) :] = np.flip(
+            np.conj(fourier_interf[1 : int(np.ceil(len(fourier_signal) / 2) + 1 - corrector)])
+        )
+        filtered_signal[chan, :] = signal[chan, :] - np.fft.ifft(fourier_interf).real
+
+    return filtered_signal
+
+
+def noisy_signal(nchans, nsamples, fsamp, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(nsamples) / fsamp
+    interference = (
+        3 * np.sin(2 * np.pi * 50 * t) + 2 * np.sin(2 * np.pi * 150 * t) + np.sin(2 * np.pi * (fsamp / 2 - 3) * t)
+    )
+    return rng.normal(size=(nchans, nsamples)) + interference
+
+
+class TestNotchFilter(unittest.TestCase):
+
+    def testMatchesReference(self):
+        # even and odd lengths, a multiple of fsamp (short last window) and a signal shorter than one window
+        for fsamp, nsamples in [(2048, 2048 * 10), (2048, 2048 * 10 + 77), (2000, 4001), (2048, 6144), (2048, 1000)]:
+            signal = noisy_signal(6, nsamples, fsamp)
+            npt.assert_allclose(notch_filter(signal, fsamp), reference_notch_filter(signal, fsamp), atol=1e-10)
+
+    def testHannWindow(self):
+        signal = noisy_signal(4, 2048 * 5 + 3, 2048)
+        npt.assert_allclose(notch_filter(signal, 2048, True), reference_notch_filter(signal, 2048, True), atol=1e-10)
+
+    def testRemovesLineInterference(self):
+        signal = noisy_signal(4, 2048 * 10, 2048)
+        spectrum = np.abs(np.fft.rfft(notch_filter(signal, 2048), axis=1))
+        self.assertLess(spectrum[:, 500].max(), 5 * np.median(spectrum))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Checks the OTB+ reader against the extract-and-convert path it replaced,
+on small synthetic archives (plain and gzip compressed).
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.config_and_input import open_otb as otb_module
+from core.utils.config_and_input.open_otb import open_otb
+from core.utils.config_and_input.write_otb import write_otb
+
+
+class Recording:
+    ref_exist = 1
+
+
+class TestOpenOtb(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        # more samples than one conversion chunk, so the chunk boundaries are exercised
+        self.raw = rng.integers(-32768, 32767, size=(64, otb_module.CHUNK_SAMPLES + 1234))
+        self.expected = self.raw.astype(float) * 5000 / 2**16
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def open(self, mode="w", dtype=np.float64):
+        filename = os.path.join(self.tmpdir.name, "trial.otb+")
+        nsamples = self.raw.shape[1]
+        write_otb(filename, self.raw, path=np.arange(nsamples), target=np.ones(nsamples + 10), mode=mode)
+        recording = Recording()
+        open_otb(recording, filename, dtype)
+        return recording.signal_dict
+
+    def testMatchesLegacyConversion(self):
+        signal = self.open()
+        self.assertEqual(signal["data"].dtype, np.float64)
+        npt.assert_array_equal(signal["data"], self.expected)
+        self.assertEqual((signal["fsamp"], signal["nchans"], signal["nelectrodes"]), (2048, 64, 1))
+        self.assertEqual(signal["electrodes"], ["GR08MM1305"])
+        npt.assert_array_equal(signal["path"], np.arange(self.raw.shape[1]))
+        npt.assert_array_equal(signal["target"], np.ones(self.raw.shape[1]))
+
+    def testCompressedArchiveIsStreamed(self):
+        signal = self.open(mode="w:gz")
+        npt.assert_array_equal(signal["data"], self.expected)
+
+    def testFloat32Output(self):
+        signal = self.open(dtype=np.float32)
+        self.assertEqual(signal["data"].dtype, np.float32)
+        npt.assert_allclose(signal["data"], self.expected, rtol=1e-6)
+
+
+if __name__ == "__main__":
+    unittest.main()
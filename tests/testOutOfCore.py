@@ -0,0 +1,144 @@
+"""
+Checks the out-of-core mode: the on-disk arrays of the SignalStore, the chunked filtering, extension
+and projection against the in-memory versions, and a full decomposition under a memory cap.
+"""
+
+import pickle
+import subprocess
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.decomposition.signal_store import SignalStore, StoredArray, filter_rows, scratch_copy, select_rows
+from core.utils.config_and_input.write_otb import write_otb
+from testDecompositionEngine import spike_train_emg
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Decomposes the recording argv[2] out of core, with the anonymous memory (RLIMIT_DATA, which the
+# mapped store files do not count against) limited to argv[3] MB above what the imports use
+CAPPED_RUN = """
+import sys, io, contextlib, resource
+sys.path.append(sys.argv[1])
+import numpy as np
+import core.utils.decomposition.signal_store as signal_store
+from core.EmgDecomposition import offline_EMG
+from core.utils.config_and_input.prepare_parameters import prepare_parameters
+
+signal_store.CHUNK_BYTES = 8 << 20
+parameters = prepare_parameters(
+    dict(iterations=3, extended_channels=256, check_emg="Yes", duplicates_bgrids="No", refine_mu="Yes")
+)
+parameters.update(outofcore=1, storedir=sys.argv[4])
+emg_obj = offline_EMG(save_dir=sys.argv[4], to_filter=True)
+emg_obj.apply_parameters(parameters)
+
+with open("/proc/self/status") as status:
+    data_kb = next(int(line.split()[1]) for line in status if line.startswith("VmData:"))
+cap = (data_kb << 10) + (int(sys.argv[3]) << 20)
+resource.setrlimit(resource.RLIMIT_DATA, (cap, cap))
+
+with contextlib.redirect_stdout(io.StringIO()):
+    emg_obj.open_otb(sys.argv[2])
+    emg_obj.run_decomposition(parameters)
+
+whitened = emg_obj.decomp_dict["whitened_obvs"][0]
+print(sum(len(mus) for mus in emg_obj.mu_dict["discharge_times"]), whitened.nbytes, isinstance(whitened, np.memmap))
+"""
+
+
+class TestSignalStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = SignalStore()
+        self.addCleanup(self.store.close)
+
+    def testArraysPickleByReference(self):
+        stored = self.store.create("data", (8, 10000))
+        stored[:] = np.arange(10000)
+        self.assertLess(len(pickle.dumps(stored)), 1000)
+
+        loaded = pickle.loads(pickle.dumps(stored))
+        self.assertIsInstance(loaded, StoredArray)
+        npt.assert_array_equal(loaded, stored)
+        loaded[0, 0] = -1  # both map the same file
+        self.assertEqual(stored[0, 0], -1)
+
+        # slices are pickled as ordinary arrays
+        npt.assert_array_equal(pickle.loads(pickle.dumps(stored[2:4])), stored[2:4])
+
+    def testCopiesStayOnDisk(self):
+        stored = self.store.create("data", (6, 1000))
+        stored[:] = np.random.default_rng(0).normal(size=(6, 1000))
+
+        for copy, expected in [(scratch_copy(stored), stored), (select_rows(stored, np.array([1, 4])), stored[[1, 4]])]:
+            self.assertIsInstance(copy, np.memmap)
+            self.assertFalse(np.shares_memory(copy, stored))
+            npt.assert_array_equal(copy, expected)
+
+        self.assertNotIsInstance(scratch_copy(np.ones(3)), np.memmap)
+
+    def testCloseRemovesTemporaryDirectory(self):
+        store = SignalStore()
+        store.create("data", (2, 10))
+        self.assertIn("data", store)
+        store.close()
+        self.assertFalse(os.path.exists(store.directory))
+
+
+class TestChunkedSignals(unittest.TestCase):
+
+    def setUp(self):
+        self.signal = np.random.default_rng(1).normal(size=(5, 700))
+
+    def testChunkedExtension(self):
+        full = ExtendedEMG(self.signal, 9)
+        weights = np.random.default_rng(2).normal(size=(30, full.shape[0]))
+        for chunk in (1, 8, 64, 699):
+            chunked = ExtendedEMG(self.signal, 9, chunk)
+            npt.assert_allclose(chunked.lag_products(), full.lag_products(), atol=1e-10)
+            npt.assert_allclose(chunked.covariance(), full.covariance(), atol=1e-12)
+            for filters in (weights[:2], weights):
+                npt.assert_allclose(chunked.project(filters), full.project(filters), atol=1e-10)
+                npt.assert_allclose(chunked.project(filters, 30, 650), full.project(filters, 30, 650), atol=1e-10)
+
+    def testChunkedFilters(self):
+        signal = np.random.default_rng(3).normal(size=(6, 4096))
+        npt.assert_allclose(filter_rows(signal, 2048, chunked=True), filter_rows(signal, 2048))
+
+
+@unittest.skipUnless(resource is not None and os.path.exists("/proc/self/status"), "needs Linux memory limits")
+class TestMemoryCap(unittest.TestCase):
+
+    def testDecomposesUnderMemoryCap(self):
+        cap_mb = 256
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, "trial.otb+")
+            emg = spike_train_emg(2048, 2048 * 75, nchans=64, nsources=4)
+            write_otb(filename, np.round(emg / np.abs(emg).max() * 30000))
+
+            src = os.path.abspath(os.path.join(os.path.dirname(__file__), "../src"))
+            run = subprocess.run(
+                [sys.executable, "-c", CAPPED_RUN, src, filename, str(cap_mb), tmpdir],
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(run.returncode, 0, run.stderr[-2000:])
+
+        nmus, whitened_bytes, on_disk = run.stdout.split()[-3:]
+        self.assertGreater(int(nmus), 0)
+        self.assertEqual(on_disk, "True")
+        # the whitened observations alone would not have fitted under the cap
+        self.assertGreater(int(whitened_bytes), cap_mb << 20)
+
+
+if __name__ == "__main__":
+    unittest.main()
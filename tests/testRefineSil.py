@@ -0,0 +1,82 @@
+"""
+Checks the windowed silhouette of a pulse train against the window-by-window computation it replaces,
+including the partial recomputation after the discharge times are edited.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+from scipy.signal import find_peaks
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans
+from core.utils.manual_editing.refinesil import refinesil
+from core.utils.manual_editing.edit_jobs import unit_sil, unit_sil_after_edit
+
+
+def window_by_window_refinesil(PulseT, distime, fsamp):
+    """The loop over the windows, each with its own two_class_kmeans."""
+    spikes, _ = find_peaks(PulseT, distance=round(fsamp * 0.005))
+    if len(spikes) >= 10:
+        PulseT = PulseT / np.mean(np.sort(PulseT[spikes])[-10:])
+
+    sil_vals = np.zeros((int(np.floor(len(PulseT) / fsamp)), 2))
+    for i in range(len(sil_vals)):
+        idx = np.where((spikes > 1 + (i - 1) * fsamp) & (spikes < i * fsamp))[0]
+        idx1 = np.where((distime > 1 + (i - 1) * fsamp) & (distime < i * fsamp))[0]
+        sil_vals[i, 0] = np.floor(i * fsamp - (fsamp / 2))
+        sil_vals[i, 1] = np.nan
+        if len(idx) > 2 and len(idx1) > 2:
+            L, C, inertia = two_class_kmeans(PulseT[spikes[idx]])
+            within = np.sum(inertia)
+            between = inertia[1] + np.sum(L == 1) * (C[1] - C[0]) ** 2
+            sil_vals[i, 1] = (between - within) / max(within, between)
+    return sil_vals
+
+
+class TestRefineSil(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.fsamp = 2048
+        self.nsamples = self.fsamp * 30
+        self.pulse_train = np.abs(rng.normal(scale=0.1, size=self.nsamples))
+        discharge_times = np.sort(rng.choice(self.nsamples, 400, replace=False))
+        self.pulse_train[discharge_times] += rng.normal(1, 0.2, len(discharge_times))
+        # a few seconds without discharges, whose windows have no silhouette
+        self.discharge_times = discharge_times[
+            (discharge_times < 10 * self.fsamp) | (discharge_times > 13 * self.fsamp)
+        ]
+
+    def testMatchesWindowByWindow(self):
+        for fsamp in (self.fsamp, 2000.5):
+            expected = window_by_window_refinesil(self.pulse_train, self.discharge_times, fsamp)
+            sil_vals = refinesil(self.pulse_train, self.discharge_times, fsamp)
+            npt.assert_allclose(sil_vals, expected, rtol=1e-12, atol=1e-12)
+
+        # window i covers the second before i * fsamp
+        sil_vals = refinesil(self.pulse_train, self.discharge_times, self.fsamp)
+        self.assertTrue(np.all(np.isnan(sil_vals[[0, 11, 12, 13], 1])))
+        self.assertFalse(np.any(np.isnan(sil_vals[1:11, 1])))
+
+    def testDirtyRange(self):
+        sil, silcon = unit_sil(self.pulse_train, self.discharge_times, self.fsamp)
+
+        # deleting the spikes of seconds 20 to 22 only changes the windows around them
+        deleted = (self.discharge_times > 20 * self.fsamp) & (self.discharge_times < 22 * self.fsamp)
+        edited = self.discharge_times[~deleted]
+        start, stop = self.discharge_times[deleted][[0, -1]]
+        partial = refinesil(self.pulse_train, edited, self.fsamp, silcon, (start, stop + 1))
+        npt.assert_allclose(partial, window_by_window_refinesil(self.pulse_train, edited, self.fsamp), atol=1e-12)
+        self.assertEqual(np.sum(np.isnan(partial[:, 1]) != np.isnan(silcon[:, 1])), 2)
+        npt.assert_array_equal(silcon[:20], partial[:20])  # the input is left untouched
+
+        new_sil, new_silcon = unit_sil_after_edit(self.pulse_train, edited, self.fsamp, sil, silcon, start, stop + 1)
+        self.assertEqual(new_sil, sil)
+        npt.assert_array_equal(new_silcon, partial)
+
+
+if __name__ == "__main__":
+    unittest.main()
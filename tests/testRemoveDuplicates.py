@@ -0,0 +1,80 @@
+"""
+Checks the event-based remove_duplicates: lags and common discharges against their dense definitions
+(cross-correlation of binary spike trains and intersection of the jittered discharge lists), and the
+surviving MUs of shifted, thinned copies of a few spike trains.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.remove_duplicates import (
+    common_discharges,
+    discharge_runs,
+    most_common_lag,
+    remove_duplicates,
+)
+
+
+def regular_train(rng, nsamples, isi=200):
+    return np.cumsum(rng.integers(isi - 40, isi + 40, size=nsamples // (isi - 40)))[: nsamples // isi]
+
+
+class TestRemoveDuplicates(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def testMostCommonLag(self):
+        reference = regular_train(self.rng, 20000)
+        candidate = np.sort(reference[self.rng.random(len(reference)) > 0.3] - 7)
+        self.assertEqual(most_common_lag(reference, candidate, 51), 7)
+
+        # the peak of the cross-correlation of the binary trains
+        x, y = np.zeros(20100), np.zeros(20100)
+        x[reference], y[candidate] = 1, 1
+        correlation = [
+            np.dot(x[max(lag, 0) :], y[: len(y) - max(lag, 0)]) if lag >= 0 else np.dot(x[:lag], y[-lag:])
+            for lag in range(-51, 52)
+        ]
+        self.assertEqual(int(np.argmax(correlation)) - 51, 7)
+
+        self.assertEqual(most_common_lag(np.array([10]), np.array([1000]), 51), 0)
+
+    def testCommonDischarges(self):
+        for half_width in (0, 2):
+            first = np.unique(self.rng.integers(0, 3000, 80))
+            second = np.unique(np.concatenate([first[:40] + 1, self.rng.integers(0, 3000, 40)]))
+            jitters = [
+                np.unique(np.concatenate([t + d for d in range(-half_width, half_width + 1)])) for t in (first, second)
+            ]
+            common = np.intersect1d(*jitters)
+            expected = len(common[np.insert(np.diff(common) != 1, 0, False)])
+
+            count = common_discharges(discharge_runs(first, half_width), discharge_runs(second, half_width))
+            self.assertEqual(count, expected)
+
+    def testKeepsMostRegularDuplicate(self):
+        nsamples = 60000
+        trains = [regular_train(self.rng, nsamples, isi) for isi in (150, 220, 300)]
+        thinned = trains[0][self.rng.random(len(trains[0])) > 0.2] + 12  # irregular copy of the first
+        discharge_times = [thinned, trains[0], trains[1], trains[2], trains[2][self.rng.random(len(trains[2])) > 0.3]]
+        pulse_trains = np.arange(len(discharge_times))[:, None] * np.ones(10)
+        mu_filters = np.arange(len(discharge_times))[None, :] * np.ones((4, 1))
+
+        times, trains_new, filters = remove_duplicates(
+            pulse_trains, discharge_times, discharge_times, mu_filters, np.round(2048 / 40), 0.00025, 0.3, 2048
+        )
+
+        self.assertEqual(len(times), 3)
+        for kept, expected in zip(times, [trains[0], trains[1], trains[2]]):
+            npt.assert_array_equal(kept, expected)
+        npt.assert_array_equal([train[0] for train in trains_new], [1, 2, 3])
+        npt.assert_array_equal(filters[0], [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
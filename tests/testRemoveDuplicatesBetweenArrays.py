@@ -0,0 +1,72 @@
+"""
+Checks the all-pairs similarity of remove_duplicates_between_arrays against the pairwise lags and
+common discharges of remove_duplicates, and the clusters of duplicates it resolves.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.remove_duplicates import common_discharges, discharge_runs, most_common_lag
+from core.utils.decomposition.remove_duplicates_between_arrays import (
+    duplicate_similarity,
+    remove_duplicates_between_arrays,
+)
+from testRemoveDuplicates import regular_train
+
+
+class TestRemoveDuplicatesBetweenArrays(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        trains = [regular_train(rng, 40000, isi) for isi in (150, 210, 320)]
+        copies = [np.unique(train[rng.random(len(train)) > 0.25] + rng.integers(-20, 20)) for train in trains]
+        self.discharge_times = [trains[0], copies[1], trains[1], copies[0], trains[2], np.array([5]), copies[2]]
+
+    def testSimilarityMatchesPairs(self):
+        for half_width in (0, 2):
+            similarity, lags = duplicate_similarity(self.discharge_times, 51, half_width)
+            npt.assert_array_equal(similarity, similarity.T)
+            npt.assert_array_equal(np.diag(similarity), 1)
+            for i, first in enumerate(self.discharge_times):
+                for j in range(i + 1, len(self.discharge_times)):
+                    second = self.discharge_times[j]
+                    lag = most_common_lag(first, second, 51)
+                    starts, ends = discharge_runs(second, half_width)
+                    common = common_discharges(discharge_runs(first, half_width), (starts + lag, ends + lag))
+                    self.assertEqual(lags[i, j], lag)
+                    self.assertEqual(lags[j, i], -lag)
+                    self.assertAlmostEqual(similarity[i, j], common / max(len(first), len(second)))
+
+    def testKeepsLowestCoVOfEachCluster(self):
+        pulse_trains = np.arange(len(self.discharge_times))[:, None] * np.ones(8)
+        muscle = np.array([0, 1, 0, 1, 0, 1, 1])
+
+        times, trains, muscle_new, similarity = remove_duplicates_between_arrays(
+            pulse_trains, list(self.discharge_times), muscle, 51, 0.00025, 0.3, 2048
+        )
+
+        # the regular trains survive over their thinned copies, the single discharge stays on its own
+        npt.assert_array_equal(trains[:, 0], [0, 2, 4, 5])
+        npt.assert_array_equal(muscle_new, [0, 0, 0, 1])
+        for kept, mu in zip(times, [0, 2, 4, 5]):
+            npt.assert_array_equal(kept, self.discharge_times[mu])
+        self.assertEqual(similarity.shape, (7, 7))
+        self.assertGreaterEqual(similarity[0, 3], 0.3)
+
+    def testClustersAreTransitive(self):
+        base = regular_train(np.random.default_rng(6), 40000, 200)
+        # a -> b and b -> c share half of their discharges, a and c (almost) none
+        a, b, c = base[: len(base) // 2], base[len(base) // 4 : 3 * len(base) // 4], base[len(base) // 2 :]
+        times, _, _, similarity = remove_duplicates_between_arrays(
+            np.zeros((3, 4)), [a, b, c], np.zeros(3, dtype=int), 51, 0.00025, 0.3, 2048
+        )
+        self.assertLess(similarity[0, 2], 0.3)
+        self.assertEqual(len(times), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
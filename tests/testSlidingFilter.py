@@ -0,0 +1,65 @@
+"""
+Checks the sliding-window filter extension: the covariance of a window assembled from the cached
+lag products of its two parts, and the updates of one window against extendfilter.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.manual_editing.extendfilter import extendfilter
+from core.utils.manual_editing.sliding_filter import SlidingFilter
+from testEditJobs import unit_emg
+from testRemoveDuplicates import regular_train
+
+
+class TestSlidingFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.fsamp = 2048
+        self.nsamples = self.fsamp * 10
+        rng = np.random.default_rng(2)
+        self.spikes = [regular_train(rng, self.nsamples - 600, isi) + 100 for isi in (150, 230)]
+        self.emg = unit_emg(self.nsamples, self.spikes, nchans=16)
+        self.mask = np.zeros(16)
+        self.mask[5] = 1
+
+    def testCovarianceFromParts(self):
+        sliding = SlidingFilter(self.emg, self.mask, self.fsamp, nbextchan=300)
+        self.assertEqual(sliding.ext_factor, 20)
+
+        for start, middle, stop in [(1000, 3000, 5000), (3000, 5000, 7000), (0, 10, 3000), (100, 3000, 3010)]:
+            expected = ExtendedEMG(sliding.signal[:, start:stop], 20).covariance()
+            npt.assert_allclose(sliding.covariance(start, stop, middle), expected, atol=1e-12 * np.abs(expected).max())
+
+            # only the parts of the last window are kept, one of which the next window shares
+            self.assertEqual(sorted(sliding.segments), [(start, middle), (middle, stop)])
+
+        # the shared part of the second window came from the first
+        sliding.covariance(1000, 5000, 3000)
+        shared = sliding.segments[3000, 5000]
+        sliding.covariance(3000, 7000, 5000)
+        self.assertIs(sliding.segments[3000, 5000], shared)
+
+    def testUpdateMatchesExtendfilter(self):
+        sliding = SlidingFilter(self.emg, self.mask, self.fsamp)
+        pulse_train = np.zeros(self.nsamples)
+        start, stop = 2 * self.fsamp, 6 * self.fsamp
+
+        expected = extendfilter(
+            self.emg, self.mask, pulse_train.copy(), self.spikes[0], np.arange(start, stop), self.fsamp, "surface"
+        )
+        updated = sliding.update(pulse_train.copy(), self.spikes[0], start, stop, start + 2 * self.fsamp)
+
+        npt.assert_array_equal(updated[1], expected[1])
+        inner = slice(start + 300, stop - 300)
+        self.assertGreater(np.corrcoef(updated[0][inner], expected[0][inner])[0, 1], 0.999)
+        self.assertFalse(np.any(updated[0][: start + 205]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+"""
+Checks the stage cache: least recently used eviction under the size cap, and that a cached engine
+reuses the sphering and separation when only the thresholds change, still reporting its progress.
+"""
+
+import dataclasses
+import os
+import tempfile
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.EmgDecomposition import offline_EMG
+from core.utils.decomposition.decomposition_engine import DecompositionParameters, NumpyEngine
+from core.utils.decomposition.stage_cache import CachedEngine, StageCache
+from testDecompositionEngine import spike_train_emg
+
+
+class CountingEngine(NumpyEngine):
+    def __init__(self):
+        self.calls = []
+
+    def prepare(self, batch, params, out=None):
+        self.calls.append("prepare")
+        return super().prepare(batch, params, out=out)
+
+    def separate(self, sphered, params, callback=None):
+        self.calls.append("separate")
+        return super().separate(sphered, params, callback)
+
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.directory = tmpdir.name
+
+    def testEvictsLeastRecentlyUsed(self):
+        cache = StageCache(self.directory, max_bytes=20000)
+        for i, key in enumerate(["a", "b"]):
+            cache.put(key, dict(x=np.full(1000, i)))
+            os.utime(cache.path(key), (i, i))
+        self.assertIsNotNone(cache.get("a"))  # now more recent than b
+
+        cache.put("c", dict(x=np.zeros(1000)))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertLessEqual(cache.nbytes(), 20000)
+        self.assertIsNone(cache.get("b"))
+
+    def testThresholdChangeReusesSeparation(self):
+        engine = CountingEngine()
+        cached = CachedEngine(engine, StageCache(self.directory))
+        params = DecompositionParameters(
+            fsamp=2048, extended_channels=160, edges2remove=0.05, to_filter=False, its=4, cov_filter=0
+        )
+        batch = spike_train_emg(2048, 2048 * 4)
+
+        sphered = cached.prepare(batch, params)
+        result = cached.separate(sphered, params)
+        self.assertEqual(engine.calls, ["prepare", "separate"])
+
+        stricter = dataclasses.replace(params, sil_thr=0.99, cov_filter=1, cov_thr=0.1)
+        again = cached.prepare(batch, stricter, out=np.empty_like(sphered.whitened))
+        reused = cached.separate(again, stricter)
+        self.assertEqual(engine.calls, ["prepare", "separate"])
+        npt.assert_array_equal(again.whitened, sphered.whitened)
+        npt.assert_array_equal(reused.mu_filters, result.mu_filters)
+        npt.assert_array_equal(reused.accepted, (result.sils >= 0.99) & (result.covs <= 0.1))
+
+        # the separation depends on the number of iterations, the sphering does not
+        cached.separate(cached.prepare(batch, dataclasses.replace(params, its=3)), dataclasses.replace(params, its=3))
+        self.assertEqual(engine.calls, ["prepare", "separate", "separate"])
+
+    def testRandomInitialisationRestoresGenerator(self):
+        engine = CountingEngine()
+        cached = CachedEngine(engine, StageCache(self.directory))
+        params = DecompositionParameters(
+            fsamp=2048, extended_channels=80, edges2remove=0.05, to_filter=False, its=2, initialisation=1
+        )
+        sphered = cached.prepare(spike_train_emg(2048, 2048 * 2), params)
+
+        np.random.seed(7)
+        first = cached.separate(sphered, params)
+        after_first = np.random.rand()
+        np.random.seed(7)
+        second = cached.separate(sphered, params)
+
+        self.assertEqual(engine.calls.count("separate"), 1)
+        npt.assert_array_equal(second.mu_filters, first.mu_filters)
+        self.assertEqual(np.random.rand(), after_first)
+
+    def testCacheSizeInMegabytes(self):
+        for size in (512.5, "512.5"):
+            emg = offline_EMG(save_dir=".", to_filter=False)
+            emg.apply_parameters({"cachedir": self.directory, "cachesize": size})
+            self.assertEqual(emg.engine.cache.max_bytes, int(512.5 * 2**20))
+
+    def testHitReportsProgress(self):
+        engine = CountingEngine()
+        cached = CachedEngine(engine, StageCache(self.directory))
+        params = DecompositionParameters(
+            fsamp=2048, extended_channels=160, edges2remove=0.05, to_filter=False, its=4, cov_filter=0
+        )
+        sphered = cached.prepare(spike_train_emg(2048, 2048 * 4), params)
+
+        first, second = [], []
+        cached.separate(sphered, params, lambda i, source, spikes, sil, cov: first.append((i, sil, cov)))
+        cached.separate(sphered, params, lambda i, source, spikes, sil, cov: second.append((i, source, sil, cov)))
+
+        self.assertEqual(engine.calls.count("separate"), 1)
+        self.assertGreater(len(first), 0)
+        self.assertEqual([(i, sil, cov) for i, _, sil, cov in second], first)
+        self.assertTrue(all(source is None for _, source, _, _ in second))
+
+
+if __name__ == "__main__":
+    unittest.main()
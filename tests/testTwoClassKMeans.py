@@ -0,0 +1,70 @@
+"""
+Checks the exact 1-D two-class k-means against sklearn's KMeans on bimodal peak heights.
+"""
+
+import unittest
+import numpy as np
+import numpy.testing as npt
+from sklearn.cluster import KMeans
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.two_class_kmeans import two_class_kmeans, two_class_kmeans_groups
+
+
+def bimodal_values(nnoise, nspikes, seed=0):
+    rng = np.random.default_rng(seed)
+    values = np.concatenate([rng.normal(0.1, 0.05, nnoise) ** 2, rng.normal(1.0, 0.1, nspikes)])
+    return rng.permutation(values)
+
+
+class TestTwoClassKMeans(unittest.TestCase):
+
+    def testMatchesKMeans(self):
+        for seed, (nnoise, nspikes) in enumerate([(400, 60), (1000, 200), (50, 45), (30, 3)]):
+            values = bimodal_values(nnoise, nspikes, seed)
+            labels, centroids, inertia = two_class_kmeans(values)
+
+            kmeans = KMeans(n_clusters=2, n_init=10, random_state=0).fit(values.reshape(-1, 1))
+            high = np.argmax(kmeans.cluster_centers_)
+            npt.assert_array_equal(labels, kmeans.labels_ == high)
+            npt.assert_allclose(centroids, np.sort(kmeans.cluster_centers_.ravel()))
+            npt.assert_allclose(inertia.sum(), kmeans.inertia_)
+
+    def testInertiaPerCluster(self):
+        values = bimodal_values(200, 40)
+        labels, centroids, inertia = two_class_kmeans(values)
+        for cluster in (0, 1):
+            members = values[labels == cluster]
+            self.assertAlmostEqual(centroids[cluster], members.mean())
+            self.assertAlmostEqual(inertia[cluster], np.sum((members - members.mean()) ** 2))
+
+    def testDeterministic(self):
+        values = np.random.default_rng(3).uniform(size=500)
+        first = two_class_kmeans(values)
+        for result in (two_class_kmeans(values), two_class_kmeans(values.reshape(-1, 1))):
+            for a, b in zip(first, result):
+                npt.assert_array_equal(a, b)
+
+    def testFewValues(self):
+        labels, centroids, inertia = two_class_kmeans(np.array([2.0]))
+        npt.assert_array_equal(labels, [1])
+        npt.assert_array_equal(centroids, [2.0, 2.0])
+        npt.assert_array_equal(inertia, [0, 0])
+
+        labels, centroids, _ = two_class_kmeans(np.array([5.0, 1.0]))
+        npt.assert_array_equal(labels, [1, 0])
+        npt.assert_array_equal(centroids, [1.0, 5.0])
+
+    def testGroupsMatchSingleCalls(self):
+        groups = [bimodal_values(nnoise, nspikes, seed) for seed, (nnoise, nspikes) in enumerate([(400, 60), (30, 3)])]
+        groups += [np.array([2.0]), np.array([]), np.array([5.0, 1.0]), np.full(4, 3.0), bimodal_values(50, 45, 9)]
+        labels = two_class_kmeans_groups(groups)
+        self.assertEqual(len(labels), len(groups))
+        for values, group_labels in zip(groups, labels):
+            npt.assert_array_equal(group_labels, two_class_kmeans(values)[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Checks the workspace buffers reused between electrodes, the projection into them, and that the
+separation only copies the whitened observations when peel-off changes them.
+"""
+
+import pickle
+import unittest
+import numpy as np
+import numpy.testing as npt
+import sys
+import os
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../src")))
+from core.utils.decomposition.workspace import Workspace, peak_working_set, reset_peak_working_set
+from core.utils.decomposition.extend_emg import ExtendedEMG
+from core.utils.decomposition.decomposition_engine import DecompositionParameters, NumpyEngine
+from testDecompositionEngine import spike_train_emg
+
+
+class TestWorkspace(unittest.TestCase):
+
+    def testBuffersAreReused(self):
+        workspace = Workspace()
+        first = workspace.array("whitened_0", (100, 50))
+        second = workspace.array("whitened_0", (80, 60), np.float32)
+        self.assertTrue(np.shares_memory(first, second))
+        self.assertEqual(second.dtype, np.float32)
+        self.assertEqual(workspace.nbytes, first.nbytes)
+
+        larger = workspace.array("whitened_0", (200, 50))
+        self.assertFalse(np.shares_memory(first, larger))
+        self.assertEqual(workspace.nbytes, larger.nbytes)
+
+        other = workspace.array("whitened_1", (10, 10))
+        self.assertFalse(np.shares_memory(other, larger))
+
+    def testPicklesEmpty(self):
+        workspace = Workspace()
+        workspace.array("whitened_0", (1000, 100))
+        self.assertEqual(pickle.loads(pickle.dumps(workspace)).nbytes, 0)
+
+    def testProjectIntoBuffer(self):
+        rng = np.random.default_rng(0)
+        extended = ExtendedEMG(rng.normal(size=(4, 500)), 5)
+        for nfilters in (2, 20):
+            weights = rng.normal(size=(nfilters, 20))
+            out = np.full((nfilters, 480), np.nan)
+            result = extended.project(weights, 10, 490, out=out)
+            self.assertTrue(np.shares_memory(result, out))
+            npt.assert_allclose(out, extended.project(weights, 10, 490))
+
+    def testPrepareIntoWorkspace(self):
+        batch = spike_train_emg(2048, 2048 * 4)
+        params = DecompositionParameters(fsamp=2048, extended_channels=160, edges2remove=0.05, to_filter=False, its=3)
+        out = Workspace().array("whitened_0", params.whitened_shape(*batch.shape))
+
+        engine = NumpyEngine()
+        sphered = engine.prepare(batch, params, out=out)
+        self.assertTrue(np.shares_memory(sphered.whitened, out))
+        npt.assert_allclose(sphered.whitened, engine.prepare(batch, params).whitened)
+
+        # peel-off works on a copy, the whitened observations are kept for the post-processing
+        whitened = sphered.whitened.copy()
+        params.peel_off, params.sil_thr = 1, 0
+        engine.separate(sphered, params)
+        npt.assert_array_equal(sphered.whitened, whitened)
+
+    def testPeakWorkingSet(self):
+        reset_peak_working_set()
+        before = peak_working_set()
+        block = np.ones(64 * 2**20 // 8)  # above the largest mmap threshold of malloc, so never reused memory
+        self.assertGreaterEqual(peak_working_set(), before + block.nbytes // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()